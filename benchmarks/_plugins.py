@@ -0,0 +1,21 @@
+"""
+让基准脚本直接导入插件里的纯逻辑子模块（如 hequn.engine），而不执行插件的 __init__.py，
+从而不需要启动 NoneBot。用法：
+
+    import _plugins
+    engine = _plugins.load("hequn", "engine")
+"""
+import importlib
+import sys
+import types
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def load(package: str, module: str):
+    if package not in sys.modules:
+        stub = types.ModuleType(package)
+        stub.__path__ = [str(ROOT / package)]
+        sys.modules[package] = stub
+    return importlib.import_module(f"{package}.{module}")
@@ -0,0 +1,93 @@
+"""
+合群之落出图合并基准：不启动 NoneBot，直接驱动 ``RenderCoalescer``。若干群同时按给定间隔连续落子，
+每手都登记一次局面（部分附带三连文字），出图走真实的 Pillow 合成（线程池中执行），可用 --render-ms
+额外模拟较慢的出图（如 htmlrender 截图）。对比“每手出一张图、发一条消息”的做法，报告出图次数、
+发送次数、被丢弃的过时图，以及最后一手到对应棋盘发出的延迟。每局结束后立即开新局，
+校验终局棋盘作为结算单独发出，随后才是新局的消息。
+
+    python benchmarks/hequn_coalesce.py
+    python benchmarks/hequn_coalesce.py --groups 20 --interval-ms 0 5 20 --render-ms 100
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import _plugins
+
+engine = _plugins.load("hequn", "engine")
+game_mod = _plugins.load("hequn", "game")
+render = _plugins.load("hequn", "render")
+coalesce = _plugins.load("hequn", "coalesce")
+
+PLAYERS = ["10001", "10002"]
+
+
+async def play_group(group_id: int, interval: float, render_delay: float, sends: list):
+    loop = asyncio.get_running_loop()
+    lock = asyncio.Lock()
+    posted_at = [0.0]
+
+    async def render_view(view):
+        if render_delay:
+            await asyncio.sleep(render_delay)
+        return await loop.run_in_executor(None, render.render_board_png, view)
+
+    async def send(view, texts, image, final):
+        sends.append((group_id, time.perf_counter() - posted_at[0], final, view["board"].occupied_count))
+
+    coalescer = coalesce.RenderCoalescer(lock, render_view, send)
+    game = game_mod.new_game()
+    game["players"] = list(PLAYERS)
+    game["started"] = True
+    game["turn_count"] = 1
+    cells = list(range(engine.CELLS))
+    random.Random(group_id).shuffle(cells)
+    for cell in cells:
+        async with lock:
+            mask = game_mod.play_move(game, *divmod(cell, engine.SIZE))
+            posted_at[0] = time.perf_counter()
+            coalescer.post(game, "三连" if mask else None, final=game["board"].is_full())
+        await asyncio.sleep(interval)
+    async with lock:  # 结算可能还没发出时就开了新局
+        coalescer.post(game_mod.new_game(), "新对局")
+    await coalescer.wait()
+    return coalescer
+
+
+async def run(groups: int, interval: float, render_delay: float):
+    sends = []
+    start = time.perf_counter()
+    coalescers = await asyncio.gather(*(play_group(g, interval, render_delay, sends) for g in range(groups)))
+    elapsed = time.perf_counter() - start
+
+    for g in range(groups):
+        final, created = [s for s in sends if s[0] == g][-2:]
+        assert final[2] and final[3] == engine.CELLS, f"group {g}: the result is not sent with the final board"
+        assert not created[2] and created[3] == 0, f"group {g}: the new game message is missing"
+    moves = groups * engine.CELLS
+    renders = sum(c.renders for c in coalescers)
+    dropped = sum(c.dropped for c in coalescers)
+    latency = sorted(s[1] * 1000 for s in sends)
+    print(
+        f"interval={interval * 1000:5.1f}ms moves={moves} renders={renders} ({renders / moves:6.1%}) "
+        f"sends={len(sends)} ({len(sends) / moves:6.1%}) dropped={dropped}  "
+        f"latency p50={statistics.median(latency):7.1f}ms max={latency[-1]:7.1f}ms  total {elapsed:.2f}s"
+    )
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--groups", type=int, default=10)
+    ap.add_argument("--interval-ms", type=float, nargs="+", default=[0, 2, 10, 50], help="每群两手之间的间隔")
+    ap.add_argument("--render-ms", type=float, default=0, help="每次出图额外增加的延迟")
+    args = ap.parse_args()
+
+    print(f"baseline (one render and one message per move): {args.groups * engine.CELLS} of each")
+    for interval in args.interval_ms:
+        asyncio.run(run(args.groups, interval / 1000, args.render_ms / 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+合群之落引擎一致性检查：随机对局逐手同时走两套实现并比对——
+
+- 旧实现：位棋盘引擎之前插件里基于 10x10 ``{"occupied", "color"}`` 字典棋盘的
+  ``check_three_in_line`` / ``apply_color``（下方原样保留，只作对照）；
+- 新实现：``hequn.engine`` 的 ``Board`` 与同名函数。
+
+每手比对本手的染色区域、每格的棋子与染色归属、双方比分（旧实现按全盘扫描计数）与棋盘是否已满，
+任何一处不一致即报出种子与手数并以非零状态退出；最后给出两套实现的单手耗时。
+
+    python benchmarks/hequn_parity.py
+    python benchmarks/hequn_parity.py --games 2000 --seed 7
+"""
+import argparse
+import random
+import sys
+import time
+from typing import Dict, List, Set, Tuple
+
+import _plugins
+
+engine = _plugins.load("hequn", "engine")
+
+PLAYERS = ("10001", "10002")
+
+
+# ---------- 旧实现（原样保留） ----------
+def legacy_check_three_in_line(board: List[List[Dict]], player_id: str, last_move: Tuple[int, int]) -> Set[Tuple[int, int]]:
+    """
+    检测落子后形成的所有三连，并返回对应的九宫格染色区域。
+    修正逻辑：以形成三连的中间棋子为中心进行九宫格染色。
+    一次落子可能形成多个方向上的三连。
+
+    参数：
+        board: 棋盘二维数组
+        player_id: 当前玩家ID (实际是 user_id)
+        last_move: 最新落子坐标 (row, col)
+
+    返回：
+        需要染色的格子坐标集合 (九宫格中心集合)
+    """
+    r, c = last_move
+    affected_nine_grids_centers = set() # 存储三连的中心棋子坐标
+
+    # 定义8个方向 (dr, dc)
+    # (水平, 垂直, 主对角线, 副对角线)及其反方向
+    directions = [
+        (0, 1), (1, 0), (1, 1), (1, -1),
+        (0, -1), (-1, 0), (-1, -1), (-1, 1)
+    ]
+
+    # 为了避免重复检查同一条线，我们只检查从新落子点开始的特定组合
+    # 考虑新落子点 P 作为三连的:
+    # 1. P X X (P是起点)
+    # 2. X P X (P是中点)
+    # 3. X X P (P是终点)
+
+    for dr, dc in directions[:4]: # 只需检查4个基础方向，另4个会被覆盖
+        # 检查三种模式
+        # 模式 1: (P) O O (P是当前子，O是同色子)
+        # 中点是 P + 1*dir
+        p1 = (r, c)
+        p2 = (r + dr, c + dc)
+        p3 = (r + 2 * dr, c + 2 * dc)
+        if (0 <= p2[0] < 10 and 0 <= p2[1] < 10 and
+            0 <= p3[0] < 10 and 0 <= p3[1] < 10 and
+            board[p1[0]][p1[1]]["occupied"] == player_id and
+            board[p2[0]][p2[1]]["occupied"] == player_id and
+            board[p3[0]][p3[1]]["occupied"] == player_id):
+            affected_nine_grids_centers.add(p2) # 中心是p2
+
+        # 模式 2: O (P) O
+        # 中点是 P
+        p1 = (r - dr, c - dc)
+        p2 = (r, c) # 当前落子
+        p3 = (r + dr, c + dc)
+        if (0 <= p1[0] < 10 and 0 <= p1[1] < 10 and
+            0 <= p3[0] < 10 and 0 <= p3[1] < 10 and
+            board[p1[0]][p1[1]]["occupied"] == player_id and
+            board[p2[0]][p2[1]]["occupied"] == player_id and # 确保当前落子点是正确的（理论上总是）
+            board[p3[0]][p3[1]]["occupied"] == player_id):
+            affected_nine_grids_centers.add(p2) # 中心是p2 (即last_move)
+
+        # 模式 3: O O (P)
+        # 中点是 P - 1*dir
+        p1 = (r - 2 * dr, c - 2 * dc)
+        p2 = (r - dr, c - dc)
+        p3 = (r, c) # 当前落子
+        if (0 <= p1[0] < 10 and 0 <= p1[1] < 10 and
+            0 <= p2[0] < 10 and 0 <= p2[1] < 10 and
+            board[p1[0]][p1[1]]["occupied"] == player_id and
+            board[p2[0]][p2[1]]["occupied"] == player_id and
+            board[p3[0]][p3[1]]["occupied"] == player_id): # 确保当前落子点是正确的
+            affected_nine_grids_centers.add(p2) # 中心是p2
+
+    # 根据中心点集合，生成所有需要染色的九宫格区域
+    cells_to_color = set()
+    for center_r, center_c in affected_nine_grids_centers:
+        for dr_nine in [-1, 0, 1]:
+            for dc_nine in [-1, 0, 1]:
+                nr, nc = center_r + dr_nine, center_c + dc_nine
+                if 0 <= nr < 10 and 0 <= nc < 10:
+                    cells_to_color.add((nr, nc))
+    
+    return cells_to_color
+
+
+def legacy_apply_color(board: List[List[Dict]], player_id: str, positions: Set[Tuple[int, int]]):
+    """应用颜色"""
+    for r, c in positions:
+        board[r][c]["color"] = player_id # player_id is user_id
+
+
+def legacy_board() -> List[List[Dict]]:
+    return [[{"occupied": None, "color": None} for _ in range(10)] for _ in range(10)]
+
+
+def legacy_score(board: List[List[Dict]], player_id: str) -> int:
+    return sum(1 for row in board for cell in row if cell["color"] == player_id)
+
+
+# ---------- 比对 ----------
+def check_game(seed: int) -> Tuple[float, float]:
+    """一局随机对局逐手比对，返回 (旧实现耗时, 新实现耗时) 秒"""
+    cells = random.Random(seed).sample(range(engine.CELLS), engine.CELLS)
+    old, new = legacy_board(), engine.Board()
+    old_time = new_time = 0.0
+    for move, cell in enumerate(cells):
+        player_id = PLAYERS[move % 2]
+        row, col = divmod(cell, engine.SIZE)
+
+        start = time.perf_counter()
+        old[row][col]["occupied"] = player_id
+        old_positions = legacy_check_three_in_line(old, player_id, (row, col))
+        if old_positions:
+            legacy_apply_color(old, player_id, old_positions)
+        old_full = sum(1 for r in old for c in r if c["occupied"]) == 100
+        old_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        new.place(player_id, row, col)
+        new_positions = engine.check_three_in_line(new, player_id, (row, col))
+        if new_positions:
+            engine.apply_color(new, player_id, new_positions)
+        new_full = new.is_full()
+        new_time += time.perf_counter() - start
+
+        where = f"seed {seed} move {move + 1} ({engine.coord_name(row, col)})"
+        assert old_positions == new_positions, f"{where}: coloured area differs"
+        assert old_full == new_full, f"{where}: board-full check differs"
+        for r in range(engine.SIZE):
+            for c in range(engine.SIZE):
+                assert old[r][c]["occupied"] == new.owner(r, c), f"{where}: stone at {engine.coord_name(r, c)} differs"
+                assert old[r][c]["color"] == new.color(r, c), f"{where}: colour at {engine.coord_name(r, c)} differs"
+        for player in PLAYERS:
+            assert legacy_score(old, player) == new.score(player), f"{where}: score of {player} differs"
+    return old_time, new_time
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--games", type=int, default=500)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    old_time = new_time = 0.0
+    for seed in range(args.seed, args.seed + args.games):
+        try:
+            old, new = check_game(seed)
+        except AssertionError as e:
+            print(f"FAIL: {e}")
+            sys.exit(1)
+        old_time += old
+        new_time += new
+    moves = args.games * engine.CELLS
+    print(f"parity ok: {args.games} games, {moves} moves, every move identical")
+    print(
+        f"per move (place + detect + colour + full check): dict board {old_time / moves * 1e6:.2f}us, "
+        f"bitboard {new_time / moves * 1e6:.2f}us"
+    )
+
+
+if __name__ == "__main__":
+    main()
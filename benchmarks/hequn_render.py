@@ -0,0 +1,128 @@
+"""
+合群之落出图延迟基准：按随机对局逐手出图，比较 Pillow 全量合成、Pillow 增量重绘
+（只画变化的格子）、文字棋盘、Chromium 每手新开页面截图、Chromium 预热页面只更新 DOM 后截图。
+
+    python benchmarks/hequn_render.py                # 只测 Pillow 合成
+    python benchmarks/hequn_render.py --html         # 同时测 htmlrender 路径（需要 playwright + chromium）
+    python benchmarks/hequn_render.py --games 5 --seed 1
+    python benchmarks/hequn_render.py --size 19       # 19x19 棋盘
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import _plugins
+
+engine = _plugins.load("hequn", "engine")
+render = _plugins.load("hequn", "render")
+
+PLAYERS = ["10001", "10002"]
+
+
+def random_game(seed: int, geometry):
+    """生成一局随机对局，每手之后产出当时的棋局状态"""
+    rng = random.Random(seed)
+    cells = list(range(geometry.cells))
+    rng.shuffle(cells)
+    game = {
+        "board": engine.Board(geometry),
+        "players": list(PLAYERS),
+        "current_player_idx": 0,
+        "started": True,
+        "game_over": False,
+        "turn_count": 1,
+    }
+    for idx in cells:
+        player_id = PLAYERS[game["current_player_idx"]]
+        row, col = divmod(idx, geometry.size)
+        game["board"].place(player_id, row, col)
+        mask = engine.three_in_line_mask(game["board"], player_id, (row, col))
+        if mask:
+            game["board"].paint(player_id, mask)
+        game["current_player_idx"] = 1 - game["current_player_idx"]
+        if game["current_player_idx"] == 0:
+            game["turn_count"] += 1
+        yield game
+
+
+def summarize(name: str, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(
+        f"{name:<8} moves={len(samples):<5} mean={statistics.mean(samples):8.2f}ms "
+        f"p50={statistics.median(samples):8.2f}ms p95={p95:8.2f}ms max={samples[-1]:8.2f}ms"
+    )
+
+
+def bench_raster(games: int, seed: int, geometry, incremental: bool):
+    render.render_board_png(next(random_game(seed, geometry)))  # 预热贴图缓存
+    samples = []
+    for g in range(games):
+        for game in random_game(seed + g, geometry):
+            if not incremental:
+                game.pop("canvas", None)
+            start = time.perf_counter()
+            render.render_board_png(game)
+            samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def bench_text(games: int, seed: int, geometry):
+    samples = []
+    for g in range(games):
+        for game in random_game(seed + g, geometry):
+            start = time.perf_counter()
+            render.render_board_text(game)
+            samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+async def bench_html(games: int, seed: int, geometry):
+    from playwright.async_api import async_playwright
+
+    viewport = {"width": 600, "height": 750}
+    fresh, pooled = [], []
+    async with async_playwright() as p:
+        browser = await p.chromium.launch()
+        warm_page = await browser.new_page(viewport=viewport, device_scale_factor=2)
+        await warm_page.set_content(render.board_template_html(geometry))
+        for g in range(games):
+            for game in random_game(seed + g, geometry):
+                # 与 get_new_page 一致：每手新开页面、设置内容、截图、关闭
+                start = time.perf_counter()
+                page = await browser.new_page(viewport=viewport, device_scale_factor=2)
+                await page.set_content(render.build_board_html(game))
+                await page.screenshot(type="png", full_page=False)
+                await page.close()
+                fresh.append((time.perf_counter() - start) * 1000)
+                # 与 render_pool 一致：预热页面上只更新 DOM 再截图
+                start = time.perf_counter()
+                await warm_page.evaluate(render.BOARD_UPDATE_JS, render.board_dom_state(game))
+                await warm_page.screenshot(type="png", full_page=False)
+                pooled.append((time.perf_counter() - start) * 1000)
+        await browser.close()
+    return fresh, pooled
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--html", action="store_true", help="同时测量 Chromium 截图路径")
+    parser.add_argument("--size", type=int, default=10, help="棋盘边长")
+    args = parser.parse_args()
+
+    geometry = engine.get_geometry(args.size)
+    summarize("full", bench_raster(args.games, args.seed, geometry, incremental=False))
+    summarize("dirty", bench_raster(args.games, args.seed, geometry, incremental=True))
+    summarize("text", bench_text(args.games, args.seed, geometry))
+    if args.html:
+        fresh, pooled = asyncio.run(bench_html(args.games, args.seed, geometry))
+        summarize("html", fresh)
+        summarize("pool", pooled)
+
+
+if __name__ == "__main__":
+    main()
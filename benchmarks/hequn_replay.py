@@ -0,0 +1,148 @@
+"""
+合群之落棋谱重放与染色规则回归：
+
+- 随机生成若干局，导出棋谱 -> 解析 -> 无头重放，核对比分与棋盘；
+- 每局逐手悔棋到空棋盘，每一步都与“从头重放前缀”的结果比对，验证悔棋只撤销了该手的变化；
+- 用逐格扫描的朴素实现（原插件的染色写法，推广到任意边长/几连/半径）交叉验证位棋盘引擎的连子染色；
+- 默认依次检查 10x10 三连、15x15 三连/四连、19x19 三连/五连，也可用 --size / --line-length 指定一种；
+- 给出棋谱文件时，逐个重放并核对文件中记录的比分。
+
+    python benchmarks/hequn_replay.py
+    python benchmarks/hequn_replay.py --games 2000 --seed 3 --size 19 --line-length 5
+    python benchmarks/hequn_replay.py record1.txt record2.txt
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+import _plugins
+
+engine = _plugins.load("hequn", "engine")
+game_mod = _plugins.load("hequn", "game")
+
+PLAYERS = ["10001", "10002"]
+GEOMETRIES = ((10, 3), (15, 3), (15, 4), (19, 3), (19, 5))
+
+
+def random_cells(seed: int, geometry) -> list:
+    cells = list(range(geometry.cells))
+    random.Random(seed).shuffle(cells)
+    return cells[:random.Random(seed + 1).randint(1, geometry.cells)]
+
+
+def board_state(game: dict):
+    board = game["board"]
+    return (
+        {p: board.stones.get(p, 0) for p in game["players"]},
+        {p: board.colors.get(p, 0) for p in game["players"]},
+        {p: board.score(p) for p in game["players"]},
+        board.occupied_count,
+        game["current_player_idx"],
+        game["turn_count"],
+    )
+
+
+def reference_scores(players, cells, geometry):
+    """朴素实现：字典棋盘，逐方向扫描连子，以连子内部（去掉两端）每个棋子为中心染方形区域"""
+    size, length, radius = geometry.size, geometry.line_length, geometry.radius
+    stones, colors = {}, {}
+    for i, cell in enumerate(cells):
+        player = players[i % 2]
+        r, c = divmod(cell, size)
+        stones[(r, c)] = player
+        for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+            for offset in range(-(length - 1), 1):
+                line = [(r + (offset + k) * dr, c + (offset + k) * dc) for k in range(length)]
+                if all(stones.get(pos) == player for pos in line):
+                    for cr, cc in line[1:-1]:
+                        for nr in range(cr - radius, cr + radius + 1):
+                            for nc in range(cc - radius, cc + radius + 1):
+                                if 0 <= nr < size and 0 <= nc < size:
+                                    colors[(nr, nc)] = player
+    return {p: sum(1 for owner in colors.values() if owner == p) for p in players}
+
+
+def check_game(seed: int, geometry, undo: bool):
+    cells = random_cells(seed, geometry)
+    game = game_mod.replay(PLAYERS, cells, geometry)
+
+    # 棋谱往返
+    players, parsed, score, parsed_geometry = game_mod.parse_record(game_mod.export_record(game))
+    assert players == PLAYERS and list(parsed) == cells, f"seed {seed}: record round trip changed the moves"
+    assert parsed_geometry is geometry, f"seed {seed}: record lost the board geometry"
+    replayed = game_mod.replay(players, parsed, parsed_geometry)
+    assert board_state(replayed) == board_state(game), f"seed {seed}: replay diverged"
+    assert score == (game["board"].score(PLAYERS[0]), game["board"].score(PLAYERS[1]))
+
+    # 染色规则对照
+    expected = reference_scores(PLAYERS, cells, geometry)
+    assert expected == {p: game["board"].score(p) for p in PLAYERS}, f"seed {seed}: scores differ from reference"
+
+    # 逐手悔棋
+    if undo:
+        for n in range(len(cells) - 1, -1, -1):
+            game_mod.undo_move(game)
+            prefix = game_mod.replay(PLAYERS, cells[:n], geometry)
+            assert board_state(game) == board_state(prefix), f"seed {seed}: undo to move {n} diverged"
+        assert game["board"].occupied == 0 and not game["history"]
+    return len(cells)
+
+
+def replay_files(paths):
+    failed = 0
+    for path in paths:
+        players, cells, score, geometry = game_mod.parse_record(Path(path).read_text(encoding="utf-8"))
+        game = game_mod.replay(players, cells, geometry)
+        got = (game["board"].score(players[0]), game["board"].score(players[1]))
+        status = "ok" if score is None or got == score else f"MISMATCH (recorded {score})"
+        failed += status != "ok"
+        print(f"{path}: {geometry.label}, {len(cells)} moves, 黑 {got[0]} : 白 {got[1]}  {status}")
+    return failed
+
+
+def check_geometry(geometry, games: int, seed: int, undo_games: int):
+    moves = 0
+    for g in range(games):
+        moves += check_game(seed + g, geometry, undo=g < undo_games)
+
+    # 重放速度（按每手计，规格变大时应基本不变）
+    records = [random_cells(seed + g, geometry) for g in range(games)]
+    start = time.perf_counter()
+    for cells in records:
+        game_mod.replay(PLAYERS, cells, geometry)
+    elapsed = time.perf_counter() - start
+
+    game = game_mod.replay(PLAYERS, records[0], geometry)
+    undo_start = time.perf_counter()
+    while game["history"]:
+        game_mod.undo_move(game)
+    per_undo = (time.perf_counter() - undo_start) / max(1, len(records[0])) * 1e6
+    print(
+        f"{geometry.label:<12} {games} games ({moves} moves) ok  "
+        f"replay {moves / elapsed:9.0f} moves/s  undo {per_undo:6.2f}us per move"
+    )
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("records", nargs="*", help="export_record 导出的棋谱文件")
+    ap.add_argument("--games", type=int, default=500)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--undo-games", type=int, default=100, help="其中做逐手悔棋校验的局数")
+    ap.add_argument("--size", type=int, help="只检查这一种边长")
+    ap.add_argument("--line-length", type=int, default=3, help="与 --size 一起使用")
+    args = ap.parse_args()
+
+    if args.records:
+        sys.exit(1 if replay_files(args.records) else 0)
+
+    variants = [(args.size, args.line_length)] if args.size else GEOMETRIES
+    for size, line_length in variants:
+        check_geometry(engine.get_geometry(size, line_length), args.games, args.seed, args.undo_games)
+    print("records, replay, reference scores, undo ok")
+
+
+if __name__ == "__main__":
+    main()
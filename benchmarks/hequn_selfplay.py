@@ -0,0 +1,230 @@
+"""
+合群之落无头自对弈基准：不启动 NoneBot，直接导入引擎里的纯函数 ``coord_to_index``、
+``check_three_in_line``、``apply_color``，在多进程池中跑大量随机自对弈（每手都走一遍
+“解析坐标 -> 落子 -> 检测三连 -> 染色”），报告：
+
+- 总吞吐（moves/s，按整个进程池的墙钟时间计算）；
+- 每个函数的延迟分位数（按 --sample-every 抽样计时，避免计时本身拖慢整体）；
+- 终局染色格数的分布（双方合计、黑白差值）与胜负比例。
+
+结果写成 JSON，给出 --baseline 时与上一次的结果逐项对比，吞吐下降超过 --max-regression 时以非零状态退出。
+
+    python benchmarks/hequn_selfplay.py                          # 100 万手，进程数 = CPU 数，写入 benchmarks/results/
+    python benchmarks/hequn_selfplay.py --moves 5000000 --workers 8 --json after.json --baseline before.json
+    python benchmarks/hequn_selfplay.py --size 19 --line-length 5   # 其他棋盘规格，单手开销应基本不变
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+import _plugins
+
+engine = _plugins.load("hequn", "engine")
+
+PLAYERS = ("10001", "10002")
+FUNCTIONS = ("coord_to_index", "check_three_in_line", "apply_color")
+PERCENTILES = (0.5, 0.9, 0.99, 0.999)
+GAMES_PER_TASK = 200
+RESULTS_DIR = Path(__file__).resolve().parent / "results"  # 已在 .gitignore 中忽略
+
+
+def play_games(task):
+    """子进程：从 seed 开始跑 games 局随机自对弈，返回抽样延迟（ns）与每局终局比分"""
+    seed, games, sample_every, geometry = task
+    rng = random.Random(seed)
+    names = [engine.coord_name(*divmod(cell, geometry.size)) for cell in range(geometry.cells)]
+    order = list(range(geometry.cells))
+    latency = {name: [] for name in FUNCTIONS}
+    scores = []
+    clock = time.perf_counter_ns
+    move = 0
+    for _ in range(games):
+        board = engine.Board(geometry)
+        rng.shuffle(order)
+        for i, cell in enumerate(order):
+            player_id = PLAYERS[i & 1]
+            coord = names[cell]
+            move += 1
+            if move % sample_every:
+                pos = engine.coord_to_index(coord, geometry)
+                board.place(player_id, *pos)
+                positions = engine.check_three_in_line(board, player_id, pos)
+                if positions:
+                    engine.apply_color(board, player_id, positions)
+                continue
+
+            t0 = clock()
+            pos = engine.coord_to_index(coord, geometry)
+            t1 = clock()
+            board.place(player_id, *pos)
+            t2 = clock()
+            positions = engine.check_three_in_line(board, player_id, pos)
+            t3 = clock()
+            latency["coord_to_index"].append(t1 - t0)
+            latency["check_three_in_line"].append(t3 - t2)
+            if positions:
+                engine.apply_color(board, player_id, positions)
+                latency["apply_color"].append(clock() - t3)
+        scores.append((board.score(PLAYERS[0]), board.score(PLAYERS[1])))
+    return latency, scores
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {}
+    result = {f"p{q * 100:g}": samples[min(len(samples) - 1, int(len(samples) * q))] for q in PERCENTILES}
+    result["mean"] = round(statistics.mean(samples), 1)
+    result["max"] = samples[-1]
+    result["samples"] = len(samples)
+    return result
+
+
+def distribution(values):
+    values = sorted(values)
+    return {
+        "mean": round(statistics.mean(values), 2),
+        "stdev": round(statistics.pstdev(values), 2),
+        "min": values[0],
+        "p10": values[len(values) // 10],
+        "p50": values[len(values) // 2],
+        "p90": values[len(values) * 9 // 10],
+        "max": values[-1],
+        "histogram": dict(sorted(Counter(values).items())),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=_plugins.ROOT,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(moves: int, workers: int, seed: int, sample_every: int, geometry) -> dict:
+    games = max(1, moves // geometry.cells)
+    tasks = [
+        (seed + start, min(GAMES_PER_TASK, games - start), sample_every, geometry)
+        for start in range(0, games, GAMES_PER_TASK)
+    ]
+    latency = {name: [] for name in FUNCTIONS}
+    scores = []
+    start = time.perf_counter()
+    with multiprocessing.Pool(workers) as pool:
+        for task_latency, task_scores in pool.imap_unordered(play_games, tasks):
+            for name, samples in task_latency.items():
+                latency[name].extend(samples)
+            scores.extend(task_scores)
+    elapsed = time.perf_counter() - start
+
+    played = len(scores) * geometry.cells
+    black_wins = sum(1 for black, white in scores if black > white)
+    white_wins = sum(1 for black, white in scores if white > black)
+    return {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "moves": moves, "workers": workers, "seed": seed, "sample_every": sample_every,
+            "size": geometry.size, "line_length": geometry.line_length, "radius": geometry.radius,
+        },
+        "throughput": {
+            "games": len(scores),
+            "moves": played,
+            "seconds": round(elapsed, 3),
+            "moves_per_sec": round(played / elapsed),
+            "moves_per_sec_per_worker": round(played / elapsed / workers),
+        },
+        "latency_ns": {name: percentiles(samples) for name, samples in latency.items()},
+        "colored_cells": {
+            "total": distribution([black + white for black, white in scores]),
+            "black_minus_white": distribution([black - white for black, white in scores]),
+            "black_win_rate": round(black_wins / len(scores), 4),
+            "white_win_rate": round(white_wins / len(scores), 4),
+            "draw_rate": round((len(scores) - black_wins - white_wins) / len(scores), 4),
+        },
+    }
+
+
+def report(result: dict):
+    t, c = result["throughput"], result["config"]
+    print(
+        f"selfplay {c['size']}x{c['size']} {c['line_length']} in a row  games={t['games']} moves={t['moves']} workers={result['config']['workers']} "
+        f"{t['seconds']:.2f}s  {t['moves_per_sec']:,} moves/s ({t['moves_per_sec_per_worker']:,}/worker)"
+    )
+    for name, p in result["latency_ns"].items():
+        if p:
+            print(
+                f"  {name:<20} p50={p['p50']:6d}ns p90={p['p90']:6d}ns p99={p['p99']:6d}ns "
+                f"p99.9={p['p99.9']:7d}ns max={p['max']:8d}ns (n={p['samples']})"
+            )
+    colored = result["colored_cells"]
+    total, diff = colored["total"], colored["black_minus_white"]
+    print(
+        f"  colored cells: mean={total['mean']} p10={total['p10']} p50={total['p50']} p90={total['p90']}  "
+        f"black-white mean={diff['mean']} stdev={diff['stdev']}  "
+        f"black {colored['black_win_rate']:.1%} / white {colored['white_win_rate']:.1%} / "
+        f"draw {colored['draw_rate']:.1%}"
+    )
+
+
+def compare(result: dict, baseline: dict, max_regression: float) -> bool:
+    """打印与基线的对比；吞吐下降超过 max_regression 时返回 False"""
+    print(f"compared with {baseline.get('revision') or 'baseline'} ({baseline.get('timestamp')}):")
+    old, new = baseline["throughput"]["moves_per_sec"], result["throughput"]["moves_per_sec"]
+    change = new / old - 1
+    print(f"  moves/s              {old:>12,} -> {new:>12,}  {change:+.1%}")
+    for name in FUNCTIONS:
+        before, after = baseline["latency_ns"].get(name), result["latency_ns"].get(name)
+        if before and after:
+            print(
+                f"  {name:<20} p50 {before['p50']:>6} -> {after['p50']:>6}ns  "
+                f"p99 {before['p99']:>6} -> {after['p99']:>6}ns"
+            )
+    if change < -max_regression:
+        print(f"FAIL: throughput dropped {-change:.1%} (allowed {max_regression:.0%})")
+        return False
+    return True
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--moves", type=int, default=1_000_000, help="总手数（按整局取整）")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--sample-every", type=int, default=16, help="每隔多少手计时一次")
+    ap.add_argument("--size", type=int, default=10, help="棋盘边长")
+    ap.add_argument("--line-length", type=int, default=3, help="几连")
+    ap.add_argument("--json", type=Path, default=RESULTS_DIR / "hequn_selfplay.json", help="结果输出路径")
+    ap.add_argument("--baseline", type=Path, help="之前保存的结果 JSON，用于对比")
+    ap.add_argument("--max-regression", type=float, default=0.10, help="允许的吞吐下降比例")
+    args = ap.parse_args()
+
+    geometry = engine.get_geometry(args.size, args.line_length)
+    result = run(args.moves, max(1, args.workers), args.seed, max(1, args.sample_every), geometry)
+    report(result)
+    args.json.parent.mkdir(parents=True, exist_ok=True)
+    args.json.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"saved {args.json}")
+
+    if args.baseline is not None:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        if not compare(result, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+合群之落存档开销基准：许多群同时对局，测量每手落子在事件循环上的持久化开销（编码 + 入队）、
+后台批量写库的耗时，以及从快照 + 日志恢复一局的耗时；并与“每手同步写库并提交”的做法对比。
+事件循环上的单手开销（p99）超过预算时以非零状态退出。
+
+战绩部分写入 --results 局结果（分布在 --rank-groups 个群、每群 --players 名玩家），核对增量维护的
+Elo / 胜负 / 交手记录与从 results 全量重算的结果一致，并测量排行与个人战绩查询的延迟。
+最后校验写库失败时：这一批不丢、顺序不乱，后台刷新退避后继续工作；关闭时取消正在写库的刷新，
+这一批只写入一次。
+
+    python benchmarks/hequn_store.py
+    python benchmarks/hequn_store.py --groups 200 --budget-us 50 --compact-every 32
+    python benchmarks/hequn_store.py --results 500000 --rank-groups 5
+"""
+import argparse
+import asyncio
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import _plugins
+
+engine = _plugins.load("hequn", "engine")
+game_mod = _plugins.load("hequn", "game")
+store_mod = _plugins.load("hequn", "store")
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+def new_started_game(group_id: int) -> dict:
+    game = game_mod.new_game()
+    game["players"] = [f"{group_id}01", f"{group_id}02"]
+    game["started"] = True
+    game["turn_count"] = 1
+    return game
+
+
+async def bench_store(groups: int, compact_every: int, flush_interval: float, directory: Path):
+    store = store_mod.GameStore(directory / "games.db", flush_interval=flush_interval, compact_every=compact_every)
+    store.start()
+    games, orders = {}, {}
+    for group_id in range(groups):
+        games[group_id] = new_started_game(group_id)
+        store.save(group_id, games[group_id])
+        orders[group_id] = random.Random(group_id).sample(range(engine.CELLS), engine.CELLS - 1)
+
+    samples = []
+    for step in range(engine.CELLS - 1):
+        for group_id, game in games.items():
+            row, col = divmod(orders[group_id][step], engine.SIZE)
+            player_idx = game["current_player_idx"]
+            game_mod.play_move(game, row, col)
+            start = time.perf_counter()
+            store.record_move(group_id, game, player_idx, row, col)
+            samples.append((time.perf_counter() - start) * 1e6)
+        await asyncio.sleep(0.005)  # 模拟消息间隔，让后台刷新按周期运行
+    await store.close()
+
+    reader = store_mod.GameStore(directory / "games.db")
+    restore = []
+    for group_id in range(min(groups, 50)):
+        start = time.perf_counter()
+        game = await reader.load(group_id)
+        restore.append((time.perf_counter() - start) * 1000)
+        assert game["board"].stones == games[group_id]["board"].stones
+    await reader.close()
+    return samples, store.stats(), restore
+
+
+def finished_games():
+    """黑胜、白胜、平局各一局终局，record_result 按它们的比分记录"""
+    games = {}
+    seed = 0
+    while len(games) < 3:
+        cells = random.Random(seed).sample(range(engine.CELLS), engine.CELLS)
+        game = game_mod.replay(["b", "w"], cells)
+        black, white = game["board"].score("b"), game["board"].score("w")
+        games.setdefault((black > white) - (black < white), game)
+        seed += 1
+    return games
+
+
+def recompute(conn: sqlite3.Connection, group_id: int, k: float, initial: float):
+    """从 results 按顺序全量重算一个群的 Elo 与胜负（对照用）"""
+    ratings, records, pairs = {}, {}, {}
+    rows = conn.execute(
+        "SELECT black, white, black_score, white_score FROM results WHERE group_id = ? ORDER BY id", (group_id,)
+    )
+    for black, white, black_score, white_score in rows:
+        outcome = (black_score > white_score) - (black_score < white_score)
+        delta = store_mod.elo_update(ratings.get(black, initial), ratings.get(white, initial), (outcome + 1) / 2, k)
+        ratings[black] = ratings.get(black, initial) + delta
+        ratings[white] = ratings.get(white, initial) - delta
+        for player_id, result in ((black, outcome), (white, -outcome)):
+            wins, losses, draws = records.get(player_id, (0, 0, 0))
+            records[player_id] = (wins + (result > 0), losses + (result < 0), draws + (result == 0))
+        a, b = sorted((black, white))
+        a_result = outcome if a == black else -outcome
+        a_wins, b_wins, draws = pairs.get((a, b), (0, 0, 0))
+        pairs[(a, b)] = (a_wins + (a_result > 0), b_wins + (a_result < 0), draws + (a_result == 0))
+    return ratings, records, pairs
+
+
+async def bench_results(results: int, groups: int, players: int, flush_interval: float, directory: Path):
+    store = store_mod.GameStore(directory / "stats.db", flush_interval=flush_interval)
+    store.start()
+    games = finished_games()
+    rng = random.Random(0)
+    enqueue = []
+    for i in range(results):
+        group_id = i % groups
+        black, white = rng.sample(range(players), 2)
+        game = games[rng.choice((1, 1, 0, -1, -1))]
+        start = time.perf_counter()
+        store.record_result(group_id, game, [f"p{black}", f"p{white}"])
+        enqueue.append((time.perf_counter() - start) * 1e6)
+        if i % 1000 == 999:
+            await asyncio.sleep(0)  # 让后台刷新按周期运行
+    await store.flush()
+    stats = store.stats()
+
+    queries = {"leaderboard": [], "player+versus": []}
+    for i in range(200):
+        group_id = i % groups
+        start = time.perf_counter()
+        board = await store.leaderboard(group_id)
+        queries["leaderboard"].append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        record = await store.player_record(group_id, board[-1]["player_id"], board[0]["player_id"])
+        queries["player+versus"].append((time.perf_counter() - start) * 1000)
+        assert record["rank"] == len(board) and "versus" in record
+
+    # 增量聚合必须与全量重算一致
+    conn = sqlite3.connect(directory / "stats.db")
+    for group_id in range(min(groups, 3)):
+        ratings, records, pairs = recompute(conn, group_id, store.elo_k, store.elo_initial)
+        for player_id, rating, wins, losses, draws in conn.execute(
+            "SELECT player_id, rating, wins, losses, draws FROM ratings WHERE group_id = ?", (group_id,)
+        ):
+            assert abs(rating - ratings[player_id]) < 1e-6, (player_id, rating, ratings[player_id])
+            assert (wins, losses, draws) == records[player_id]
+        stored = {
+            (a, b): (a_wins, b_wins, draws) for a, b, a_wins, b_wins, draws in conn.execute(
+                "SELECT player_a, player_b, a_wins, b_wins, draws FROM head_to_head WHERE group_id = ?", (group_id,)
+            )
+        }
+        assert stored == pairs
+    conn.close()
+    await store.close()
+    return enqueue, stats, queries
+
+
+async def check_write_failure(directory: Path):
+    """数据库被另一个连接独占时写入失败：操作留在队列里，锁释放后由后台刷新按原顺序写入"""
+    path = directory / "locked.db"
+    store = store_mod.GameStore(path, flush_interval=0.01)
+    store.max_retry_interval = 0.05
+    store_mod.logger.disable(store_mod.__name__)  # 预期中的写库失败，不打印堆栈
+    game = new_started_game(1)
+    store.save(1, game)
+    await store.flush()
+    store._connect().execute("PRAGMA busy_timeout = 0")  # 不等锁，立即失败
+
+    blocker = sqlite3.connect(path, isolation_level=None)
+    blocker.execute("BEGIN EXCLUSIVE")
+    store.start()
+    for cell in range(10):
+        player_idx = game["current_player_idx"]
+        game_mod.play_move(game, *divmod(cell, engine.SIZE))
+        store.record_move(1, game, player_idx, *divmod(cell, engine.SIZE))
+    store.delete(2)
+    await asyncio.sleep(0.2)
+    assert store.failed_flushes > 0 and store.stats()["pending"] == 11, store.stats()
+    blocker.rollback()
+    blocker.close()
+    await asyncio.sleep(0.2)
+    assert store.stats()["pending"] == 0, "flush loop did not recover"
+    failed = store.failed_flushes
+    await store.close()
+
+    reader = store_mod.GameStore(path)
+    restored = await reader.load(1)
+    await reader.close()
+    assert restored["board"].stones == game["board"].stones and restored["seq"] == game["seq"]
+    return failed
+
+
+async def check_cancelled_flush(directory: Path):
+    """close() 取消正在等写库线程的后台刷新：线程照常提交，这一批不能被放回队列再写一次"""
+    path = directory / "cancel.db"
+    store = store_mod.GameStore(path, flush_interval=0.01)
+    store.save(1, new_started_game(1))
+    await store.flush()  # 建表
+    blocker = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    blocker.execute("BEGIN EXCLUSIVE")  # 写库线程在 busy_timeout 内等锁
+    store.start()
+    store.record_result(1, finished_games()[1], ["p1", "p2"])
+    await asyncio.sleep(0.1)
+    threading.Timer(0.2, blocker.rollback).start()
+    await store.close()  # 取消时这一批还卡在写库线程里
+    blocker.close()
+    conn = sqlite3.connect(path)
+    (rows,) = conn.execute("SELECT COUNT(*) FROM results").fetchone()
+    (games,) = conn.execute("SELECT games FROM ratings WHERE player_id = 'p1'").fetchone()
+    conn.close()
+    assert rows == 1 and games == 1, f"result written {rows} times, rated {games} times"
+
+
+def bench_sync(groups: int, directory: Path):
+    """对照：每手在事件循环里直接 INSERT + COMMIT"""
+    conn = sqlite3.connect(directory / "sync.db")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE moves (group_id INTEGER, seq INTEGER, data BLOB, PRIMARY KEY (group_id, seq))")
+    samples = []
+    for seq in range(20):
+        for group_id in range(groups):
+            start = time.perf_counter()
+            conn.execute("INSERT INTO moves VALUES (?, ?, ?)", (group_id, seq, b"\x00\x00\x00"))
+            conn.commit()
+            samples.append((time.perf_counter() - start) * 1e6)
+    conn.close()
+    return samples
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--groups", type=int, default=100)
+    ap.add_argument("--compact-every", type=int, default=32)
+    ap.add_argument("--flush-interval", type=float, default=0.05)
+    ap.add_argument("--budget-us", type=float, default=50.0, help="单手在事件循环上的持久化开销预算（p99）")
+    ap.add_argument("--results", type=int, default=200_000, help="战绩部分写入的对局结果数")
+    ap.add_argument("--rank-groups", type=int, default=10)
+    ap.add_argument("--players", type=int, default=200, help="每群玩家数")
+    args = ap.parse_args()
+
+    directory = Path(tempfile.mkdtemp())
+    samples, stats, restore = asyncio.run(
+        bench_store(args.groups, args.compact_every, args.flush_interval, directory)
+    )
+    p99 = percentile(samples, 0.99)
+    print(
+        f"store   moves={len(samples)} on-loop mean={statistics.mean(samples):6.2f}us "
+        f"p99={p99:6.2f}us max={max(samples):7.2f}us"
+    )
+    print(
+        f"writer  flushes={stats['flushes']} avg={stats['avg_flush_ms']:.2f}ms max={stats['max_flush_ms']:.2f}ms "
+        f"per op={stats['avg_write_us_per_op']:.2f}us (off the event loop)"
+    )
+    print(f"restore games={len(restore)} mean={statistics.mean(restore):.2f}ms max={max(restore):.2f}ms")
+    sync = bench_sync(args.groups, directory)
+    print(f"sync    moves={len(sync)} on-loop mean={statistics.mean(sync):6.2f}us p99={percentile(sync, 0.99):6.2f}us")
+
+    enqueue, result_stats, queries = asyncio.run(
+        bench_results(args.results, args.rank_groups, args.players, args.flush_interval, directory)
+    )
+    print(
+        f"results games={len(enqueue)} on-loop mean={statistics.mean(enqueue):6.2f}us "
+        f"p99={percentile(enqueue, 0.99):6.2f}us  writer per result={result_stats['avg_write_us_per_op']:.2f}us"
+    )
+    for name, samples in queries.items():
+        print(
+            f"query   {name:<14} n={len(samples)} p50={percentile(samples, 0.5):.2f}ms "
+            f"p99={percentile(samples, 0.99):.2f}ms max={max(samples):.2f}ms"
+        )
+    print("aggregates match a full recomputation from results")
+    failed = asyncio.run(check_write_failure(directory))
+    print(f"recovery: {failed} failed flushes while the database was locked, no ops lost")
+    asyncio.run(check_cancelled_flush(directory))
+    print("shutdown during a write: the batch is written exactly once")
+
+    if p99 > args.budget_us:
+        print(f"FAIL: p99 on-loop overhead {p99:.2f}us exceeds budget {args.budget_us}us")
+        sys.exit(1)
+    print(f"ok: p99 on-loop overhead within {args.budget_us}us budget")
+
+
+if __name__ == "__main__":
+    main()
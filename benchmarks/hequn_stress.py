@@ -0,0 +1,143 @@
+"""
+合群之落并发压力脚本：启动 NoneBot（无网络驱动），用一个只记录 API 调用的 OneBot 适配器，
+把许多群的对局消息并发送进真实的事件处理流程。每一步都会把同一条落子消息重复发送几次，
+模拟玩家连续快速刷屏；结束后检查每局棋盘与回合状态是否一致，并统计出图合并的效果
+（登记次数、实际出图、丢弃的过时图、发送的棋盘消息）。
+
+    python benchmarks/hequn_stress.py                    # 10 个群，每步重复 3 次
+    python benchmarks/hequn_stress.py --groups 50 --dup 5 --seed 1
+
+吞吐量主要受 NoneBot 逐个匹配器检查规则的开销限制，脚本关注的是正确性而不是速度。
+需要 nonebot2 与 nonebot-adapter-onebot；在仓库的上一级目录以包 ``<仓库目录名>`` 的形式加载插件。
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import nonebot
+
+ROOT = Path(__file__).resolve().parent.parent
+os.chdir(ROOT.parent)
+sys.path.insert(0, str(ROOT.parent))
+
+nonebot.init(
+    driver="~none", command_start=["/"], log_level="WARNING",
+    hequn_db_path=str(Path(tempfile.mkdtemp()) / "games.db"),  # 不写入插件目录下的存档
+)
+
+from nonebot.adapters.onebot.v11 import Adapter, Bot, GroupMessageEvent, Message
+from nonebot.message import handle_event
+
+nonebot.load_plugins(ROOT.name)  # 以仓库目录为插件目录
+hequn = sys.modules[f"{ROOT.name}.hequn"]
+engine = sys.modules[f"{ROOT.name}.hequn.engine"]
+
+sent = defaultdict(list)  # group_id -> 发出的消息
+
+
+class RecordingAdapter(Adapter):
+    """不连接任何实现端，只记录 bot 发出的消息"""
+
+    async def _call_api(self, bot, api, **data):
+        if api in ("send_msg", "send_group_msg"):
+            sent[data.get("group_id")].append(str(data.get("message")))
+        return {"message_id": 0}
+
+
+_message_id = 0
+
+
+def group_message(group_id: int, user_id: int, text: str) -> GroupMessageEvent:
+    global _message_id
+    _message_id += 1
+    return GroupMessageEvent(
+        time=int(time.time()), self_id=10000, post_type="message", sub_type="normal",
+        user_id=user_id, message_type="group", message_id=_message_id, group_id=group_id,
+        message=Message(text), original_message=Message(text), raw_message=text, font=0,
+        sender={"user_id": user_id, "nickname": str(user_id), "role": "member"}, to_me=False,
+    )
+
+
+async def play_group(bot: Bot, group_id: int, rng: random.Random, dup: int):
+    black, white = group_id * 10 + 1, group_id * 10 + 2
+    await handle_event(bot, group_message(group_id, black, "/合群之落"))
+    # 两个人同时尝试加入
+    await asyncio.gather(*(handle_event(bot, group_message(group_id, white, "/加入游戏")) for _ in range(dup)))
+    cells = list(range(engine.CELLS))
+    rng.shuffle(cells)
+    attempts = 0
+    while group_id in hequn.games and not hequn.games[group_id]["game_over"] and cells:
+        game = hequn.games[group_id]
+        player = int(game["players"][game["current_player_idx"]])
+        row, col = divmod(cells.pop(), engine.SIZE)
+        coord = f"{chr(ord('A') + col)}{row + 1}"
+        # 同一条落子被连发 dup 次，另一位玩家也同时抢着落同一个点
+        events = [group_message(group_id, player, f"/落子 {coord}") for _ in range(dup)]
+        events.append(group_message(group_id, black + white - player, f"/落子 {coord}"))
+        rng.shuffle(events)
+        await asyncio.gather(*(handle_event(bot, e) for e in events))
+        attempts += 1
+        check_invariants(group_id)
+    return attempts
+
+
+def check_invariants(group_id: int):
+    game = hequn.games.get(group_id)
+    if game is None:
+        return
+    board = game["board"]
+    union = 0
+    for mask in board.stones.values():
+        assert not union & mask, f"group {group_id}: two stones on one cell"
+        union |= mask
+    placed = engine.popcount(union)
+    assert placed == board.occupied_count, f"group {group_id}: occupied count drifted"
+    assert game["current_player_idx"] == placed % 2, f"group {group_id}: turn order broken after {placed} moves"
+    assert game["turn_count"] == placed // 2 + 1, f"group {group_id}: turn counter drifted"
+    painted = sum(engine.popcount(m) for m in board.colors.values())
+    assert painted == sum(board.scores.values()), f"group {group_id}: scores out of sync"
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--groups", type=int, default=10)
+    ap.add_argument("--dup", type=int, default=3, help="每条落子消息重复发送的次数")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    driver = nonebot.get_driver()
+    bot = Bot(RecordingAdapter(driver), "10000")
+    start = time.perf_counter()
+    moves = await asyncio.gather(
+        *(play_group(bot, 1000 + g, random.Random(args.seed + g), args.dup) for g in range(args.groups))
+    )
+    await asyncio.gather(*(c.wait() for c in hequn._coalescers.values()))
+    elapsed = time.perf_counter() - start
+
+    finished = sum(1 for g in range(args.groups) if 1000 + g not in hequn.games)
+    boards = sum(1 for msgs in sent.values() for m in msgs if "轮到玩家" in m)
+    stats = hequn.coalesce_stats()
+    print(
+        f"groups={args.groups} moves={sum(moves)} finished={finished}/{args.groups} "
+        f"turn messages={boards} elapsed={elapsed:.2f}s ({sum(moves) / elapsed:.0f} moves/s)"
+    )
+    print(
+        f"coalescer posts={stats['posts']} renders={stats['renders']} dropped={stats['dropped']} "
+        f"sends={stats['sends']}"
+    )
+    assert finished == args.groups, "some games did not reach a full board"
+    # 开局一条 + 除最后一手外每手至多一条（连续落子时合并）
+    assert boards <= sum(moves), "more turn messages than moves"
+    for g in range(args.groups):
+        assert "游戏结束" in sent[1000 + g][-1], f"group {1000 + g}: last message is not the final result"
+    print("invariants ok")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+"""
+A1Z26 / ROT-N 编解码基准：用很长的输入比较原先逐个 token 检查（isdigit + int + chr）的写法
+与 nutri.codec 的查表实现。
+
+    python benchmarks/nutri_codec.py
+    python benchmarks/nutri_codec.py --tokens 200000 --repeat 10
+"""
+import argparse
+import random
+import statistics
+import time
+
+import _plugins
+
+codec = _plugins.load("nutri", "codec")
+
+
+def legacy_decode(text: str) -> str:
+    """原 handle_a1z26 的逻辑（遇到第一个无效 token 即停止）"""
+    numbers = []
+    for part in text.split():
+        if not part.isdigit():
+            raise ValueError(part)
+        num = int(part)
+        if not (1 <= num <= 26):
+            raise ValueError(part)
+        numbers.append(num)
+    return "".join([chr(96 + num) for num in numbers])
+
+
+def legacy_caesar(text: str, shift: int) -> str:
+    out = []
+    for c in text:
+        if c.islower():
+            out.append(chr((ord(c) - 97 + shift) % 26 + 97))
+        elif c.isupper():
+            out.append(chr((ord(c) - 65 + shift) % 26 + 65))
+        else:
+            out.append(c)
+    return "".join(out)
+
+
+def timed(fn, *args, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), result
+
+
+def report(name: str, legacy_ms: float, new_ms: float):
+    print(f"{name:<18} legacy {legacy_ms:8.2f}ms  codec {new_ms:8.2f}ms  x{legacy_ms / max(new_ms, 1e-6):.1f}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tokens", type=int, default=100000)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    numbers = [rng.randint(1, 26) for _ in range(args.tokens)]
+    spaced = " ".join(map(str, numbers))
+    padded = "".join(f"{n:02d}" for n in numbers)
+    letters = "".join(chr(96 + n) for n in numbers)
+    prose = " ".join(letters[i:i + rng.randint(2, 9)] for i in range(0, len(letters), 6)).title()
+
+    legacy_ms, expected = timed(legacy_decode, spaced, repeat=args.repeat)
+    new_ms, result = timed(codec.a1z26_decode, spaced, repeat=args.repeat)
+    assert result.text == expected and not result.invalid
+    report("decode (spaced)", legacy_ms, new_ms)
+
+    new_ms, result = timed(codec.a1z26_decode, padded, repeat=args.repeat)
+    assert result.text == expected
+    report("decode (padded)", legacy_ms, new_ms)
+
+    legacy_ms, _ = timed(lambda s: " ".join(str(ord(c) - 96) for c in s), letters, repeat=args.repeat)
+    new_ms, (encoded, _) = timed(codec.a1z26_encode, letters, repeat=args.repeat)
+    assert encoded == spaced
+    report("encode", legacy_ms, new_ms)
+
+    legacy_ms, expected = timed(legacy_caesar, prose, 13, repeat=args.repeat)
+    new_ms, result = timed(codec.caesar, prose, 13, repeat=args.repeat)
+    assert result == expected
+    report("rot13", legacy_ms, new_ms)
+
+    # 含无效 token 的输入：原写法只能报告第一个
+    noisy = spaced.split()
+    for i in rng.sample(range(len(noisy)), 50):
+        noisy[i] = rng.choice(["27", "0", "x", "99"])
+    new_ms, result = timed(codec.a1z26_decode, " ".join(noisy), repeat=args.repeat)
+    print(f"{'invalid report':<18} codec {new_ms:8.2f}ms, {len(result.invalid)} invalid tokens reported in one pass")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+nutrimatics 结果页解析基准：比较原先的 BeautifulSoup 整页建树与 nutri.parser 的流式提取
+（按 8 KiB 分块喂入，够 20 条即停止），统计每页 CPU 时间与 tracemalloc 峰值内存，并核对两者结果一致。
+
+默认输入是 benchmarks/fixtures/nutri/ 下保存的真实结果页 / 错误页，另外用合成页面按结果条数做一组规模对比。
+fixtures 用 --save 从 nutrimatic.org 抓取（每个查询存一页，文件名取自查询）。
+
+    python benchmarks/nutri_parse.py
+    python benchmarks/nutri_parse.py --save "<hello>" "m*n*ght" "(((" "A*"
+    python benchmarks/nutri_parse.py page1.html page2.html   # 只测指定页面
+    python benchmarks/nutri_parse.py --sizes 5,200,2000 --repeat 50
+
+需要 beautifulsoup4。
+"""
+import argparse
+import random
+import re
+import statistics
+import time
+import tracemalloc
+import urllib.request
+from pathlib import Path
+from urllib.parse import quote
+
+from bs4 import BeautifulSoup
+
+import _plugins
+
+parser_mod = _plugins.load("nutri", "parser")
+
+CHUNK_SIZE = 8192
+LIMIT = 20
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "nutri"
+NUTRIMATIC_URL = "https://nutrimatic.org/2024/"
+
+
+def save_fixtures(queries):
+    """抓取真实页面原样存为 fixtures（完整页面，含表单与页脚）"""
+    FIXTURES.mkdir(parents=True, exist_ok=True)
+    for query in queries:
+        with urllib.request.urlopen(f"{NUTRIMATIC_URL}?q={quote(query, safe='')}", timeout=30) as response:
+            html = response.read().decode("utf-8", errors="replace")
+        name = re.sub(r"[^0-9A-Za-z]+", "_", query).strip("_") or "query"
+        (FIXTURES / f"{name}.html").write_text(html, encoding="utf-8")
+        print(f"saved {query!r} -> {FIXTURES.name}/{name}.html ({len(html) / 1024:.1f}KiB)")
+
+
+def synth_result_page(count: int, seed: int = 0) -> str:
+    """仿照 nutrimatic.org 的结果页：表单 + 若干按字号排列的结果 + 页脚"""
+    rng = random.Random(seed)
+    words = ["the", "radio", "midnight", "sunset", "card", "rainbow", "echo", "cloud", "clear", "night"]
+    head = (
+        "<html><head><title>Nutrimatic</title><style>body { font-family: sans-serif }</style></head><body>"
+        "<form method=get><input name=q size=60 value='m*n&lt;ight'> <input type=submit value=Go></form>"
+        "<p>Results for <b>m*n&lt;ight</b>:</p>\n"
+    )
+    rows = []
+    for i in range(count):
+        phrase = " ".join(rng.choice(words) for _ in range(rng.randint(1, 4)))
+        size = 2.5 - i * 2.0 / max(1, count)
+        rows.append(f"<span style='font-size: {size:.2f}em'>{phrase}</span><br>\n")
+    tail = "<p><a href='?q=m*n&amp;start=100'>Next &raquo;</a></p><p><i>Nutrimatic</i> &copy; 2024</p></body></html>"
+    return head + "".join(rows) + tail
+
+
+def synth_error_page() -> str:
+    return (
+        "<html><body><form method=get><input name=q value='((('></form>"
+        "<p><font color=red>Error: unbalanced parentheses</font></p></body></html>"
+    )
+
+
+def parse_bs4(html: str):
+    soup = BeautifulSoup(html, "html.parser")
+    if error_tag := soup.find("font", color="red"):
+        return [], error_tag.text.strip()
+    results = [
+        span.get_text(strip=True)
+        for span in soup.find_all("span", style=lambda x: x is not None and "font-size" in x)
+    ][:LIMIT]
+    return results, None
+
+
+def parse_stream(html: str):
+    chunks = (html[i:i + CHUNK_SIZE] for i in range(0, len(html), CHUNK_SIZE))
+    return parser_mod.parse_chunks(chunks, LIMIT)
+
+
+def measure(fn, html: str, repeat: int):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(html)
+        times.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    fn(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(times), peak / 1024
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("pages", nargs="*", help="只测这些保存下来的 nutrimatic 页面（HTML 文件）")
+    ap.add_argument("--save", nargs="+", metavar="QUERY", help="抓取这些查询的真实页面存入 fixtures 后退出")
+    ap.add_argument("--sizes", default="5,200,1000", help="合成结果页的结果条数（规模对比）；为空则不测合成页")
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    if args.save:
+        save_fixtures(args.save)
+        return
+    if args.pages:
+        pages = [Path(p) for p in args.pages]
+    else:
+        pages = sorted(FIXTURES.glob("*.html"))
+        if not pages:
+            print(f"no saved pages in {FIXTURES}, run with --save QUERY... to capture some")
+    fixtures = {page.name: page.read_text(encoding="utf-8", errors="replace") for page in pages}
+    if not args.pages:
+        for count in (int(n) for n in args.sizes.split(",") if n):
+            fixtures[f"synth-{count}"] = synth_result_page(count, seed=count)
+        fixtures["synth-error"] = synth_error_page()
+
+    for name, html in fixtures.items():
+        expected = parse_bs4(html)
+        got = parse_stream(html)
+        status = "ok" if got == expected else "MISMATCH"
+        bs_ms, bs_kb = measure(parse_bs4, html, args.repeat)
+        st_ms, st_kb = measure(parse_stream, html, args.repeat)
+        print(
+            f"{name:<16} {len(html) / 1024:7.1f}KiB  parity={status:<8} "
+            f"bs4 {bs_ms:7.2f}ms {bs_kb:8.1f}KiB peak | stream {st_ms:6.2f}ms {st_kb:7.1f}KiB peak | "
+            f"x{bs_ms / max(st_ms, 1e-6):.1f} faster"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,13 @@
-from typing import Dict, Tuple, Optional, Set, List
-from nonebot import on_command, get_driver
+import asyncio
+import functools
+import multiprocessing
+import re
+import weakref
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, Optional, Set, List
+from nonebot import on_command, get_driver, require
 from nonebot.params import CommandArg
 from nonebot.adapters.onebot.v11 import (
     MessageSegment,
@@ -8,324 +16,193 @@ from nonebot.adapters.onebot.v11 import (
     GROUP_ADMIN,
     GROUP_OWNER,
 )
+from nonebot.log import logger
 from nonebot.permission import SUPERUSER
-from nonebot_plugin_htmlrender import get_new_page #  确保已安装: pip install nonebot-plugin-htmlrender
+
+render_pool = require("render_pool")  # 共享的预热页面池（基于 nonebot-plugin-htmlrender）
+from . import render
+from .engine import (
+    Geometry, get_geometry, LINE_NAMES, popcount, coord_name,
+    coord_to_index,  # 纯函数放在引擎里，基准脚本可以不启动 NoneBot 直接导入
+)
+from .game import new_game, play_move, undo_move, last_mover, export_record
+from .store import GameStore
+from .ai import LEVELS, DEFAULT_LEVEL, choose_move
+from .coalesce import RenderCoalescer
+
+# 渲染方式：raster（默认，Pillow 合成）或 html（htmlrender 截图）
+plugin_config = get_driver().config
+RENDER_BACKEND = str(getattr(plugin_config, "hequn_render_backend", "raster")).lower()
+render.font_path = getattr(plugin_config, "hequn_font_path", None)
+if RENDER_BACKEND != "html" and not render.RASTER_AVAILABLE:
+    logger.warning("Pillow not found, hequn falls back to htmlrender. Install it: pip install pillow")
+USE_HTMLRENDER = RENDER_BACKEND == "html" or not render.RASTER_AVAILABLE
+
+# 棋盘显示模式：image（图片）或 text（全角字符网格，不出图）；各群可用【棋盘模式】单独切换。
+# 图片模式下出图失败、或 htmlrender 页面池排队已达 hequn_render_queue_limit 时，这一条改发文字棋盘
+BOARD_MODE = str(getattr(plugin_config, "hequn_board_mode", "image")).lower()
+BOARD_MODE_NAMES = {"图片": "image", "文字": "text"}
+RENDER_QUEUE_LIMIT = int(getattr(plugin_config, "hequn_render_queue_limit", 2))
+board_modes: Dict[int, str] = {}  # 各群选择的模式（不存档，重启后恢复默认）
+
+# 棋盘规格：默认 10x10 三连、九宫格染色；开局时可以指定边长与几连，如【合群之落 15 四连】
+DEFAULT_GEOMETRY = get_geometry(
+    int(getattr(plugin_config, "hequn_board_size", 10)),
+    int(getattr(plugin_config, "hequn_line_length", 3)),
+    int(getattr(plugin_config, "hequn_color_radius", 1)),
+)
+BOARD_SIZES = (10, 15, 19)
+
+
+def board_page_pool(geometry: Geometry):
+    """htmlrender 页面池：预载的空棋盘与边长有关，每种边长一个池"""
+    name = "hequn" if geometry.size == 10 else f"hequn_{geometry.size}"
+    return render_pool.get_pool(name, render.board_template_html(geometry), {"width": 600, "height": 750})
+
+
+if USE_HTMLRENDER:
+    board_page_pool(DEFAULT_GEOMETRY)  # 默认规格的池随 render_pool 启动预热；Pillow 出图时不建池
 
 # 游戏状态存储结构
 games: Dict[int, dict] = {}
 
+# 对局存档：重启后各群第一次使用命令时从存档恢复
+PERSIST = bool(getattr(plugin_config, "hequn_persist", True))
+store = GameStore(
+    Path(getattr(plugin_config, "hequn_db_path", Path(__file__).parent / "games.db")),
+    flush_interval=float(getattr(plugin_config, "hequn_flush_interval", 0.5)),
+    compact_every=int(getattr(plugin_config, "hequn_compact_every", 32)),
+    elo_k=float(getattr(plugin_config, "hequn_elo_k", 32)),
+    elo_initial=float(getattr(plugin_config, "hequn_elo_initial", 1500)),
+) if PERSIST else None
+_checked_groups: Set[int] = set()  # 已查过存档的群
+finished_records: Dict[int, str] = {}  # 各群最近一局结束时的棋谱
+
+# 人机对局：AI 搜索是纯 CPU 计算，默认放进进程池（forkserver，不支持时 spawn），不占用事件循环所在进程的 GIL；
+# 工作进程导入不了本插件或配置 hequn_ai_executor=thread 时改用线程池
+AI_PLAYER_ID = "AI"
+AI_EXECUTOR = str(getattr(plugin_config, "hequn_ai_executor", "process")).lower()
+AI_WORKERS = int(getattr(plugin_config, "hequn_ai_workers", 2))
+ai_executor: Optional[Executor] = None
+
+# 每个群一把锁：同一群的创建/加入/落子/结束按顺序执行（校验、改动棋局、notify 登记在锁内，
+# 出图与发送由 RenderCoalescer 在锁外完成），不同群互不阻塞。只要还有协程持有或等待，锁就保留在表里，之后自动回收。
+_group_locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def group_lock(group_id: int) -> asyncio.Lock:
+    lock = _group_locks.get(group_id)
+    if lock is None:
+        lock = _group_locks[group_id] = asyncio.Lock()
+    return lock
+
+# 出图合并：处理器只登记局面变化与文字，每群一个后台任务在锁外出图；
+# 出图期间又有新局面时丢弃旧图，最新棋盘与积累的文字合成一条消息发送
+RENDER_DEBOUNCE = float(getattr(plugin_config, "hequn_render_debounce", 0.0))
+RENDER_MAX_WAIT = float(getattr(plugin_config, "hequn_render_max_wait", 1.0))  # 连续落子时至少每隔这么久发一次
+_coalescers: Dict[int, RenderCoalescer] = {}
+
 # ---------- 工具函数 ----------
-def init_game(group_id: int):
+def init_game(group_id: int, geometry: Geometry = DEFAULT_GEOMETRY):
     """初始化游戏"""
-    games[group_id] = {
-        "board": [[{"occupied": None, "color": None} for _ in range(10)] for _ in range(10)],
-        "players": [],  # [player1_id, player2_id]
-        "current_player_idx": 0,  # 0 for players[0], 1 for players[1]
-        "started": False,
-        "game_over": False,
-        "turn_count": 0,
-    }
+    games[group_id] = new_game(geometry)
 
-def coord_to_index(coord: str) -> Optional[Tuple[int, int]]:
-    """坐标转换（带严格校验）"""
-    if not coord or len(coord) < 2:
-        return None
+async def load_game(group_id: int):
+    """按需从存档恢复本群对局（调用方需持有该群的锁）"""
+    if store is None or group_id in games or group_id in _checked_groups:
+        return
+    _checked_groups.add(group_id)
     try:
-        col_str = coord[0].upper()
-        row_str = coord[1:]
-        if not (col_str.isalpha() and row_str.isdigit()):
-            return None
-        
-        col = ord(col_str) - ord("A")
-        row = int(row_str) - 1
-        if 0 <= col < 10 and 0 <= row < 10:
-            return (row, col)
-        return None
-    except:
-        return None
+        game = await store.load(group_id)
+    except Exception as e:
+        logger.exception(f"Failed to restore hequn game for group {group_id}: {e}")
+        return
+    if game is not None:
+        games[group_id] = game
+        logger.info(f"Restored hequn game for group {group_id} at move {game['board'].occupied_count}")
 
-def check_three_in_line(board: List[List[Dict]], player_id: str, last_move: Tuple[int, int]) -> Set[Tuple[int, int]]:
-    """
-    检测落子后形成的所有三连，并返回对应的九宫格染色区域。
-    修正逻辑：以形成三连的中间棋子为中心进行九宫格染色。
-    一次落子可能形成多个方向上的三连。
+def save_game(group_id: int):
+    if store is not None and group_id in games:
+        store.save(group_id, games[group_id])
 
-    参数：
-        board: 棋盘二维数组
-        player_id: 当前玩家ID (实际是 user_id)
-        last_move: 最新落子坐标 (row, col)
+def drop_game(group_id: int):
+    games.pop(group_id, None)
+    if store is not None:
+        store.delete(group_id)
 
-    返回：
-        需要染色的格子坐标集合 (九宫格中心集合)
-    """
-    r, c = last_move
-    affected_nine_grids_centers = set() # 存储三连的中心棋子坐标
-
-    # 定义8个方向 (dr, dc)
-    # (水平, 垂直, 主对角线, 副对角线)及其反方向
-    directions = [
-        (0, 1), (1, 0), (1, 1), (1, -1),
-        (0, -1), (-1, 0), (-1, -1), (-1, 1)
-    ]
+def is_ai_turn(game: dict) -> bool:
+    return bool(game["ai_level"]) and game["players"][game["current_player_idx"]] == AI_PLAYER_ID
 
-    # 为了避免重复检查同一条线，我们只检查从新落子点开始的特定组合
-    # 考虑新落子点 P 作为三连的:
-    # 1. P X X (P是起点)
-    # 2. X P X (P是中点)
-    # 3. X X P (P是终点)
-
-    for dr, dc in directions[:4]: # 只需检查4个基础方向，另4个会被覆盖
-        # 检查三种模式
-        # 模式 1: (P) O O (P是当前子，O是同色子)
-        # 中点是 P + 1*dir
-        p1 = (r, c)
-        p2 = (r + dr, c + dc)
-        p3 = (r + 2 * dr, c + 2 * dc)
-        if (0 <= p2[0] < 10 and 0 <= p2[1] < 10 and
-            0 <= p3[0] < 10 and 0 <= p3[1] < 10 and
-            board[p1[0]][p1[1]]["occupied"] == player_id and
-            board[p2[0]][p2[1]]["occupied"] == player_id and
-            board[p3[0]][p3[1]]["occupied"] == player_id):
-            affected_nine_grids_centers.add(p2) # 中心是p2
-
-        # 模式 2: O (P) O
-        # 中点是 P
-        p1 = (r - dr, c - dc)
-        p2 = (r, c) # 当前落子
-        p3 = (r + dr, c + dc)
-        if (0 <= p1[0] < 10 and 0 <= p1[1] < 10 and
-            0 <= p3[0] < 10 and 0 <= p3[1] < 10 and
-            board[p1[0]][p1[1]]["occupied"] == player_id and
-            board[p2[0]][p2[1]]["occupied"] == player_id and # 确保当前落子点是正确的（理论上总是）
-            board[p3[0]][p3[1]]["occupied"] == player_id):
-            affected_nine_grids_centers.add(p2) # 中心是p2 (即last_move)
-
-        # 模式 3: O O (P)
-        # 中点是 P - 1*dir
-        p1 = (r - 2 * dr, c - 2 * dc)
-        p2 = (r - dr, c - dc)
-        p3 = (r, c) # 当前落子
-        if (0 <= p1[0] < 10 and 0 <= p1[1] < 10 and
-            0 <= p2[0] < 10 and 0 <= p2[1] < 10 and
-            board[p1[0]][p1[1]]["occupied"] == player_id and
-            board[p2[0]][p2[1]]["occupied"] == player_id and
-            board[p3[0]][p3[1]]["occupied"] == player_id): # 确保当前落子点是正确的
-            affected_nine_grids_centers.add(p2) # 中心是p2
-
-    # 根据中心点集合，生成所有需要染色的九宫格区域
-    cells_to_color = set()
-    for center_r, center_c in affected_nine_grids_centers:
-        for dr_nine in [-1, 0, 1]:
-            for dc_nine in [-1, 0, 1]:
-                nr, nc = center_r + dr_nine, center_c + dc_nine
-                if 0 <= nr < 10 and 0 <= nc < 10:
-                    cells_to_color.add((nr, nc))
-    
-    return cells_to_color
-
-
-def apply_color(board: List[List[Dict]], player_id: str, positions: Set[Tuple[int, int]]):
-    """应用颜色"""
-    for r, c in positions:
-        board[r][c]["color"] = player_id # player_id is user_id
-
-async def generate_board_image(group_id: int) -> Optional[bytes]:
-    """生成优化后的棋盘图片"""
-    if group_id not in games:
-        return None
-    game = games[group_id]
-    board_data = game["board"]
-    players = game["players"] # [player1_id, player2_id]
-    
-    # 确保有两个玩家，否则颜色定义会出问题
-    player1_id = players[0] if len(players) > 0 else "P1_Unknown"
-    player2_id = players[1] if len(players) > 1 else "P2_Unknown"
-
-    # 计算染色区域得分
-    scores = {player1_id: 0, player2_id: 0}
-    for r in range(10):
-        for c in range(10):
-            cell_color = board_data[r][c]["color"]
-            if cell_color == player1_id:
-                scores[player1_id] += 1
-            elif cell_color == player2_id:
-                scores[player2_id] += 1
-    
-    total_occupied_cells = sum(1 for row in board_data for cell in row if cell["occupied"])
-
-
-    html_content = f"""
-    <!DOCTYPE html>
-    <html lang="zh-CN">
-    <head>
-        <meta charset="UTF-T">
-        <title>合群之落棋盘</title>
-        <style>
-            :root {{
-                --board-bg: #f0e6d2; /* 棋盘背景色，暖黄色 */
-                --cell-border: #b8a07e; /* 棋盘线颜色 */
-                --coord-text: #5c4d3c; /* 坐标文字颜色 */
-                --stone-size-ratio: 0.75; /* 棋子相对于格子大小的比例 */
-                --player1-color-id: '{player1_id}'; /* 存储玩家ID，以便JS或CSS选择器使用 */
-                --player2-color-id: '{player2_id}';
-                
-                /* 玩家1 (黑棋) 染色区域 */
-                --player1-area-bg-start: #ffcdd2; /* 浅红 */
-                --player1-area-bg-end: #ef9a9a;   /* 稍深红 */
-                
-                /* 玩家2 (白棋) 染色区域 */
-                --player2-area-bg-start: #bbdefb; /* 浅蓝 */
-                --player2-area-bg-end: #90caf9;   /* 稍深蓝 */
-
-                --black-stone-main: #212121;
-                --black-stone-highlight: #424242;
-                --white-stone-main: #e0e0e0;
-                --white-stone-highlight: #ffffff;
-                --white-stone-border: #bdbdbd;
-            }}
-            body {{
-                font-family: 'Arial', 'Microsoft YaHei', sans-serif;
-                background-color: #f7f7f7;
-                padding: 20px;
-                display: flex;
-                flex-direction: column;
-                align-items: center;
-            }}
-            .game-container {{
-                background-color: #fff;
-                padding: 20px;
-                border-radius: 12px;
-                box-shadow: 0 8px 16px rgba(0,0,0,0.1);
-            }}
-            .board-wrapper {{
-                display: grid;
-                grid-template-columns: 30px 1fr; /* 列坐标 + 棋盘 */
-                grid-template-rows: 30px 1fr;    /*行坐标 + 棋盘 */
-                width: 530px; /* 500px for board + 30px for coords */
-                height: 530px;
-                margin-bottom: 20px;
-            }}
-            .coord-label {{
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                font-size: 14px;
-                color: var(--coord-text);
-                font-weight: bold;
-            }}
-            .board {{
-                display: grid;
-                grid-template-columns: repeat(10, 1fr);
-                grid-template-rows: repeat(10, 1fr);
-                width: 500px;
-                height: 500px;
-                border: 2px solid var(--cell-border);
-                background-color: var(--board-bg);
-            }}
-            .cell {{
-                border: 1px solid var(--cell-border);
-                position: relative;
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                background-size: cover; /* For gradient backgrounds */
-            }}
-            /* Cell coloring based on player ID */
-            .cell.colored.player1 {{
-                background: linear-gradient(135deg, var(--player1-area-bg-start), var(--player1-area-bg-end));
-            }}
-            .cell.colored.player2 {{
-                background: linear-gradient(135deg, var(--player2-area-bg-start), var(--player2-area-bg-end));
-            }}
-
-            .stone {{
-                width: calc(100% * var(--stone-size-ratio));
-                height: calc(100% * var(--stone-size-ratio));
-                border-radius: 50%;
-                box-shadow: 0 2px 4px rgba(0,0,0,0.3), inset 0 1px 2px rgba(255,255,255,0.2);
-                position: absolute; /* Keep absolute for fine-tuning if needed */
-                left: 50%;
-                top: 50%;
-                transform: translate(-50%, -50%);
-            }}
-            .stone.black {{
-                background: radial-gradient(circle at 30% 30%, var(--black-stone-highlight), var(--black-stone-main));
-            }}
-            .stone.white {{
-                background: radial-gradient(circle at 70% 70%, var(--white-stone-highlight), var(--white-stone-main));
-                border: 1px solid var(--white-stone-border);
-            }}
-            .info-panel {{
-                text-align: center;
-                background-color: #e9e9e9;
-                padding: 15px;
-                border-radius: 8px;
-            }}
-            .info-panel p {{ margin: 5px 0; font-size: 16px; }}
-            .info-panel .score {{ font-weight: bold; }}
-            .player1-text {{ color: #c62828; }} /* Darker red for text */
-            .player2-text {{ color: #1565c0; }} /* Darker blue for text */
-        </style>
-    </head>
-    <body>
-        <div class="game-container">
-            <div class="board-wrapper">
-                <div></div> <!-- Top-left empty cell -->
-                <div style="display: grid; grid-template-columns: repeat(10, 1fr);">
-                    {''.join(f'<div class="coord-label">{chr(65 + i)}</div>' for i in range(10))}
-                </div>
-                <div style="display: grid; grid-template-rows: repeat(10, 1fr);">
-                    {''.join(f'<div class="coord-label">{i + 1}</div>' for i in range(10))}
-                </div>
-                <div class="board">
+async def generate_board_image(game: dict) -> Optional[bytes]:
     """
-
-    for r in range(10):
-        for c in range(10):
-            cell_data = board_data[r][c]
-            cell_classes = ["cell"]
-            stone_html = ""
-
-            if cell_data["color"] == player1_id:
-                cell_classes.append("colored player1")
-            elif cell_data["color"] == player2_id:
-                cell_classes.append("colored player2")
-            
-            if cell_data["occupied"] == player1_id: # Player 1 is Black
-                stone_html = '<div class="stone black"></div>'
-            elif cell_data["occupied"] == player2_id: # Player 2 is White
-                stone_html = '<div class="stone white"></div>'
-            
-            html_content += f'<div class="{" ".join(cell_classes)}">{stone_html}</div>'
-
-    html_content += f"""
-                </div>
-            </div>
-            <div class="info-panel">
-                <p>总手数：{game['turn_count']}</p>
-                <p>下一手：玩家 {game['players'][game['current_player_idx']]} ({'黑棋 ●' if game['current_player_idx'] == 0 else '白棋 ○'})</p>
-                <p><span class="player1-text">玩家 {player1_id} (黑) 染色区域: <span class="score">{scores[player1_id]}</span></span></p>
-                <p><span class="player2-text">玩家 {player2_id} (白) 染色区域: <span class="score">{scores[player2_id]}</span></span></p>
-            </div>
-        </div>
-    </body>
-    </html>
+    生成棋盘图片（参数为 render_view 快照，无需持锁）：默认 Pillow 合成（在线程池中执行，
+    不同群可并行出图），配置 hequn_render_backend=html 时使用 htmlrender。
     """
-    
-    # print(html_content) # For debugging HTML
-    
+    if not USE_HTMLRENDER:
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, render.render_board_png, game)
+        except Exception as e:
+            logger.exception(f"Error generating image with Pillow: {e}")
+            return None
+
+    pool = board_page_pool(game["board"].geometry)
+    if pool.waiting >= RENDER_QUEUE_LIMIT:
+        return None  # 页面池已饱和，不再排队，直接回退为文字棋盘
     try:
-        async with get_new_page(viewport={"width": 600, "height": 750}) as page:
-            await page.set_content(html_content)
-            img_bytes = await page.screenshot(type="png", full_page=False) # Capture only viewport
-            return img_bytes
+        return await pool.render(
+            render.BOARD_UPDATE_JS, render.board_dom_state(game),
+            type="png", full_page=False, # Capture only viewport
+        )
     except Exception as e:
-        print(f"Error generating image with htmlrender: {e}")
+        logger.exception(f"Error generating image with htmlrender: {e}")
         return None
 
 
+async def send_board_message(view: dict, texts: List[str], image: Optional[bytes], final: bool):
+    """合并后的消息：棋盘图 + 期间积累的文字 + 回合提示（终局结算时不提示下一手）"""
+    lines = list(texts)
+    if not final:
+        next_player_id = view["players"][view["current_player_idx"]]
+        player_role = '黑棋 ●' if view['current_player_idx'] == 0 else '白棋 ○'
+        lines.append(f"当前第 {view['turn_count']} 手。轮到玩家 {next_player_id} ({player_role}) 落子。")
+    msg = Message()
+    if image:
+        msg.append(MessageSegment.image(image))
+        msg.append("\n" + "\n".join(lines))
+    else:  # 文字模式，或出图失败时的回退
+        msg.append("\n".join([render.render_board_text(view)] + lines))
+    try:
+        await place_cmd.send(msg) # Use any command that is available and has bot context
+    except Exception as e:
+        logger.exception(f"Failed to send hequn board message: {e}")
+
+async def render_group_board(group_id: int, view: dict) -> Optional[bytes]:
+    """按本群的棋盘模式出图；文字模式返回 None，由 send_board_message 发文字棋盘"""
+    if board_modes.get(group_id, BOARD_MODE) == "text":
+        return None
+    return await generate_board_image(view)
+
+def coalescer(group_id: int) -> RenderCoalescer:
+    c = _coalescers.get(group_id)
+    if c is None:
+        c = _coalescers[group_id] = RenderCoalescer(
+            group_lock(group_id), functools.partial(render_group_board, group_id), send_board_message,
+            RENDER_DEBOUNCE, RENDER_MAX_WAIT,
+        )
+    return c
+
+def notify(group_id: int, game: dict, text: Optional[str] = None, final: bool = False):
+    """登记局面变化（可附带文字），由出图合并任务稍后发送（调用方需持有该群的锁）"""
+    coalescer(group_id).post(game, text, final)
+
+def coalesce_stats() -> Dict[str, int]:
+    return {
+        key: sum(getattr(c, key) for c in _coalescers.values())
+        for key in ("posts", "renders", "dropped", "sends")
+    }
+
 async def end_game(group_id: int, ended_by_user_id: Optional[str] = None):
-    """结束游戏并结算"""
+    """结束游戏并结算（调用方需持有该群的锁）"""
     if group_id not in games: return
     game = games[group_id]
     game["game_over"] = True
@@ -333,17 +210,8 @@ async def end_game(group_id: int, ended_by_user_id: Optional[str] = None):
     player1_id = game["players"][0] if len(game["players"]) > 0 else "P1"
     player2_id = game["players"][1] if len(game["players"]) > 1 else "P2"
 
-    scores = {player1_id: 0, player2_id: 0}
-    for r in range(10):
-        for c in range(10):
-            cell_color = game["board"][r][c]["color"]
-            if cell_color == player1_id:
-                scores[player1_id] += 1
-            elif cell_color == player2_id:
-                scores[player2_id] += 1
-    
-    p1_score = scores[player1_id]
-    p2_score = scores[player2_id]
+    p1_score = game["board"].score(player1_id)
+    p2_score = game["board"].score(player2_id)
 
     result_msg = ""
     if p1_score == p2_score:
@@ -358,58 +226,113 @@ async def end_game(group_id: int, ended_by_user_id: Optional[str] = None):
     else:
          result_msg = f"棋盘已满，游戏结束！\n{result_msg}"
 
+    finished_records[group_id] = export_record(game)
+    if store is not None and game["started"] and len(game["players"]) == 2 and game["history"]:
+        # 战绩与删除存档在同一批写入；人机对局中 AI 按难度分别计分
+        players = [f"{p}({game['ai_level']})" if p == AI_PLAYER_ID else p for p in game["players"]]
+        store.record_result(group_id, game, players, ended_early=ended_by_user_id is not None)
+    drop_game(group_id)
+    notify(group_id, game, result_msg, final=True) # 终局棋盘与结算合成一条消息
 
-    img_bytes = await generate_board_image(group_id) # Generate final board image
-    msg_to_send = Message()
-    if img_bytes:
-        msg_to_send.append(MessageSegment.image(img_bytes))
-    msg_to_send.append(f"\n{result_msg}")
-    
-    await place_cmd.send(message=msg_to_send) # Use any command that is available and has bot context
-    
-    if group_id in games:
-        del games[group_id]
-
-async def send_turn_message(group_id: int):
-    """发送回合提示"""
-    if group_id not in games or games[group_id]["game_over"]:
-        return
-    
+async def ai_move(group_id: int):
+    """AI 应手：在执行器中搜索，随后落子、发消息（调用方需持有该群的锁）"""
     game = games[group_id]
-    img_bytes = await generate_board_image(group_id)
-    
-    if img_bytes:
-        next_player_id = game["players"][game["current_player_idx"]]
-        player_role = '黑棋 ●' if game['current_player_idx'] == 0 else '白棋 ○'
-        
-        msg = MessageSegment.image(img_bytes) + \
-              f"\n当前第 {game['turn_count']} 手。轮到玩家 {next_player_id} ({player_role}) 落子。"
-        await place_cmd.send(msg) # Use any command that is available
-    else:
-        await place_cmd.send("棋盘生成失败，请继续游戏。")
+    board = game["board"]
+    human_id = game["players"][1 - game["current_player_idx"]]
+    max_depth, time_budget = LEVELS[game["ai_level"]]
+    search_args = (
+        board.stones.get(AI_PLAYER_ID, 0), board.stones.get(human_id, 0),
+        board.colors.get(AI_PLAYER_ID, 0), board.colors.get(human_id, 0),
+        max_depth, time_budget, None, board.geometry,
+    )
+    loop = asyncio.get_running_loop()
+    executor = ai_executor
+    try:
+        cell = await loop.run_in_executor(executor, choose_move, *search_args)
+    except BrokenProcessPool as e:  # 工作进程被杀：换一个新的进程池，这一手先在默认线程池里算
+        logger.exception(f"hequn AI process pool broke, recreating it: {e}")
+        _replace_ai_executor(executor)
+        cell = await loop.run_in_executor(None, choose_move, *search_args)
+    except Exception as e:  # 其他失败（如工作进程里导入出错）退回默认线程池
+        logger.exception(f"hequn AI executor failed, retrying in a thread: {e}")
+        cell = await loop.run_in_executor(None, choose_move, *search_args)
+
+    row, col = divmod(cell, board.geometry.size)
+    player_idx = game["current_player_idx"]
+    affected_mask = play_move(game, row, col)
+    if store is not None:
+        store.record_move(group_id, game, player_idx, row, col)
+    msg = f"AI 落子 {coord_name(row, col)}。"
+    if affected_mask:
+        msg += f"\nAI 形成{board.geometry.line_name}，在 {popcount(affected_mask)} 个格子染色！"
+    notify(group_id, game, msg)
+
+    if board.is_full():
+        await end_game(group_id)
 
 # ---------- 命令处理器 ----------
 chess = on_command("合群之落", aliases={"开始下棋", "新对局"}, priority=5, block=True)
 join_cmd = on_command("加入游戏", aliases={"加入合群"}, priority=5, block=True) # Renamed for clarity
 place_cmd = on_command("落子", aliases={"下", "playchess"}, priority=5, block=True) # Renamed for clarity
 end_game_cmd = on_command("结束棋局", aliases={"认输"}, priority=5, block=True)
+undo_cmd = on_command("悔棋", priority=5, block=True)
+record_cmd = on_command("棋谱", aliases={"导出棋谱"}, priority=5, block=True)
+mode_cmd = on_command("棋盘模式", priority=5, block=True)
+rank_cmd = on_command("合群排行", aliases={"合群战绩"}, priority=5, block=True)
 force_stop_cmd = on_command("关闭游戏", permission=SUPERUSER | GROUP_ADMIN | GROUP_OWNER, priority=5, block=True)
 
 @chess.handle()
-async def handle_chess(event: Event):
+async def handle_chess(event: Event, arg: Message = CommandArg()):
     group_id = getattr(event, "group_id", None)
     if group_id is None:
         await chess.finish("请在群聊中使用此命令。")
 
-    if group_id in games and not games[group_id]["game_over"]:
-        await chess.finish("本群已有进行中的对局。若要强制结束，请使用【关闭游戏】。")
-    
-    init_game(group_id)
-    user_id = event.get_user_id()
-    games[group_id]["players"].append(user_id) # 创建者自动成为玩家1 (黑棋)
-    
+    # 合群之落 [10|15|19] [三连|四连|五连] [人机 [简单|普通|困难]]，参数顺序不限
+    size, line_length = DEFAULT_GEOMETRY.size, DEFAULT_GEOMETRY.line_length
+    vs_ai, level = False, DEFAULT_LEVEL
+    line_lengths = {name: length for length, name in LINE_NAMES.items()}
+    for token in arg.extract_plain_text().split():
+        size_match = re.fullmatch(r"(\d+)(?:[xX×]\1)?", token)
+        if token.lower() in ("人机", "ai"):
+            vs_ai = True
+        elif token in LEVELS:
+            vs_ai, level = True, token
+        elif size_match and int(size_match.group(1)) in BOARD_SIZES:
+            size = int(size_match.group(1))
+        elif token in line_lengths:
+            line_length = line_lengths[token]
+        else:
+            await chess.finish(
+                f"无法识别的参数：{token}。用法：合群之落 [{'|'.join(map(str, BOARD_SIZES))}] "
+                f"[{'|'.join(LINE_NAMES.values())}] [人机 [{'|'.join(LEVELS)}]]"
+            )
+    geometry = get_geometry(size, line_length, DEFAULT_GEOMETRY.radius)
+
+    async with group_lock(group_id):
+        await load_game(group_id)
+        if group_id in games and not games[group_id]["game_over"]:
+            await chess.finish("本群已有进行中的对局。若要强制结束，请使用【关闭游戏】。")
+
+        init_game(group_id, geometry)
+        game = games[group_id]
+        user_id = event.get_user_id()
+        game["players"].append(user_id) # 创建者自动成为玩家1 (黑棋)
+        if vs_ai:
+            game["players"].append(AI_PLAYER_ID)
+            game["ai_level"] = level
+            game["started"] = True
+            game["turn_count"] = 1
+        save_game(group_id)
+
+        if vs_ai:
+            notify(
+                group_id, game,
+                f"人机对局（{geometry.label}，{level}）已创建！玩家 {user_id} 执黑棋 ● (染色区：红)，AI 执白棋 ○ (染色区：蓝)。",
+            )
+            return
+
     await chess.finish(
-        f"新对局已创建！玩家 {user_id} 自动执黑棋 ● (染色区：红)。\n"
+        f"新对局（{geometry.label}）已创建！玩家 {user_id} 自动执黑棋 ● (染色区：红)。\n"
         "请另一位玩家使用【加入游戏】命令参与 (执白棋 ○, 染色区：蓝)。"
     )
 
@@ -420,29 +343,32 @@ async def handle_join(event: Event):
         await join_cmd.finish("请在群聊中使用此命令。")
     user_id = event.get_user_id()
 
-    if group_id not in games or games[group_id]["game_over"]:
-        await join_cmd.finish("当前没有可加入的对局，请先使用【合群之落】创建。")
-    
-    game = games[group_id]
-    
-    if game["started"]:
-        await join_cmd.finish("对局已经开始，无法加入。")
-    
-    if len(game["players"]) >= 2:
-        await join_cmd.finish("对局人数已满（2人）。")
-    
-    if user_id in game["players"]:
-        await join_cmd.finish("您已经在对局中。")
-    
-    game["players"].append(user_id)
-    await join_cmd.send(f"玩家 {user_id} 加入成功，执白棋 ○ (染色区：蓝)。\n当前人数：{len(game['players'])}/2。")
-    
-    if len(game["players"]) == 2:
-        game["started"] = True
-        game["current_player_idx"] = 0 # 黑棋先手
-        game["turn_count"] = 1
-        await join_cmd.send("人数已满，游戏开始！")
-        await send_turn_message(group_id)
+    async with group_lock(group_id):
+        await load_game(group_id)
+        if group_id not in games or games[group_id]["game_over"]:
+            await join_cmd.finish("当前没有可加入的对局，请先使用【合群之落】创建。")
+
+        game = games[group_id]
+
+        if game["started"]:
+            await join_cmd.finish("对局已经开始，无法加入。")
+
+        if len(game["players"]) >= 2:
+            await join_cmd.finish("对局人数已满（2人）。")
+
+        if user_id in game["players"]:
+            await join_cmd.finish("您已经在对局中。")
+
+        game["players"].append(user_id)
+        if len(game["players"]) == 2:
+            game["started"] = True
+            game["current_player_idx"] = 0 # 黑棋先手
+            game["turn_count"] = 1
+        save_game(group_id)
+        await join_cmd.send(f"玩家 {user_id} 加入成功，执白棋 ○ (染色区：蓝)。\n当前人数：{len(game['players'])}/2。")
+
+        if game["started"]:
+            notify(group_id, game, "人数已满，游戏开始！")
 
 @place_cmd.handle()
 async def handle_place(event: Event, arg: Message = CommandArg()):
@@ -450,55 +376,60 @@ async def handle_place(event: Event, arg: Message = CommandArg()):
     if group_id is None:
         await place_cmd.finish("请在群聊中使用此命令。")
     user_id = event.get_user_id()
-    
+
     coord_str = arg.extract_plain_text().strip()
     if not coord_str:
         await place_cmd.finish("请指定落子坐标，例如：落子 A1")
 
-    if group_id not in games:
-        await place_cmd.finish("当前没有进行中的对局。")
-    game = games[group_id]
-    
-    if not game["started"]:
-        await place_cmd.finish("对局尚未开始或人数未满。")
-    if game["game_over"]:
-        await place_cmd.finish("对局已结束。")
-    if user_id not in game["players"]:
-        await place_cmd.finish("您不是当前对局的玩家。")
-    if user_id != game["players"][game["current_player_idx"]]:
-        await place_cmd.finish("现在不是您的回合。")
-
-    pos = coord_to_index(coord_str)
-    if not pos:
-        await place_cmd.finish("坐标格式错误，请使用字母+数字的格式（如A1, J10）。")
-    row, col = pos
-    
-    if game["board"][row][col]["occupied"]:
-        await place_cmd.finish(f"位置 {coord_str.upper()} 已有棋子，请选择其他位置。")
-
-    # 执行落子
-    current_player_id = game["players"][game["current_player_idx"]]
-    game["board"][row][col]["occupied"] = current_player_id
-    
-    # 检测三连并染色
-    # player_id for coloring is the user_id of the current player
-    affected_cells = check_three_in_line(game["board"], current_player_id, (row, col))
-    if affected_cells:
-        apply_color(game["board"], current_player_id, affected_cells)
-        await place_cmd.send(f"玩家 {current_player_id} 形成三连，在 {len(affected_cells)} 个格子染色！")
-
-    # 检查棋盘是否已满
-    occupied_count = sum(1 for r_ in game["board"] for cell in r_ if cell["occupied"])
-    if occupied_count == 100: # 10x10 board
-        await end_game(group_id)
-        return
-    
-    # 切换玩家
-    game["current_player_idx"] = 1 - game["current_player_idx"]
-    if game["current_player_idx"] == 0 : # New turn starts when black (player 0) is to play
-        game["turn_count"] +=1
-
-    await send_turn_message(group_id)
+    # 校验、落子、染色与 notify 登记在锁内，连续两条落子消息不会交错；出图与发送由 RenderCoalescer 在锁外完成
+    async with group_lock(group_id):
+        await load_game(group_id)
+        if group_id not in games:
+            await place_cmd.finish("当前没有进行中的对局。")
+        game = games[group_id]
+
+        if not game["started"]:
+            await place_cmd.finish("对局尚未开始或人数未满。")
+        if game["game_over"]:
+            await place_cmd.finish("对局已结束。")
+        if is_ai_turn(game):  # 例如重启前 AI 还没来得及应手
+            await ai_move(group_id)
+            if group_id not in games:
+                return
+        if user_id not in game["players"]:
+            await place_cmd.finish("您不是当前对局的玩家。")
+        if user_id != game["players"][game["current_player_idx"]]:
+            await place_cmd.finish("现在不是您的回合。")
+
+        board = game["board"]
+        pos = coord_to_index(coord_str, board.geometry)
+        if not pos:
+            last = board.geometry.size - 1
+            await place_cmd.finish(f"坐标格式错误，请使用字母+数字的格式（如A1, {coord_name(last, last)}）。")
+        row, col = pos
+
+        if board.owner(row, col):
+            await place_cmd.finish(f"位置 {coord_str.upper()} 已有棋子，请选择其他位置。")
+
+        # 执行落子：检测连子并染色，未满时切换玩家
+        player_idx = game["current_player_idx"]
+        current_player_id = game["players"][player_idx]
+        affected_mask = play_move(game, row, col)
+        if store is not None:
+            store.record_move(group_id, game, player_idx, row, col)
+        notify(
+            group_id, game,
+            f"玩家 {current_player_id} 形成{board.geometry.line_name}，在 {popcount(affected_mask)} 个格子染色！"
+            if affected_mask else None,
+        )
+
+        # 检查棋盘是否已满（落子数增量维护）
+        if board.is_full():
+            await end_game(group_id)
+            return
+
+        if is_ai_turn(game):
+            await ai_move(group_id)
 
 
 @end_game_cmd.handle()
@@ -508,26 +439,189 @@ async def handle_end_game_cmd(event: Event): # Renamed to avoid conflict
         await end_game_cmd.finish("请在群聊中使用此命令。")
     user_id = event.get_user_id()
 
-    if group_id not in games:
-        await end_game_cmd.finish("当前没有进行中的对局。")
-    game = games[group_id]
-    
-    if user_id not in game["players"]:
-        await end_game_cmd.finish("您不是当前对局的玩家，无法结束游戏。")
-    
-    # Call the main end_game logic
-    await end_game(group_id, ended_by_user_id=user_id)
-    # end_game now sends the message, so no need to send here unless for specific "认输" text
-    # await end_game_cmd.send(f"玩家 {user_id} 已选择结束/认输。") # end_game handles this now.
+    async with group_lock(group_id):
+        await load_game(group_id)
+        if group_id not in games:
+            await end_game_cmd.finish("当前没有进行中的对局。")
+        game = games[group_id]
+
+        if user_id not in game["players"]:
+            await end_game_cmd.finish("您不是当前对局的玩家，无法结束游戏。")
+
+        # Call the main end_game logic
+        await end_game(group_id, ended_by_user_id=user_id)
+        # end_game now sends the message, so no need to send here unless for specific "认输" text
+        # await end_game_cmd.send(f"玩家 {user_id} 已选择结束/认输。") # end_game handles this now.
+
+@undo_cmd.handle()
+async def handle_undo(event: Event):
+    group_id = getattr(event, "group_id", None)
+    if group_id is None:
+        await undo_cmd.finish("请在群聊中使用此命令。")
+    user_id = event.get_user_id()
+
+    async with group_lock(group_id):
+        await load_game(group_id)
+        game = games.get(group_id)
+        if game is None or not game["started"] or game["game_over"]:
+            await undo_cmd.finish("当前没有进行中的对局。")
+
+        mover = last_mover(game)
+        if mover is None:
+            await undo_cmd.finish("还没有落子，无棋可悔。")
+        undo_count = 1
+        if game["ai_level"] and game["players"][mover] == AI_PLAYER_ID:
+            mover, undo_count = 1 - mover, 2  # 人机对局：连同 AI 的应手一起撤回
+        if user_id != game["players"][mover]:
+            await undo_cmd.finish("只能在对手落子前撤回自己的上一手。")
+
+        # 按记录的染色变化逆向撤销，只改动这一手涉及的格子
+        undone = [coord_name(*undo_move(game)) for _ in range(undo_count)]
+        save_game(group_id)
+        notify(group_id, game, f"玩家 {user_id} 悔棋，撤回了 {'、'.join(reversed(undone))}。")
+
+@record_cmd.handle()
+async def handle_record(event: Event):
+    group_id = getattr(event, "group_id", None)
+    if group_id is None:
+        await record_cmd.finish("请在群聊中使用此命令。")
+
+    async with group_lock(group_id):
+        await load_game(group_id)
+        if group_id in games and games[group_id]["started"]:
+            record = export_record(games[group_id])
+        elif group_id in finished_records:
+            record = finished_records[group_id]
+        else:
+            await record_cmd.finish("当前没有可以导出的棋谱。")
+
+    await record_cmd.finish(record)
+
+@mode_cmd.handle()
+async def handle_mode(event: Event, arg: Message = CommandArg()):
+    group_id = getattr(event, "group_id", None)
+    if group_id is None:
+        await mode_cmd.finish("请在群聊中使用此命令。")
+
+    names = {mode: name for name, mode in BOARD_MODE_NAMES.items()}
+    choice = arg.extract_plain_text().strip()
+    if not choice:
+        current = names.get(board_modes.get(group_id, BOARD_MODE), "图片")
+        await mode_cmd.finish(f"本群当前为{current}模式。用法：棋盘模式 [{'|'.join(BOARD_MODE_NAMES)}]")
+    if choice not in BOARD_MODE_NAMES:
+        await mode_cmd.finish(f"无法识别的模式：{choice}。用法：棋盘模式 [{'|'.join(BOARD_MODE_NAMES)}]")
+
+    board_modes[group_id] = BOARD_MODE_NAMES[choice]
+    await mode_cmd.finish(f"已切换为{choice}模式，下一次棋盘起生效。")
+
+def _win_rate(record: dict) -> str:
+    return f"{record['wins'] / record['games']:.0%}" if record["games"] else "-"
+
+@rank_cmd.handle()
+async def handle_rank(event: Event, arg: Message = CommandArg()):
+    group_id = getattr(event, "group_id", None)
+    if group_id is None:
+        await rank_cmd.finish("请在群聊中使用此命令。")
+    if store is None:
+        await rank_cmd.finish("未开启对局存档（hequn_persist），没有战绩记录。")
+
+    # 合群排行：本群 Elo 前十；合群排行 @某人 / QQ号：该玩家的战绩及与自己的交手记录
+    target = next((str(seg.data["qq"]) for seg in arg if seg.type == "at"), None)
+    target = target or arg.extract_plain_text().strip() or None
+    if target is None:
+        board = await store.leaderboard(group_id)
+        if not board:
+            await rank_cmd.finish("本群还没有完成的对局。")
+        lines = ["合群之落排行（Elo）："]
+        for rank, record in enumerate(board, 1):
+            lines.append(
+                f"{rank}. {record['player_id']}  {record['rating']:.0f}  "
+                f"{record['games']} 局 {record['wins']} 胜 {record['losses']} 负 {record['draws']} 平  胜率 {_win_rate(record)}"
+            )
+        await rank_cmd.finish("\n".join(lines))
+
+    user_id = event.get_user_id()
+    record = await store.player_record(group_id, target, user_id)
+    if record is None:
+        await rank_cmd.finish(f"玩家 {target} 在本群还没有完成的对局。")
+    lines = [
+        f"玩家 {target}：Elo {record['rating']:.0f}（第 {record['rank']} 名）",
+        f"{record['games']} 局 {record['wins']} 胜 {record['losses']} 负 {record['draws']} 平，胜率 {_win_rate(record)}",
+    ]
+    versus = record.get("versus")
+    if versus and versus["wins"] + versus["losses"] + versus["draws"]:
+        # versus 是 target 视角，这里换成提问者视角
+        lines.append(f"与你交手：你 {versus['losses']} 胜 {versus['wins']} 负 {versus['draws']} 平")
+    await rank_cmd.finish("\n".join(lines))
 
 @force_stop_cmd.handle()
 async def handle_force_stop(event: Event):
     group_id = getattr(event, "group_id", None)
     if group_id is None:
         await force_stop_cmd.finish("请在群聊中使用此命令。")
-        
-    if group_id in games:
-        del games[group_id]
-        await force_stop_cmd.send("管理员已强制终止当前对局。")
-    else:
-        await force_stop_cmd.finish("当前没有进行中的对局。")
\ No newline at end of file
+
+    async with group_lock(group_id):
+        await load_game(group_id)
+        if group_id in games:
+            drop_game(group_id)
+            if group_id in _coalescers:
+                _coalescers[group_id].discard()
+            await force_stop_cmd.send("管理员已强制终止当前对局。")
+        else:
+            await force_stop_cmd.finish("当前没有进行中的对局。")
+
+
+driver = get_driver()
+
+
+@driver.on_startup
+async def _start_store():
+    if store is not None:
+        store.start()
+
+
+def _new_ai_executor() -> Executor:
+    if AI_EXECUTOR == "process":
+        # 不用 fork：事件循环所在进程里已有存档、出图等线程，fork 出的子进程可能继承被持有的锁
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        return ProcessPoolExecutor(AI_WORKERS, mp_context=multiprocessing.get_context(method))
+    return ThreadPoolExecutor(AI_WORKERS, thread_name_prefix="hequn-ai")
+
+
+def _replace_ai_executor(broken: Executor):
+    """进程池损坏后换一个新的；多个群同时发现时只换一次"""
+    global ai_executor
+    if ai_executor is broken:
+        ai_executor = _new_ai_executor()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+
+@driver.on_startup
+async def _start_ai_executor():
+    global ai_executor
+    ai_executor = _new_ai_executor()
+    if isinstance(ai_executor, ProcessPoolExecutor):
+        # 启动时先算一手：工作进程要重新导入主模块与本插件（主模块需像 bot.py 那样初始化 NoneBot 并加载插件），
+        # 导入失败时改用线程池，而不是等到第一局人机对局才发现
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                ai_executor, choose_move, 0, 0, 0, 0, 1, 0.0, 0, DEFAULT_GEOMETRY
+            )
+        except Exception as e:
+            logger.warning(f"hequn AI process pool unavailable, using threads instead: {e!r}")
+            ai_executor.shutdown(wait=False, cancel_futures=True)
+            ai_executor = ThreadPoolExecutor(AI_WORKERS, thread_name_prefix="hequn-ai")
+
+
+@driver.on_shutdown
+async def _close_store():
+    # 先发完排队中的棋盘消息，再关闭存档
+    await asyncio.gather(*(c.wait() for c in _coalescers.values()), return_exceptions=True)
+    if store is not None:
+        await store.close()
+
+
+@driver.on_shutdown
+async def _close_ai_executor():
+    if ai_executor is not None:
+        ai_executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,164 @@
+"""合群之落 AI：在位棋盘上做迭代加深的 alpha-beta（negamax）搜索，可直接交给进程池执行。"""
+import random
+import time
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from .engine import DEFAULT_GEOMETRY, Geometry, popcount
+
+# 难度 -> (最大搜索深度, 每手时间预算秒)
+LEVELS = {
+    "简单": (1, 0.3),
+    "普通": (2, 1.0),
+    "困难": (4, 2.5),
+}
+DEFAULT_LEVEL = "普通"
+
+_WIN = 10_000
+
+
+class _Timeout(Exception):
+    pass
+
+
+@lru_cache(maxsize=None)
+def _edges(geometry: Geometry) -> Tuple[int, int, int]:
+    """(去掉第 0 列的掩码, 去掉最后一列的掩码, 中心格下标)"""
+    size, full = geometry.size, geometry.full_mask
+    not_left = full & ~sum(1 << (r * size) for r in range(size))
+    not_right = full & ~sum(1 << (r * size + size - 1) for r in range(size))
+    return not_left, not_right, (size // 2) * size + size // 2
+
+
+def _completes(lines, stones: int, cell: int) -> bool:
+    """stones（已含 cell）是否在 cell 处成连"""
+    for line, _ in lines[cell]:
+        if stones & line == line:
+            return True
+    return False
+
+
+def _gain(lines, stones: int, cell: int) -> int:
+    """stones（已含 cell）在 cell 处形成的连子对应的染色区域"""
+    mask = 0
+    for line, area in lines[cell]:
+        if stones & line == line:
+            mask |= area
+    return mask
+
+
+class _Search:
+    __slots__ = ("deadline", "nodes", "lines", "size", "full", "not_left", "not_right", "center")
+
+    def __init__(self, deadline: float, geometry: Geometry):
+        self.deadline = deadline
+        self.nodes = 0
+        self.lines = geometry.lines
+        self.size = geometry.size
+        self.full = geometry.full_mask
+        self.not_left, self.not_right, self.center = _edges(geometry)
+
+    def candidates(self, occupied: int) -> int:
+        """候选着法：已有棋子周围一格内的空格（占用掩码向八个方向各扩张一格）；空棋盘时只考虑中心"""
+        if not occupied:
+            return 1 << self.center
+        horizontal = occupied | ((occupied << 1) & self.not_left) | ((occupied >> 1) & self.not_right)
+        return (horizontal | (horizontal << self.size) | (horizontal >> self.size)) & self.full & ~occupied
+
+    def move_tiers(self, me: int, op: int, occupied: int) -> Tuple[int, int, int]:
+        """候选着法分三档的位掩码：本方落下即成连、对方落下会成连（阻挡）、其余"""
+        lines = self.lines
+        moves = self.candidates(occupied)
+        mine = theirs = 0
+        rest = moves
+        while rest:
+            low = rest & -rest
+            cell = low.bit_length() - 1
+            rest ^= low
+            if _completes(lines, me | low, cell):
+                mine |= low
+            elif _completes(lines, op | low, cell):
+                theirs |= low
+        return mine, theirs, moves & ~(mine | theirs)
+
+    def negamax(self, me: int, op: int, my_colors: int, op_colors: int, occupied: int,
+                depth: int, alpha: int, beta: int) -> int:
+        self.nodes += 1
+        if self.nodes & 255 == 0 and time.perf_counter() > self.deadline:
+            raise _Timeout
+        if occupied == self.full:
+            diff = popcount(my_colors) - popcount(op_colors)
+            return _WIN + diff if diff > 0 else -_WIN + diff if diff < 0 else 0
+        if depth == 0:
+            return popcount(my_colors) - popcount(op_colors)
+
+        best = -_WIN * 2
+        for tier in self.move_tiers(me, op, occupied):
+            while tier:
+                bit = tier & -tier
+                tier ^= bit
+                cell = bit.bit_length() - 1
+                stones = me | bit
+                paint = _gain(self.lines, stones, cell)
+                if paint:
+                    value = -self.negamax(op, stones, op_colors & ~paint, my_colors | paint, occupied | bit,
+                                          depth - 1, -beta, -alpha)
+                else:
+                    value = -self.negamax(op, stones, op_colors, my_colors, occupied | bit,
+                                          depth - 1, -beta, -alpha)
+                if value > best:
+                    best = value
+                    if value > alpha:
+                        alpha = value
+                        if alpha >= beta:
+                            return best
+        return best
+
+
+def choose_move(me: int, op: int, my_colors: int, op_colors: int,
+                max_depth: int, time_budget: float, seed: Optional[int] = None,
+                geometry: Geometry = DEFAULT_GEOMETRY) -> int:
+    """
+    返回 AI（落子 me、染色 my_colors）的着法格子下标。
+    在 time_budget 秒内从 1 层开始迭代加深到 max_depth；max_depth == 1 时带少量随机性（简单难度）。
+    """
+    occupied = me | op
+    if occupied == geometry.full_mask:
+        raise ValueError("board is full")
+    rng = random.Random(seed)
+    search = _Search(time.perf_counter() + time_budget, geometry)
+    # 根节点：先按档位、档内按本方可得染色降序排好，之后每层按上一层的估值重排
+    root = []
+    for tier in search.move_tiers(me, op, occupied):
+        cells = []
+        while tier:
+            low = tier & -tier
+            tier ^= low
+            cells.append(low.bit_length() - 1)
+        cells.sort(key=lambda cell: popcount(_gain(search.lines, me | 1 << cell, cell)), reverse=True)
+        root.extend(cells)
+    if not root:  # 候选为空（理论上不会发生），退回任意空格
+        return next(cell for cell in range(geometry.cells) if not occupied >> cell & 1)
+
+    best_cell = root[0]
+    for depth in range(1, max_depth + 1):
+        try:
+            alpha, scored = -_WIN * 2, []
+            for cell in root:
+                bit = 1 << cell
+                stones = me | bit
+                paint = _gain(search.lines, stones, cell)
+                value = -search.negamax(op, stones, op_colors & ~paint, my_colors | paint, occupied | bit,
+                                        depth - 1, -_WIN * 2, -alpha)
+                scored.append((value, cell))
+                alpha = max(alpha, value)
+        except _Timeout:
+            break
+        # 下一层先搜本层较好的着法，剪枝更充分
+        scored.sort(key=lambda item: item[0], reverse=True)
+        root = [cell for _, cell in scored]
+        best_cell = root[0]  # 排序稳定：同分时取先搜到的（精确值），其余同分者可能只是上界
+
+    if max_depth == 1 and rng.random() < 0.3:
+        best_cell = rng.choice(root)
+    return best_cell
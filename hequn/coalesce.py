@@ -0,0 +1,117 @@
+"""合群之落出图合并：每群一个 RenderCoalescer，在锁外只渲染最新局面，并把期间积累的文字合成一条消息发送。"""
+import asyncio
+import time
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from .game import render_view
+
+RenderFunc = Callable[[dict], Awaitable[Optional[bytes]]]
+SendFunc = Callable[[dict, List[str], Optional[bytes], bool], Awaitable[None]]
+
+
+class RenderCoalescer:
+    """
+    render(view) -> PNG 或 None；send(view, texts, image, final) 发送合并后的消息，final 表示终局结算。
+    lock 为该群的锁：快照前先取锁，保证看到的是某个处理器完整执行后的局面。
+    """
+
+    def __init__(self, lock: asyncio.Lock, render: RenderFunc, send: SendFunc,
+                 debounce: float = 0.0, max_wait: float = 1.0):
+        self.lock = lock
+        self.render = render
+        self.send = send
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self._pending_since: Optional[float] = None  # 上次发送后第一次 post 的时间
+        self._game: Optional[dict] = None
+        self._texts: List[str] = []
+        self._final = False
+        self._dirty = False
+        self._epoch = 0  # discard 时递增，正在渲染的图随之作废
+        self._finals: List[Tuple[dict, dict, List[str]]] = []  # 待发的前一局结算：(对局, 终局快照, 文字)
+        self._task: Optional[asyncio.Task] = None
+        # 指标
+        self.posts = 0
+        self.renders = 0
+        self.dropped = 0
+        self.sends = 0
+
+    def post(self, game: dict, text: Optional[str] = None, final: bool = False):
+        """登记一次局面变化（可附带文字）；final=True 时这一条作为终局结算发送，不再提示下一手"""
+        self.posts += 1
+        if self._final and self._game is not game:
+            # 前一局的结算还没发出：连同它的终局快照一起单独排队（调用方持有锁，快照是完整局面）
+            self._finals.append((self._game, render_view(self._game), self._texts))
+            self._texts = []
+            self._dirty = self._final = False
+        if self._pending_since is None:
+            self._pending_since = time.monotonic()
+        if text:
+            self._texts.append(text)
+        self._game = game
+        self._final = self._final or final
+        self._dirty = True
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def discard(self):
+        """丢弃尚未发出的文字和图（例如对局被强制关闭）"""
+        self._texts = []
+        self._dirty = self._final = False
+        self._pending_since = None
+        self._epoch += 1
+
+    async def _send_final(self):
+        game, view, texts = self._finals.pop(0)
+        image = await self.render(view)
+        self.renders += 1
+        await self.send(view, texts, image, True)
+        self.sends += 1
+
+    def _requeue(self, game: dict, texts: List[str]):
+        """过时的图不发，文字并入同一局的下一条消息：当前局的待发文字，或已排队的该局结算"""
+        for pending_game, _, pending_texts in self._finals:
+            if pending_game is game:
+                pending_texts[:0] = texts
+                return
+        self._texts[:0] = texts
+
+    async def _run(self):
+        while self._dirty or self._finals:
+            if self._finals:
+                await self._send_final()
+                continue
+            if self.debounce:
+                await asyncio.sleep(self.debounce)
+            async with self.lock:
+                game, final, epoch = self._game, self._final, self._epoch
+                texts, self._texts = self._texts, []
+                since, self._pending_since = self._pending_since, None
+                self._dirty = self._final = False
+                view = render_view(game)
+            image = await self.render(view)
+            self.renders += 1
+            if game.get("canvas") is None:
+                game["canvas"] = view.get("canvas")  # 首次出图创建的画布缓存留给这局之后复用
+            if epoch != self._epoch:
+                continue
+            if self._finals and not final:
+                # 渲染期间这局已经结束：过时的图不发，文字随结算一起发
+                self._requeue(game, texts)
+                self.dropped += 1
+                continue
+            if self._dirty and not final and time.monotonic() - since < self.max_wait:
+                # 渲染期间局面又变了：这张图已经过时，文字并入下一张一起发，等待时间仍从最早一次 post 算起
+                self._requeue(game, texts)
+                self._pending_since = since
+                self.dropped += 1
+                continue
+            if self._dirty:
+                self._pending_since = time.monotonic()
+            await self.send(view, texts, image, final)
+            self.sends += 1
+
+    async def wait(self):
+        """等待已登记的消息全部发出（关闭时、基准脚本中使用）"""
+        while self._task is not None and not self._task.done():
+            await asyncio.shield(self._task)
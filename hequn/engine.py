@@ -0,0 +1,268 @@
+"""
+合群之落棋盘引擎。
+
+棋盘用整数位棋盘表示：第 r 行第 c 列对应第 ``r * size + c`` 位。
+每位玩家各有一张落子位棋盘和一张染色位棋盘，落子数与染色得分随落子/染色增量维护，
+连子检测使用预先计算好的掩码表，不再逐格扫描字典。
+
+棋盘规格（边长、几连、染色半径）由 ``Geometry`` 描述，掩码表按规格只生成一次、所有对局共享
+（``get_geometry`` 带缓存）。每手只查落子格所在的至多 4 * 连子数 条连线，单手开销与棋盘面积无关。
+``SIZE`` / ``CELLS`` / ``FULL_MASK`` / ``LINES`` 等模块常量对应默认的 10x10 三连规格。
+"""
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# 四个基础方向：水平, 垂直, 主对角线, 副对角线
+_DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+LINE_NAMES = {3: "三连", 4: "四连", 5: "五连"}
+MAX_SIZE = 26  # 列坐标用 A-Z 表示
+
+
+class Geometry:
+    """
+    棋盘规格与对应的掩码表：
+    - lines[cell]：经过该格的全部连线 (连线掩码, 染色区域掩码)；
+      染色区域是连线内部棋子（去掉两端）周围 radius 格的并集，三连即以中间子为中心的九宫格；
+    - areas[cell]：以该格为中心、边长 2 * radius + 1 的方形区域。
+    用 ``get_geometry`` 获取共享实例；pickle 时只传规格参数（交给进程池时不复制掩码表）。
+    """
+
+    __slots__ = ("size", "line_length", "radius", "cells", "full_mask", "lines", "areas")
+
+    def __init__(self, size: int, line_length: int, radius: int):
+        if not 3 <= line_length <= size <= MAX_SIZE or radius < 0:
+            raise ValueError(f"unsupported board geometry {size}x{size}, {line_length} in a row, radius {radius}")
+        self.size = size
+        self.line_length = line_length
+        self.radius = radius
+        self.cells = size * size
+        self.full_mask = (1 << self.cells) - 1
+        self.areas = tuple(self._square(r, c) for r in range(size) for c in range(size))
+        self.lines = self._build_lines()
+
+    def __reduce__(self):
+        return get_geometry, (self.size, self.line_length, self.radius)
+
+    def __repr__(self):
+        return f"Geometry({self.size}, {self.line_length}, {self.radius})"
+
+    @property
+    def line_name(self) -> str:
+        return LINE_NAMES.get(self.line_length, f"{self.line_length}连")
+
+    @property
+    def label(self) -> str:
+        """棋谱与提示中使用的规格名，如 ``15x15 四连``"""
+        text = f"{self.size}x{self.size} {self.line_name}"
+        return text if self.radius == 1 else f"{text} 半径{self.radius}"
+
+    def _square(self, row: int, col: int) -> int:
+        area = 0
+        for nr in range(max(0, row - self.radius), min(self.size, row + self.radius + 1)):
+            for nc in range(max(0, col - self.radius), min(self.size, col + self.radius + 1)):
+                area |= 1 << (nr * self.size + nc)
+        return area
+
+    def _build_lines(self) -> Tuple[Tuple[Tuple[int, int], ...], ...]:
+        size, length = self.size, self.line_length
+        lines: List[List[Tuple[int, int]]] = [[] for _ in range(self.cells)]
+        for r in range(size):
+            for c in range(size):
+                for dr, dc in _DIRECTIONS:
+                    cells = [(r + k * dr, c + k * dc) for k in range(length)]
+                    if not all(0 <= cr < size and 0 <= cc < size for cr, cc in cells):
+                        continue
+                    mask = area = 0
+                    for cr, cc in cells:
+                        mask |= 1 << (cr * size + cc)
+                    for cr, cc in cells[1:-1]:
+                        area |= self.areas[cr * size + cc]
+                    for cr, cc in cells:
+                        lines[cr * size + cc].append((mask, area))
+        return tuple(tuple(l) for l in lines)
+
+
+@lru_cache(maxsize=None)
+def _cached_geometry(size: int, line_length: int, radius: int) -> Geometry:
+    return Geometry(size, line_length, radius)
+
+
+def get_geometry(size: int = 10, line_length: int = 3, radius: int = 1) -> Geometry:
+    """按规格获取共享的 Geometry（掩码表每种规格只生成一次）"""
+    return _cached_geometry(int(size), int(line_length), int(radius))
+
+
+DEFAULT_GEOMETRY = get_geometry()
+SIZE = DEFAULT_GEOMETRY.size
+CELLS = DEFAULT_GEOMETRY.cells
+FULL_MASK = DEFAULT_GEOMETRY.full_mask
+LINES = DEFAULT_GEOMETRY.lines
+AREAS = DEFAULT_GEOMETRY.areas
+
+
+def popcount(mask: int) -> int:
+    return bin(mask).count("1")
+
+
+def mask_to_positions(mask: int, geometry: Geometry = DEFAULT_GEOMETRY) -> Set[Tuple[int, int]]:
+    """位掩码 -> 坐标集合 {(row, col)}"""
+    positions = set()
+    while mask:
+        low = mask & -mask
+        idx = low.bit_length() - 1
+        positions.add(divmod(idx, geometry.size))
+        mask ^= low
+    return positions
+
+
+def coord_name(row: int, col: int) -> str:
+    """(row, col) -> 棋盘坐标，如 (0, 0) -> A1"""
+    return f"{chr(ord('A') + col)}{row + 1}"
+
+
+def coord_to_index(coord: str, geometry: Geometry = DEFAULT_GEOMETRY) -> Optional[Tuple[int, int]]:
+    """坐标转换（带严格校验），如 A1 -> (0, 0)；格式错误或越界时返回 None"""
+    if not coord or len(coord) < 2:
+        return None
+    col_str = coord[0].upper()
+    row_str = coord[1:]
+    if not (col_str.isalpha() and row_str.isdigit()):
+        return None
+    try:
+        row = int(row_str) - 1
+    except ValueError:  # isdigit 也接受 "²" 之类 int() 不认的字符
+        return None
+    col = ord(col_str) - ord("A")
+    if 0 <= col < geometry.size and 0 <= row < geometry.size:
+        return (row, col)
+    return None
+
+
+def positions_to_mask(positions: Iterable[Tuple[int, int]], geometry: Geometry = DEFAULT_GEOMETRY) -> int:
+    mask = 0
+    for r, c in positions:
+        mask |= 1 << (r * geometry.size + c)
+    return mask
+
+
+class Board:
+    """位棋盘：落子/染色按玩家 ID 分别存一个整数，计数器增量更新"""
+
+    __slots__ = ("geometry", "stones", "colors", "scores", "occupied", "occupied_count")
+
+    def __init__(self, geometry: Geometry = DEFAULT_GEOMETRY):
+        self.geometry = geometry
+        self.stones: Dict[str, int] = {}  # 玩家 ID -> 落子位棋盘
+        self.colors: Dict[str, int] = {}  # 玩家 ID -> 染色位棋盘
+        self.scores: Dict[str, int] = {}  # 玩家 ID -> 染色格数
+        self.occupied = 0                 # 所有落子的并集
+        self.occupied_count = 0
+
+    def copy(self) -> "Board":
+        board = Board(self.geometry)
+        board.stones = dict(self.stones)
+        board.colors = dict(self.colors)
+        board.scores = dict(self.scores)
+        board.occupied = self.occupied
+        board.occupied_count = self.occupied_count
+        return board
+
+    def is_full(self) -> bool:
+        return self.occupied == self.geometry.full_mask
+
+    def score(self, player_id: str) -> int:
+        return self.scores.get(player_id, 0)
+
+    def owner(self, row: int, col: int) -> Optional[str]:
+        """该格上的棋子属于谁，空格返回 None"""
+        bit = 1 << (row * self.geometry.size + col)
+        if not self.occupied & bit:
+            return None
+        for player_id, stones in self.stones.items():
+            if stones & bit:
+                return player_id
+        return None
+
+    def color(self, row: int, col: int) -> Optional[str]:
+        """该格被谁染色，未染色返回 None"""
+        bit = 1 << (row * self.geometry.size + col)
+        for player_id, colors in self.colors.items():
+            if colors & bit:
+                return player_id
+        return None
+
+    def place(self, player_id: str, row: int, col: int):
+        """落子（调用方需保证该格为空）"""
+        bit = 1 << (row * self.geometry.size + col)
+        self.stones[player_id] = self.stones.get(player_id, 0) | bit
+        self.occupied |= bit
+        self.occupied_count += 1
+
+    def paint(self, player_id: str, mask: int) -> Tuple[int, int]:
+        """
+        将 mask 内的格子染成 player_id 的颜色，覆盖对手原有染色。
+        返回染色变化 (gained, stolen)：新染上的格子，以及其中原属于对手的格子。
+        """
+        stolen = 0
+        for other_id, colors in self.colors.items():
+            if other_id != player_id and colors & mask:
+                stolen |= colors & mask
+                self.scores[other_id] -= popcount(colors & mask)
+                self.colors[other_id] = colors & ~mask
+        own = self.colors.get(player_id, 0)
+        gained = mask & ~own
+        if gained:
+            self.colors[player_id] = own | gained
+            self.scores[player_id] = self.scores.get(player_id, 0) + popcount(gained)
+        return gained, stolen
+
+    def unplace(self, player_id: str, row: int, col: int):
+        """撤销一次落子"""
+        bit = 1 << (row * self.geometry.size + col)
+        self.stones[player_id] &= ~bit
+        self.occupied &= ~bit
+        self.occupied_count -= 1
+
+    def unpaint(self, player_id: str, gained: int, stolen: int, victim_id: Optional[str]):
+        """按 paint 返回的变化撤销染色：gained 退回未染色，其中 stolen 部分还给 victim_id"""
+        if gained:
+            self.colors[player_id] &= ~gained
+            self.scores[player_id] -= popcount(gained)
+        if stolen and victim_id is not None:
+            self.colors[victim_id] = self.colors.get(victim_id, 0) | stolen
+            self.scores[victim_id] = self.scores.get(victim_id, 0) + popcount(stolen)
+
+
+def three_in_line_mask(board: Board, player_id: str, last_move: Tuple[int, int]) -> int:
+    """
+    检测落子后形成的所有连子（默认三连），返回对应染色区域的位掩码。
+    以连子内部的棋子为中心染色（三连即中间子的九宫格），一次落子可能在多个方向上形成连子。
+    """
+    r, c = last_move
+    geometry = board.geometry
+    stones = board.stones.get(player_id, 0)
+    mask = 0
+    for line, area in geometry.lines[r * geometry.size + c]:
+        if stones & line == line:
+            mask |= area
+    return mask
+
+
+def check_three_in_line(board: Board, player_id: str, last_move: Tuple[int, int]) -> Set[Tuple[int, int]]:
+    """
+    检测落子后形成的所有三连，并返回对应的九宫格染色区域。
+
+    参数：
+        board: 棋盘
+        player_id: 当前玩家ID (实际是 user_id)
+        last_move: 最新落子坐标 (row, col)
+
+    返回：
+        需要染色的格子坐标集合
+    """
+    return mask_to_positions(three_in_line_mask(board, player_id, last_move), board.geometry)
+
+
+def apply_color(board: Board, player_id: str, positions: Set[Tuple[int, int]]):
+    """应用颜色"""
+    board.paint(player_id, positions_to_mask(positions, board.geometry))
@@ -0,0 +1,188 @@
+"""
+合群之落的对局状态与落子规则，不涉及消息收发。
+
+一局对局用 dict 表示（即插件中的 ``games[group_id]``）；落子流程集中在 ``play_move``，
+命令处理、存档回放、棋谱重放都走同一套规则。``seq`` 在每次持久化的状态变更时递增，用于对齐快照与落子日志。
+
+每局还带一份 ``MoveHistory``：每手一个格子下标（``array("H")``，19x19 的 361 格也放得下），
+外加该手的染色变化，悔棋时按变化逆向撤销，只触及这一手改动过的格子。
+"""
+import re
+from array import array
+from typing import List, Optional, Sequence, Tuple
+
+from .engine import DEFAULT_GEOMETRY, LINE_NAMES, Board, Geometry, coord_name, get_geometry, three_in_line_mask
+
+
+class MoveHistory:
+    """落子序列（array("H")，每手一个格子下标）与对应的染色变化 (gained, stolen)"""
+
+    __slots__ = ("cells", "deltas")
+
+    def __init__(self):
+        self.cells = array("H")
+        self.deltas: List[Tuple[int, int]] = []
+
+    def __len__(self):
+        return len(self.cells)
+
+    def push(self, cell: int, gained: int, stolen: int):
+        self.cells.append(cell)
+        self.deltas.append((gained, stolen))
+
+    def pop(self) -> Tuple[int, int, int]:
+        gained, stolen = self.deltas.pop()
+        return self.cells.pop(), gained, stolen
+
+
+def new_game(geometry: Geometry = DEFAULT_GEOMETRY) -> dict:
+    return {
+        "board": Board(geometry),
+        "players": [],  # [player1_id, player2_id]
+        "current_player_idx": 0,  # 0 for players[0], 1 for players[1]
+        "started": False,
+        "game_over": False,
+        "turn_count": 0,
+        "seq": 0,
+        "history": MoveHistory(),
+        "ai_level": None,  # 人机对局时为 AI 难度名
+    }
+
+
+def render_view(game: dict) -> dict:
+    """
+    出图用的快照：复制棋盘（几个整数）与信息栏字段，渲染期间对局继续变化也不影响这张图。
+    画布缓存 ``canvas`` 与对局共用，同一局同一时间只应有一个渲染在用它。
+    """
+    return {
+        "board": game["board"].copy(),
+        "players": list(game["players"]),
+        "current_player_idx": game["current_player_idx"],
+        "turn_count": game["turn_count"],
+        "game_over": game["game_over"],
+        "canvas": game.get("canvas"),
+    }
+
+
+def play_move(game: dict, row: int, col: int) -> int:
+    """
+    当前玩家在 (row, col) 落子（调用方需保证轮次正确且该格为空）：
+    检测三连并染色，棋盘未满时交换行棋方。返回本手染色区域的位掩码。
+    """
+    board = game["board"]
+    player_id = game["players"][game["current_player_idx"]]
+    board.place(player_id, row, col)
+
+    affected_mask = three_in_line_mask(board, player_id, (row, col))
+    gained = stolen = 0
+    if affected_mask:
+        gained, stolen = board.paint(player_id, affected_mask)
+    game["history"].push(row * board.geometry.size + col, gained, stolen)
+
+    if not board.is_full():
+        game["current_player_idx"] = 1 - game["current_player_idx"]
+        if game["current_player_idx"] == 0:  # New turn starts when black (player 0) is to play
+            game["turn_count"] += 1
+    game["seq"] += 1
+    return affected_mask
+
+
+def last_mover(game: dict) -> Optional[int]:
+    """最后一手的行棋方（玩家下标），没有落子时返回 None"""
+    moves = len(game["history"])
+    return (moves - 1) % 2 if moves else None
+
+
+def undo_move(game: dict) -> Optional[Tuple[int, int]]:
+    """撤销最后一手，返回被撤销的 (row, col)；没有可撤销的落子时返回 None"""
+    history = game["history"]
+    if not history:
+        return None
+    mover = last_mover(game)
+    player_id = game["players"][mover]
+    victim_id = game["players"][1 - mover] if len(game["players"]) > 1 else None
+    cell, gained, stolen = history.pop()
+    board = game["board"]
+    row, col = divmod(cell, board.geometry.size)
+
+    board.unpaint(player_id, gained, stolen, victim_id)
+    board.unplace(player_id, row, col)
+
+    # 双方严格交替落子，轮次可由手数直接算出
+    moves = len(history)
+    game["current_player_idx"] = moves % 2
+    game["turn_count"] = moves // 2 + 1
+    game["seq"] += 1
+    return row, col
+
+
+# ---------- 棋谱 ----------
+_COORD = re.compile(r"\b([A-Z])(\d{1,2})\b")
+_LINE_LENGTHS = {name: length for length, name in LINE_NAMES.items()}
+
+
+def export_record(game: dict) -> str:
+    """导出可读棋谱：规格、玩家、逐手坐标与当前比分，parse_record 可解析"""
+    players = game["players"] + ["?"] * (2 - len(game["players"]))
+    board = game["board"]
+    size = board.geometry.size
+    lines = [f"合群之落 {board.geometry.label}", f"黑: {players[0]}", f"白: {players[1]}"]
+    cells = game["history"].cells
+    for turn in range(0, len(cells), 2):
+        pair = [coord_name(*divmod(cell, size)) for cell in cells[turn:turn + 2]]
+        lines.append(f"{turn // 2 + 1}. " + " ".join(pair))
+    lines.append(f"比分: 黑 {board.score(players[0])} : 白 {board.score(players[1])}")
+    return "\n".join(lines)
+
+
+def parse_geometry(label: str) -> Geometry:
+    """解析 Geometry.label 形式的规格名（如 ``15x15 四连``）；缺省部分取默认规格"""
+    size = re.search(r"(\d+)\s*[xX×]", label)
+    length = re.search(r"([三四五]连|(\d+)连)", label)
+    radius = re.search(r"半径\s*(\d+)", label)
+    return get_geometry(
+        int(size.group(1)) if size else DEFAULT_GEOMETRY.size,
+        (_LINE_LENGTHS.get(length.group(1)) or int(length.group(2))) if length else DEFAULT_GEOMETRY.line_length,
+        int(radius.group(1)) if radius else DEFAULT_GEOMETRY.radius,
+    )
+
+
+def parse_record(text: str) -> Tuple[List[str], List[int], Optional[Tuple[int, int]], Geometry]:
+    """解析 export_record 的输出，返回 (玩家, 逐手格子下标, 记录的比分或 None, 棋盘规格)"""
+    players = ["", ""]
+    cells: List[int] = []
+    score = None
+    geometry = DEFAULT_GEOMETRY
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("合群之落"):
+            geometry = parse_geometry(line[4:])
+        elif line.startswith("黑:"):
+            players[0] = line[2:].strip()
+        elif line.startswith("白:"):
+            players[1] = line[2:].strip()
+        elif line.startswith("比分:"):
+            numbers = re.findall(r"\d+", line)
+            score = (int(numbers[0]), int(numbers[1]))
+        elif re.match(r"\d+\.", line):
+            for col, row in _COORD.findall(line.split(".", 1)[1]):
+                r, c = int(row) - 1, ord(col) - ord("A")
+                if not (0 <= r < geometry.size and 0 <= c < geometry.size):
+                    raise ValueError(f"coordinate {col}{row} is off the board")
+                cells.append(r * geometry.size + c)
+    return players, cells, score, geometry
+
+
+def replay(players: List[str], cells: Sequence[int], geometry: Geometry = DEFAULT_GEOMETRY) -> dict:
+    """从空棋盘按顺序重放一串落子（无需 NoneBot），返回最终对局"""
+    game = new_game(geometry)
+    game["players"] = list(players)
+    game["started"] = True
+    game["turn_count"] = 1
+    board = game["board"]
+    for cell in cells:
+        row, col = divmod(cell, geometry.size)
+        if board.owner(row, col) is not None:
+            raise ValueError(f"{coord_name(row, col)} is already occupied")
+        play_move(game, row, col)
+    return game
@@ -0,0 +1,595 @@
+"""合群之落棋盘渲染：Pillow 增量合成（默认）、htmlrender 页面池回退与全角字符文字棋盘。"""
+import html
+import json
+import struct
+import threading
+import zlib
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from PIL import Image, ImageDraw, ImageFilter, ImageFont
+except ImportError:  # Pillow 未安装时只能走 htmlrender
+    Image = ImageDraw = ImageFilter = ImageFont = None
+
+from .engine import Geometry
+
+RASTER_AVAILABLE = Image is not None
+
+# 与 HTML 版本一致的画布与布局 (viewport 600x750)
+CANVAS_SIZE = (600, 750)
+BOARD_X = BOARD_Y = 70  # 棋盘左上角（左侧/上方各留 30px 坐标栏）
+BOARD_TARGET_PX = 500  # 棋盘区域边长，格子边长取 BOARD_TARGET_PX // 边长
+STONE_RATIO = 0.75
+
+PAGE_BG = "#f7f7f7"
+CONTAINER_BG = "#ffffff"
+BOARD_BG = "#f0e6d2"
+CELL_BORDER = "#b8a07e"
+COORD_TEXT = "#5c4d3c"
+PANEL_BG = "#e9e9e9"
+PLAYER_AREA = (("#ffcdd2", "#ef9a9a"), ("#bbdefb", "#90caf9"))  # 黑方浅红, 白方浅蓝
+PLAYER_TEXT = ("#c62828", "#1565c0")
+STONE_COLORS = (("#424242", "#212121"), ("#ffffff", "#e0e0e0"))  # (高光, 主色)
+WHITE_STONE_BORDER = "#bdbdbd"
+
+# 常见的中文字体，找不到时信息栏改用英文
+FONT_CANDIDATES = (
+    "msyh.ttc",
+    "simhei.ttf",
+    "NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    "/usr/share/fonts/wenquanyi/wqy-microhei/wqy-microhei.ttc",
+    "/System/Library/Fonts/PingFang.ttc",
+)
+
+_tiles: Dict[int, Dict[str, "Image.Image"]] = {}  # 边长 -> 贴图
+_tiles_lock = threading.Lock()
+_fonts: Dict[int, Tuple[object, bool]] = {}
+font_path: Optional[str] = None  # 由插件按配置 hequn_font_path 设置
+
+
+class Layout:
+    """某一边长棋盘在画布上的布局：格子边长、信息栏位置与 PNG 分带"""
+
+    __slots__ = ("size", "cell", "board_px", "panel_box", "band_edges", "panel_band")
+
+    def __init__(self, size: int):
+        self.size = size
+        self.cell = BOARD_TARGET_PX // size
+        self.board_px = self.cell * size
+        panel_top = BOARD_Y + self.board_px + 20
+        self.panel_box = (40, panel_top, 40 + 30 + self.board_px, panel_top + 130)
+        # PNG 分带：坐标栏 | 棋盘每行一带 | 信息栏上方留白 | 信息栏 | 底部
+        self.band_edges = (
+            (0, BOARD_Y)
+            + tuple(BOARD_Y + (r + 1) * self.cell for r in range(size))
+            + (self.panel_box[1], self.panel_box[3] + 1, CANVAS_SIZE[1])
+        )
+        self.panel_band = len(self.band_edges) - 3
+
+
+@lru_cache(maxsize=None)
+def get_layout(size: int) -> Layout:
+    return Layout(size)
+
+
+def _player_ids(players: List[str]) -> Tuple[str, str]:
+    # 确保有两个玩家，否则颜色定义会出问题
+    player1_id = players[0] if len(players) > 0 else "P1_Unknown"
+    player2_id = players[1] if len(players) > 1 else "P2_Unknown"
+    return player1_id, player2_id
+
+
+def _hex(color: str) -> Tuple[int, int, int]:
+    color = color.lstrip("#")
+    return tuple(int(color[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def _mix(a, b, t: float) -> Tuple[int, int, int]:
+    return tuple(round(x + (y - x) * t) for x, y in zip(a, b))
+
+
+def _font(size: int):
+    """返回 (字体, 是否支持中文)，按字号缓存"""
+    if size in _fonts:
+        return _fonts[size]
+    candidates = (font_path,) + FONT_CANDIDATES if font_path else FONT_CANDIDATES
+    for path in candidates:
+        try:
+            _fonts[size] = (ImageFont.truetype(path, size), True)
+            return _fonts[size]
+        except OSError:
+            continue
+    try:
+        _fonts[size] = (ImageFont.load_default(size=size), False)
+    except TypeError:  # Pillow < 10.1 的默认字体不支持字号
+        _fonts[size] = (ImageFont.load_default(), False)
+    return _fonts[size]
+
+
+def _area_tile(cell: int, start: str, end: str) -> "Image.Image":
+    """135deg 线性渐变的染色格（含格线）"""
+    a, b = _hex(start), _hex(end)
+    span = 2 * (cell - 1)
+    tile = Image.new("RGB", (cell, cell))
+    tile.putdata([_mix(a, b, (x + y) / span) for y in range(cell) for x in range(cell)])
+    ImageDraw.Draw(tile).rectangle((0, 0, cell - 1, cell - 1), outline=CELL_BORDER)
+    return tile
+
+
+def _stone_tile(cell: int, highlight: str, main: str, light_at: float, border: Optional[str]) -> "Image.Image":
+    """带阴影的径向渐变棋子，4 倍超采样后缩小抗锯齿"""
+    scale = 4
+    size = cell * scale
+    diameter = round(cell * STONE_RATIO) * scale
+    offset = (size - diameter) // 2
+    box = (offset, offset, offset + diameter, offset + diameter)
+
+    shadow = Image.new("L", (size, size), 0)
+    ImageDraw.Draw(shadow).ellipse((box[0], box[1] + 2 * scale, box[2], box[3] + 2 * scale), fill=80)
+    shadow = shadow.filter(ImageFilter.GaussianBlur(2 * scale))
+    tile = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+    tile.putalpha(shadow)
+
+    stone = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(stone)
+    hi, lo = _hex(highlight), _hex(main)
+    cx = offset + diameter * light_at
+    cy = offset + diameter * light_at
+    steps = diameter // 2
+    for i in range(steps, 0, -1):
+        # 由外向内画同心圆，圆心逐渐移向高光点
+        t = i / steps
+        r = diameter / 2 * t
+        ox = cx + (size / 2 - cx) * t
+        oy = cy + (size / 2 - cy) * t
+        draw.ellipse((ox - r, oy - r, ox + r, oy + r), fill=_mix(hi, lo, t) + (255,))
+    mask = Image.new("L", (size, size), 0)
+    ImageDraw.Draw(mask).ellipse(box, fill=255)
+    stone.putalpha(mask)
+    if border:
+        ImageDraw.Draw(stone).ellipse(box, outline=border, width=scale)
+    tile.alpha_composite(stone)
+    return tile.resize((cell, cell), Image.LANCZOS)
+
+
+def _background(empty: "Image.Image", layout: Layout) -> "Image.Image":
+    """页面、容器、坐标与空棋盘"""
+    img = Image.new("RGB", CANVAS_SIZE, PAGE_BG)
+    draw = ImageDraw.Draw(img)
+    draw.rounded_rectangle((20, 20, CANVAS_SIZE[0] - 20, layout.panel_box[3] + 20), radius=12, fill=CONTAINER_BG)
+    font, _ = _font(14)
+    cell, board_px = layout.cell, layout.board_px
+    for i in range(layout.size):
+        x = BOARD_X + i * cell + cell // 2
+        y = BOARD_Y + i * cell + cell // 2
+        draw.text((x, BOARD_Y - 15), chr(65 + i), fill=COORD_TEXT, font=font, anchor="mm")
+        draw.text((BOARD_X - 15, y), str(i + 1), fill=COORD_TEXT, font=font, anchor="mm")
+    draw.rectangle((BOARD_X - 2, BOARD_Y - 2, BOARD_X + board_px + 1, BOARD_Y + board_px + 1), fill=CELL_BORDER)
+    for r in range(layout.size):
+        for c in range(layout.size):
+            img.paste(empty, (BOARD_X + c * cell, BOARD_Y + r * cell))
+    return img
+
+
+def _load_tiles(layout: Layout) -> Dict[str, "Image.Image"]:
+    """贴图按边长只生成一次；出图可能在线程池里并发进行，所以加锁生成后整体写入 _tiles"""
+    tiles = _tiles.get(layout.size)
+    if tiles is not None:
+        return tiles
+    with _tiles_lock:
+        if layout.size in _tiles:
+            return _tiles[layout.size]
+        cell = layout.cell
+        empty = Image.new("RGB", (cell, cell), BOARD_BG)
+        ImageDraw.Draw(empty).rectangle((0, 0, cell - 1, cell - 1), outline=CELL_BORDER)
+        tiles = _tiles[layout.size] = {
+            "empty": empty,
+            "area0": _area_tile(cell, *PLAYER_AREA[0]),
+            "area1": _area_tile(cell, *PLAYER_AREA[1]),
+            "stone0": _stone_tile(cell, *STONE_COLORS[0], light_at=0.3, border=None),
+            "stone1": _stone_tile(cell, *STONE_COLORS[1], light_at=0.7, border=WHITE_STONE_BORDER),
+            "background": _background(empty, layout),
+        }
+        return tiles
+
+
+def _iter_cells(mask: int, size: int):
+    while mask:
+        low = mask & -mask
+        yield divmod(low.bit_length() - 1, size)
+        mask ^= low
+
+
+def _draw_panel(img: "Image.Image", game: dict, layout: Layout):
+    board = game["board"]
+    player1_id, player2_id = _player_ids(game["players"])
+    current_idx = game["current_player_idx"]
+    next_player = game["players"][current_idx] if game["players"] else ""
+    font, cjk = _font(16)
+    if cjk:
+        lines = (
+            (f"总手数：{game['turn_count']}", "#000000"),
+            (f"下一手：玩家 {next_player} ({'黑棋 ●' if current_idx == 0 else '白棋 ○'})", "#000000"),
+            (f"玩家 {player1_id} (黑) 染色区域: {board.score(player1_id)}", PLAYER_TEXT[0]),
+            (f"玩家 {player2_id} (白) 染色区域: {board.score(player2_id)}", PLAYER_TEXT[1]),
+        )
+    else:
+        lines = (
+            (f"Turn: {game['turn_count']}", "#000000"),
+            (f"Next: {next_player} ({'Black' if current_idx == 0 else 'White'})", "#000000"),
+            (f"{player1_id} (Black) area: {board.score(player1_id)}", PLAYER_TEXT[0]),
+            (f"{player2_id} (White) area: {board.score(player2_id)}", PLAYER_TEXT[1]),
+        )
+    draw = ImageDraw.Draw(img)
+    panel_box = layout.panel_box
+    draw.rounded_rectangle(panel_box, radius=8, fill=PANEL_BG)
+    center_x = (panel_box[0] + panel_box[2]) // 2
+    for i, (text, fill) in enumerate(lines):
+        draw.text((center_x, panel_box[1] + 26 + i * 26), text, fill=fill, font=font, anchor="mm")
+
+
+def _adler32_combine(adler1: int, adler2: int, len2: int) -> int:
+    """zlib 的 adler32_combine：由两段数据各自的校验和得到拼接后的校验和"""
+    base = 65521
+    rem = len2 % base
+    sum1 = adler1 & 0xFFFF
+    sum2 = (rem * sum1) % base
+    sum1 += (adler2 & 0xFFFF) + base - 1
+    sum2 += ((adler1 >> 16) & 0xFFFF) + ((adler2 >> 16) & 0xFFFF) + base - rem
+    if sum1 >= base:
+        sum1 -= base
+    if sum1 >= base:
+        sum1 -= base
+    if sum2 >= base << 1:
+        sum2 -= base << 1
+    if sum2 >= base:
+        sum2 -= base
+    return sum1 | (sum2 << 16)
+
+
+def _compress_band(img: "Image.Image", top: int, bottom: int) -> Tuple[bytes, int, int]:
+    """压缩一条水平带 -> (deflate 片段, adler32, 原始长度)，各行使用 None 过滤"""
+    data = img.crop((0, top, img.width, bottom)).tobytes()
+    stride = img.width * 3
+    raw = b"".join(b"\x00" + data[i:i + stride] for i in range(0, len(data), stride))
+    comp = zlib.compressobj(1, zlib.DEFLATED, -15)
+    return comp.compress(raw) + comp.flush(zlib.Z_SYNC_FLUSH), zlib.adler32(raw), len(raw)
+
+
+def _chunk(tag: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+
+def _assemble_png(width: int, height: int, bands: List[Tuple[bytes, int, int]]) -> bytes:
+    adler = bands[0][1]
+    for _, band_adler, length in bands[1:]:
+        adler = _adler32_combine(adler, band_adler, length)
+    # zlib 头 + 各带片段 + 空的最终块 + adler32
+    idat = b"\x78\x01" + b"".join(band[0] for band in bands) + b"\x03\x00" + struct.pack(">I", adler)
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + _chunk(b"IHDR", header) + _chunk(b"IDAT", idat) + _chunk(b"IEND", b"")
+
+
+class BoardCanvas:
+    """
+    每局一份的渲染缓存：保留上一张棋盘位图及其对应的位棋盘，
+    下次出图时只重绘落子/染色发生变化的格子和信息栏。
+    """
+
+    __slots__ = ("geometry", "layout", "image", "players", "stones", "colors", "bands")
+
+    def __init__(self, geometry: Geometry):
+        self.geometry = geometry
+        self.layout = get_layout(geometry.size)
+        self.image: Optional["Image.Image"] = None
+        self.players: Optional[Tuple[str, str]] = None
+        self.stones = (0, 0)
+        self.colors = (0, 0)
+        self.bands: List[Tuple[bytes, int, int]] = []
+
+    def _draw_cell(self, tiles, row: int, col: int, stones, colors):
+        bit = 1 << (row * self.geometry.size + col)
+        cell = self.layout.cell
+        pos = (BOARD_X + col * cell, BOARD_Y + row * cell)
+        if colors[0] & bit:
+            self.image.paste(tiles["area0"], pos)
+        elif colors[1] & bit:
+            self.image.paste(tiles["area1"], pos)
+        else:
+            self.image.paste(tiles["empty"], pos)
+        for idx in (0, 1):
+            if stones[idx] & bit:
+                tile = tiles[f"stone{idx}"]
+                self.image.paste(tile, pos, tile)
+
+    def render(self, game: dict) -> bytes:
+        layout = self.layout
+        tiles = _load_tiles(layout)
+        board = game["board"]
+        players = _player_ids(game["players"])
+        stones = (board.stones.get(players[0], 0), board.stones.get(players[1], 0))
+        colors = (board.colors.get(players[0], 0), board.colors.get(players[1], 0))
+
+        if self.image is None or self.players != players:
+            self.image = tiles["background"].copy()
+            self.players = players
+            self.bands = []
+            dirty = stones[0] | stones[1] | colors[0] | colors[1]
+        else:
+            dirty = (
+                (stones[0] ^ self.stones[0]) | (stones[1] ^ self.stones[1])
+                | (colors[0] ^ self.colors[0]) | (colors[1] ^ self.colors[1])
+            )
+        dirty_bands = {layout.panel_band}
+        for row, col in _iter_cells(dirty, self.geometry.size):
+            self._draw_cell(tiles, row, col, stones, colors)
+            dirty_bands.add(row + 1)
+        self.stones, self.colors = stones, colors
+        _draw_panel(self.image, game, layout)
+
+        edges = layout.band_edges
+        if not self.bands:
+            dirty_bands = range(len(edges) - 1)
+            self.bands = [None] * (len(edges) - 1)
+        for band in dirty_bands:
+            self.bands[band] = _compress_band(self.image, edges[band], edges[band + 1])
+        return _assemble_png(self.image.width, self.image.height, self.bands)
+
+
+def render_board_png(game: dict) -> bytes:
+    """把棋局合成为 PNG；画布缓存在 game["canvas"] 中，随棋局一起释放"""
+    canvas = game.get("canvas")
+    geometry = game["board"].geometry
+    if canvas is None or canvas.geometry is not geometry:
+        canvas = game["canvas"] = BoardCanvas(geometry)
+    return canvas.render(game)
+
+
+# ---------- htmlrender 回退路径 ----------
+@lru_cache(maxsize=None)
+def _html_head(size: int) -> str:
+    return f"""
+    <!DOCTYPE html>
+    <html lang="zh-CN">
+    <head>
+        <meta charset="UTF-T">
+        <title>合群之落棋盘</title>
+        <style>
+            :root {{
+                --board-bg: #f0e6d2; /* 棋盘背景色，暖黄色 */
+                --cell-border: #b8a07e; /* 棋盘线颜色 */
+                --coord-text: #5c4d3c; /* 坐标文字颜色 */
+                --stone-size-ratio: 0.75; /* 棋子相对于格子大小的比例 */
+                
+                /* 玩家1 (黑棋) 染色区域 */
+                --player1-area-bg-start: #ffcdd2; /* 浅红 */
+                --player1-area-bg-end: #ef9a9a;   /* 稍深红 */
+                
+                /* 玩家2 (白棋) 染色区域 */
+                --player2-area-bg-start: #bbdefb; /* 浅蓝 */
+                --player2-area-bg-end: #90caf9;   /* 稍深蓝 */
+
+                --black-stone-main: #212121;
+                --black-stone-highlight: #424242;
+                --white-stone-main: #e0e0e0;
+                --white-stone-highlight: #ffffff;
+                --white-stone-border: #bdbdbd;
+            }}
+            body {{
+                font-family: 'Arial', 'Microsoft YaHei', sans-serif;
+                background-color: #f7f7f7;
+                padding: 20px;
+                display: flex;
+                flex-direction: column;
+                align-items: center;
+            }}
+            .game-container {{
+                background-color: #fff;
+                padding: 20px;
+                border-radius: 12px;
+                box-shadow: 0 8px 16px rgba(0,0,0,0.1);
+            }}
+            .board-wrapper {{
+                display: grid;
+                grid-template-columns: 30px 1fr; /* 列坐标 + 棋盘 */
+                grid-template-rows: 30px 1fr;    /*行坐标 + 棋盘 */
+                width: 530px; /* 500px for board + 30px for coords */
+                height: 530px;
+                margin-bottom: 20px;
+            }}
+            .coord-label {{
+                display: flex;
+                align-items: center;
+                justify-content: center;
+                font-size: 14px;
+                color: var(--coord-text);
+                font-weight: bold;
+            }}
+            .board {{
+                display: grid;
+                grid-template-columns: repeat({size}, 1fr);
+                grid-template-rows: repeat({size}, 1fr);
+                width: 500px;
+                height: 500px;
+                border: 2px solid var(--cell-border);
+                background-color: var(--board-bg);
+            }}
+            .cell {{
+                border: 1px solid var(--cell-border);
+                position: relative;
+                display: flex;
+                align-items: center;
+                justify-content: center;
+                background-size: cover; /* For gradient backgrounds */
+            }}
+            /* Cell coloring based on player ID */
+            .cell.colored.player1 {{
+                background: linear-gradient(135deg, var(--player1-area-bg-start), var(--player1-area-bg-end));
+            }}
+            .cell.colored.player2 {{
+                background: linear-gradient(135deg, var(--player2-area-bg-start), var(--player2-area-bg-end));
+            }}
+
+            .stone {{
+                width: calc(100% * var(--stone-size-ratio));
+                height: calc(100% * var(--stone-size-ratio));
+                border-radius: 50%;
+                box-shadow: 0 2px 4px rgba(0,0,0,0.3), inset 0 1px 2px rgba(255,255,255,0.2);
+                position: absolute; /* Keep absolute for fine-tuning if needed */
+                left: 50%;
+                top: 50%;
+                transform: translate(-50%, -50%);
+            }}
+            .stone.black {{
+                background: radial-gradient(circle at 30% 30%, var(--black-stone-highlight), var(--black-stone-main));
+            }}
+            .stone.white {{
+                background: radial-gradient(circle at 70% 70%, var(--white-stone-highlight), var(--white-stone-main));
+                border: 1px solid var(--white-stone-border);
+            }}
+            .info-panel {{
+                text-align: center;
+                background-color: #e9e9e9;
+                padding: 15px;
+                border-radius: 8px;
+            }}
+            .info-panel p {{ margin: 5px 0; font-size: 16px; }}
+            .info-panel .score {{ font-weight: bold; }}
+            .player1-text {{ color: #c62828; }} /* Darker red for text */
+            .player2-text {{ color: #1565c0; }} /* Darker blue for text */
+        </style>
+    </head>
+    <body>
+        <div class="game-container">
+            <div class="board-wrapper">
+                <div></div> <!-- Top-left empty cell -->
+                <div style="display: grid; grid-template-columns: repeat({size}, 1fr);">
+                    {''.join(f'<div class="coord-label">{chr(65 + i)}</div>' for i in range(size))}
+                </div>
+                <div style="display: grid; grid-template-rows: repeat({size}, 1fr);">
+                    {''.join(f'<div class="coord-label">{i + 1}</div>' for i in range(size))}
+                </div>
+                <div class="board">
+    """
+
+_HTML_TAIL = """
+                </div>
+            </div>
+            <div class="info-panel">{panel}</div>
+        </div>
+    </body>
+    </html>
+    """
+
+_CELL_CLASSES = ("cell", "cell colored player1", "cell colored player2")
+_STONE_HTML = ("", '<div class="stone black"></div>', '<div class="stone white"></div>')
+
+
+def _cell_codes(game: dict) -> List[int]:
+    """每格编码为 染色方 * 3 + 棋子方（0 无, 1 黑方, 2 白方）"""
+    board = game["board"]
+    players = _player_ids(game["players"])
+    stones = [board.stones.get(p, 0) for p in players]
+    colors = [board.colors.get(p, 0) for p in players]
+    codes = []
+    for idx in range(board.geometry.cells):
+        bit = 1 << idx
+        color = 1 if colors[0] & bit else 2 if colors[1] & bit else 0
+        stone = 1 if stones[0] & bit else 2 if stones[1] & bit else 0
+        codes.append(color * 3 + stone)
+    return codes
+
+
+def _panel_html(game: dict) -> str:
+    board = game["board"]
+    player1_id, player2_id = _player_ids(game["players"])
+    current_idx = game["current_player_idx"]
+    next_player = html.escape(game["players"][current_idx]) if game["players"] else ""
+    return (
+        f"<p>总手数：{game['turn_count']}</p>"
+        f"<p>下一手：玩家 {next_player} ({'黑棋 ●' if current_idx == 0 else '白棋 ○'})</p>"
+        f'<p><span class="player1-text">玩家 {html.escape(player1_id)} (黑) 染色区域: '
+        f'<span class="score">{board.score(player1_id)}</span></span></p>'
+        f'<p><span class="player2-text">玩家 {html.escape(player2_id)} (白) 染色区域: '
+        f'<span class="score">{board.score(player2_id)}</span></span></p>'
+    )
+
+
+def build_board_html(game: dict) -> str:
+    """生成完整的棋盘 HTML（逐次新开页面时使用）"""
+    cells = "".join(
+        f'<div class="{_CELL_CLASSES[code // 3]}">{_STONE_HTML[code % 3]}</div>' for code in _cell_codes(game)
+    )
+    return _html_head(game["board"].geometry.size) + cells + _HTML_TAIL.format(panel=_panel_html(game))
+
+
+def board_template_html(geometry: Geometry) -> str:
+    """页面池中预先载入的空棋盘，之后每次只由 BOARD_UPDATE_JS 更新格子和信息栏"""
+    return (
+        _html_head(geometry.size)
+        + "".join(f'<div class="{_CELL_CLASSES[0]}"></div>' for _ in range(geometry.cells))
+        + _HTML_TAIL.format(panel="")
+    )
+
+BOARD_UPDATE_JS = """
+(state) => {
+    const classes = %s;
+    const stones = %s;
+    const cells = document.querySelectorAll('.board .cell');
+    state.cells.forEach((code, i) => {
+        const cell = cells[i];
+        const cls = classes[Math.floor(code / 3)];
+        if (cell.className !== cls) cell.className = cls;
+        const stone = stones[code %% 3];
+        if (cell.innerHTML !== stone) cell.innerHTML = stone;
+    });
+    document.querySelector('.info-panel').innerHTML = state.panel;
+}
+""" % (json.dumps(_CELL_CLASSES), json.dumps(_STONE_HTML))
+
+
+def board_dom_state(game: dict) -> dict:
+    """BOARD_UPDATE_JS 的参数"""
+    return {"cells": _cell_codes(game), "panel": _panel_html(game)}
+
+
+# ---------- 文字棋盘 ----------
+# 每格一个全角字符：棋子优先，空格按染色方显示；键为 (黑子, 白子, 黑方染色, 白方染色) 各一位
+_TEXT_GLYPHS = {
+    (b, w, cb, cw): "●" if b == "1" else "○" if w == "1" else "■" if cb == "1" else "□" if cw == "1" else "＋"
+    for b in "01" for w in "01" for cb in "01" for cw in "01"
+}
+TEXT_LEGEND = "● 黑子　○ 白子　■ 黑方染色　□ 白方染色"
+_FULLWIDTH_DIGITS = str.maketrans("0123456789 ", "０１２３４５６７８９　")
+
+
+@lru_cache(maxsize=None)
+def _text_labels(size: int) -> Tuple[str, Tuple[str, ...]]:
+    """(列坐标行, 各行的行号)，都用全角字符，与格子对齐"""
+    header = "　　" + "".join(chr(ord("Ａ") + col) for col in range(size))
+    rows = tuple(f"{row + 1:>2}".translate(_FULLWIDTH_DIGITS) for row in range(size))
+    return header, rows
+
+
+def render_board_text(game: dict) -> str:
+    """文字棋盘：坐标、棋子与染色区域排成全角字符网格，末尾附图例与比分"""
+    board = game["board"]
+    size, cells = board.geometry.size, board.geometry.cells
+    player1_id, player2_id = _player_ids(game["players"])
+    masks = (
+        board.stones.get(player1_id, 0), board.stones.get(player2_id, 0),
+        board.colors.get(player1_id, 0), board.colors.get(player2_id, 0),
+    )
+    # 每个掩码转成逐格的 "0"/"1" 串（低位在前），逐格查表
+    bits = [format(mask, f"0{cells}b")[::-1] for mask in masks]
+    glyphs = "".join(map(_TEXT_GLYPHS.__getitem__, zip(*bits)))
+    header, labels = _text_labels(size)
+    lines = [header]
+    lines.extend(labels[row] + glyphs[row * size:(row + 1) * size] for row in range(size))
+    lines.append(TEXT_LEGEND)
+    lines.append(f"染色区域：黑 {board.score(player1_id)} : 白 {board.score(player2_id)}")
+    return "\n".join(lines)
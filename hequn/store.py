@@ -0,0 +1,416 @@
+"""合群之落对局存档：SQLite 快照 + 追加式落子日志，写库由专用线程批量完成；另存各群战绩与 Elo。"""
+import asyncio
+import functools
+import sqlite3
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from .ai import LEVELS
+from .engine import get_geometry
+from .game import play_move, replay
+
+SNAPSHOT_VERSION = 3
+_HEADER = struct.Struct("<BBBBHI")  # 版本, 边长, 标志, 行棋方, 回合数, seq
+_GEOMETRY = struct.Struct("<BB")  # 连子数, 染色半径
+_MOVE = struct.Struct("<BH")  # 行棋方, 格子下标
+_COUNT = struct.Struct("<H")
+
+_FLAG_STARTED = 1
+_FLAG_GAME_OVER = 2
+_AI_LEVEL_SHIFT = 2  # 标志位 2-3：人机对局的难度（0 表示不是人机对局）
+_AI_LEVELS = list(LEVELS)
+
+
+# ---------- 编码 ----------
+def encode_snapshot(game: dict) -> bytes:
+    board = game["board"]
+    geometry = board.geometry
+    nbytes = (geometry.cells + 7) // 8
+    flags = (_FLAG_STARTED if game["started"] else 0) | (_FLAG_GAME_OVER if game["game_over"] else 0)
+    if game.get("ai_level") in LEVELS:
+        flags |= (_AI_LEVELS.index(game["ai_level"]) + 1) << _AI_LEVEL_SHIFT
+    parts = [
+        _HEADER.pack(SNAPSHOT_VERSION, geometry.size, flags, game["current_player_idx"], game["turn_count"], game["seq"]),
+        _GEOMETRY.pack(geometry.line_length, geometry.radius),
+        bytes((len(game["players"]),)),
+    ]
+    for player_id in game["players"]:
+        raw = player_id.encode("utf-8")
+        parts.append(bytes((len(raw),)) + raw)
+    for player_id in game["players"]:
+        parts.append(board.stones.get(player_id, 0).to_bytes(nbytes, "little"))
+        parts.append(board.colors.get(player_id, 0).to_bytes(nbytes, "little"))
+    cells = game["history"].cells
+    parts.append(_COUNT.pack(len(cells)))
+    parts.append(struct.pack(f"<{len(cells)}H", *cells))
+    return b"".join(parts)
+
+
+def decode_snapshot(data: bytes) -> dict:
+    version, size, flags, current, turn_count, seq = _HEADER.unpack_from(data)
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f"unsupported snapshot version {version}")
+    offset = _HEADER.size
+    line_length, radius = _GEOMETRY.unpack_from(data, offset)
+    offset += _GEOMETRY.size
+    geometry = get_geometry(size, line_length, radius)
+    players: List[str] = []
+    for _ in range(data[offset]):
+        length = data[offset + 1]
+        players.append(data[offset + 2:offset + 2 + length].decode("utf-8"))
+        offset += 1 + length
+    offset += 1
+    nbytes = (geometry.cells + 7) // 8
+    stones: Dict[str, int] = {}
+    colors: Dict[str, int] = {}
+    for player_id in players:
+        stones[player_id] = int.from_bytes(data[offset:offset + nbytes], "little")
+        colors[player_id] = int.from_bytes(data[offset + nbytes:offset + 2 * nbytes], "little")
+        offset += 2 * nbytes
+
+    # 重放落子序列以重建悔棋所需的染色变化，并核对与快照中的位棋盘一致
+    (count,) = _COUNT.unpack_from(data, offset)
+    offset += _COUNT.size
+    cells = struct.unpack_from(f"<{count}H", data, offset)
+    game = replay(players, cells, geometry)
+    board = game["board"]
+    if any(board.stones.get(p, 0) != stones[p] or board.colors.get(p, 0) != colors[p] for p in players):
+        raise ValueError("snapshot move list does not match its bitboards")
+    game.update(
+        current_player_idx=current,
+        started=bool(flags & _FLAG_STARTED),
+        game_over=bool(flags & _FLAG_GAME_OVER),
+        turn_count=turn_count,
+        seq=seq,
+    )
+    level = (flags >> _AI_LEVEL_SHIFT) & 3
+    if level:
+        game["ai_level"] = _AI_LEVELS[level - 1]
+    return game
+
+
+def replay_moves(game: dict, moves: List[Tuple[int, bytes]]):
+    """按 seq 顺序把快照之后的日志应用到对局上"""
+    for seq, data in moves:
+        if seq <= game["seq"]:
+            continue
+        player_idx, cell = _MOVE.unpack(data)
+        if player_idx != game["current_player_idx"]:
+            raise ValueError(f"move log out of order at seq {seq}")
+        play_move(game, *divmod(cell, game["board"].geometry.size))
+        game["seq"] = seq
+
+
+def elo_update(rating_a: float, rating_b: float, score_a: float, k: float) -> float:
+    """A 对 B 得 score_a 分（胜 1 / 平 0.5 / 负 0）后 A 的 Elo 变化量，B 的变化量为其相反数"""
+    expected = 1 / (1 + 10 ** ((rating_b - rating_a) / 400))
+    return k * (score_a - expected)
+
+
+# ---------- 存储 ----------
+class GameStore:
+    def __init__(self, path: Path, flush_interval: float = 0.5, compact_every: int = 32,
+                 elo_k: float = 32, elo_initial: float = 1500):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.compact_every = max(1, compact_every)
+        self.elo_k = elo_k
+        self.elo_initial = elo_initial
+        self._pending: List[tuple] = []
+        self._since_snapshot: Dict[int, int] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="hequn-store")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()  # 同一时间只有一批在写，失败放回队首时顺序不乱
+        self.max_retry_interval = 30.0
+        self._failing = 0  # 连续失败次数
+        # 指标
+        self.enqueue_time = 0.0
+        self.enqueued = 0
+        self.flushes = 0
+        self.flushed_ops = 0
+        self.flush_time = 0.0
+        self.max_flush_time = 0.0
+        self.failed_flushes = 0
+
+    # ---------- 写库线程 ----------
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS snapshots ("
+                "group_id INTEGER PRIMARY KEY, seq INTEGER NOT NULL, data BLOB NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS moves ("
+                "group_id INTEGER NOT NULL, seq INTEGER NOT NULL, data BLOB NOT NULL, PRIMARY KEY (group_id, seq))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "id INTEGER PRIMARY KEY, group_id INTEGER NOT NULL, black TEXT NOT NULL, white TEXT NOT NULL, "
+                "black_score INTEGER NOT NULL, white_score INTEGER NOT NULL, moves INTEGER NOT NULL, "
+                "geometry TEXT NOT NULL, ended_early INTEGER NOT NULL, ended_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS results_by_group ON results (group_id, id)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ratings ("
+                "group_id INTEGER NOT NULL, player_id TEXT NOT NULL, rating REAL NOT NULL, "
+                "games INTEGER NOT NULL, wins INTEGER NOT NULL, losses INTEGER NOT NULL, draws INTEGER NOT NULL, "
+                "PRIMARY KEY (group_id, player_id))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ratings_by_rating ON ratings (group_id, rating)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS head_to_head ("  # player_a < player_b
+                "group_id INTEGER NOT NULL, player_a TEXT NOT NULL, player_b TEXT NOT NULL, "
+                "a_wins INTEGER NOT NULL, b_wins INTEGER NOT NULL, draws INTEGER NOT NULL, "
+                "PRIMARY KEY (group_id, player_a, player_b))"
+            )
+            self._conn = conn
+        return self._conn
+
+    def _write(self, ops: List[tuple]):
+        conn = self._connect()
+        start = time.perf_counter()
+        with conn:
+            conn.execute("BEGIN")
+            for op in ops:
+                kind, group_id = op[0], op[1]
+                if kind == "move":
+                    conn.execute("INSERT OR REPLACE INTO moves VALUES (?, ?, ?)", (group_id, op[2], op[3]))
+                elif kind == "result":
+                    self._write_result(conn, op)
+                elif kind == "snapshot":
+                    conn.execute(
+                        "INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?)", (group_id, op[2], op[3], time.time())
+                    )
+                    conn.execute("DELETE FROM moves WHERE group_id = ? AND seq <= ?", (group_id, op[2]))
+                else:  # delete
+                    conn.execute("DELETE FROM snapshots WHERE group_id = ?", (group_id,))
+                    conn.execute("DELETE FROM moves WHERE group_id = ?", (group_id,))
+        return time.perf_counter() - start
+
+    def _write_result(self, conn: sqlite3.Connection, op: tuple):
+        """追加一局结果，并增量更新双方的 Elo、胜负场与交手记录"""
+        _, group_id, black, white, black_score, white_score, moves, geometry, ended_early, ended_at = op
+        conn.execute(
+            "INSERT INTO results (group_id, black, white, black_score, white_score, moves, geometry, ended_early, ended_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (group_id, black, white, black_score, white_score, moves, geometry, ended_early, ended_at),
+        )
+        outcome = (black_score > white_score) - (black_score < white_score)  # 黑方视角：1 胜, 0 平, -1 负
+        ratings = dict(conn.execute(
+            "SELECT player_id, rating FROM ratings WHERE group_id = ? AND player_id IN (?, ?)", (group_id, black, white)
+        ).fetchall())
+        delta = elo_update(
+            ratings.get(black, self.elo_initial), ratings.get(white, self.elo_initial), (outcome + 1) / 2, self.elo_k
+        )
+        for player_id, change, result in ((black, delta, outcome), (white, -delta, -outcome)):
+            conn.execute(
+                "INSERT INTO ratings VALUES (?, ?, ?, 1, ?, ?, ?) ON CONFLICT (group_id, player_id) DO UPDATE SET "
+                "rating = rating + ?, games = games + 1, wins = wins + excluded.wins, "
+                "losses = losses + excluded.losses, draws = draws + excluded.draws",
+                (group_id, player_id, self.elo_initial + change, int(result > 0), int(result < 0), int(result == 0),
+                 change),
+            )
+        a, b = (black, white) if black < white else (white, black)
+        a_result = outcome if a == black else -outcome
+        conn.execute(
+            "INSERT INTO head_to_head VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (group_id, player_a, player_b) DO UPDATE SET "
+            "a_wins = a_wins + excluded.a_wins, b_wins = b_wins + excluded.b_wins, draws = draws + excluded.draws",
+            (group_id, a, b, int(a_result > 0), int(a_result < 0), int(a_result == 0)),
+        )
+
+    def _read(self, group_id: int):
+        conn = self._connect()
+        row = conn.execute("SELECT data FROM snapshots WHERE group_id = ?", (group_id,)).fetchone()
+        if row is None:
+            return None, []
+        moves = conn.execute(
+            "SELECT seq, data FROM moves WHERE group_id = ? ORDER BY seq", (group_id,)
+        ).fetchall()
+        return row[0], moves
+
+    # ---------- 事件循环侧：只编码、入队 ----------
+    def _enqueue(self, op: tuple, start: float):
+        self._pending.append(op)
+        self.enqueued += 1
+        self.enqueue_time += time.perf_counter() - start
+
+    def save(self, group_id: int, game: dict):
+        """写入整局快照（开局、加入、悔棋等非落子变更）"""
+        start = time.perf_counter()
+        self._since_snapshot[group_id] = 0
+        self._enqueue(("snapshot", group_id, game["seq"], encode_snapshot(game)), start)
+
+    def record_move(self, group_id: int, game: dict, player_idx: int, row: int, col: int):
+        """记录一手（在 play_move 之后调用）；累计够 compact_every 手时改写快照"""
+        start = time.perf_counter()
+        count = self._since_snapshot.get(group_id, 0) + 1
+        if count >= self.compact_every:
+            self._since_snapshot[group_id] = 0
+            self._enqueue(("snapshot", group_id, game["seq"], encode_snapshot(game)), start)
+        else:
+            self._since_snapshot[group_id] = count
+            self._enqueue(("move", group_id, game["seq"], _MOVE.pack(player_idx, row * game["board"].geometry.size + col)), start)
+
+    def record_result(self, group_id: int, game: dict, players: Optional[List[str]] = None, ended_early: bool = False):
+        """记录一局结果（在删除存档之前调用）；players 可替换记录用的玩家名，如把 AI 按难度区分"""
+        start = time.perf_counter()
+        black, white = players or game["players"]
+        board = game["board"]
+        self._enqueue((
+            "result", group_id, black, white, board.score(game["players"][0]), board.score(game["players"][1]),
+            len(game["history"]), board.geometry.label, int(ended_early), time.time(),
+        ), start)
+
+    def delete(self, group_id: int):
+        start = time.perf_counter()
+        self._since_snapshot.pop(group_id, None)
+        self._enqueue(("delete", group_id), start)
+
+    # ---------- 异步接口 ----------
+    def _settle(self, ops: List[tuple], future: asyncio.Future):
+        """一批写完后记账；写库失败时事务已回滚，这一批放回队首"""
+        if future.cancelled() or future.exception() is not None:
+            self._pending[:0] = ops
+            self.failed_flushes += 1
+            return
+        elapsed = future.result()
+        self.flushes += 1
+        self.flushed_ops += len(ops)
+        self.flush_time += elapsed
+        self.max_flush_time = max(self.max_flush_time, elapsed)
+
+    async def flush(self):
+        """把队列中的操作写入数据库；写库失败时这一批放回队首并抛出异常"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            ops, self._pending = self._pending, []
+            future = asyncio.get_running_loop().run_in_executor(self._executor, self._write, ops)
+            future.add_done_callback(functools.partial(self._settle, ops))  # 先于下面的等待者执行
+            try:
+                await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # 取消不会中断写库线程，这一批可能照常提交：等它有了结果（由 _settle 记账）再退出，不能放回队列重写
+                await asyncio.wait({future})
+                raise
+
+    async def load(self, group_id: int) -> Optional[dict]:
+        """读取快照并回放日志；没有存档时返回 None"""
+        data, moves = await asyncio.get_running_loop().run_in_executor(self._executor, self._read, group_id)
+        if data is None:
+            return None
+        game = decode_snapshot(data)
+        replay_moves(game, moves)
+        self._since_snapshot[group_id] = len(moves)
+        return game
+
+    # ---------- 战绩查询：只读聚合表 ----------
+    def _read_leaderboard(self, group_id: int, limit: int) -> List[Dict[str, Any]]:
+        conn = self._connect()
+        rows = conn.execute(
+            "SELECT player_id, rating, games, wins, losses, draws FROM ratings "
+            "WHERE group_id = ? ORDER BY rating DESC LIMIT ?", (group_id, limit)
+        ).fetchall()
+        keys = ("player_id", "rating", "games", "wins", "losses", "draws")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def _read_player(self, group_id: int, player_id: str, opponent_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT rating, games, wins, losses, draws FROM ratings WHERE group_id = ? AND player_id = ?",
+            (group_id, player_id),
+        ).fetchone()
+        if row is None:
+            return None
+        record = dict(zip(("rating", "games", "wins", "losses", "draws"), row), player_id=player_id)
+        (higher,) = conn.execute(
+            "SELECT COUNT(*) FROM ratings WHERE group_id = ? AND rating > ?", (group_id, record["rating"])
+        ).fetchone()
+        record["rank"] = higher + 1
+        if opponent_id is not None and opponent_id != player_id:
+            a, b = sorted((player_id, opponent_id))
+            pair = conn.execute(
+                "SELECT a_wins, b_wins, draws FROM head_to_head WHERE group_id = ? AND player_a = ? AND player_b = ?",
+                (group_id, a, b),
+            ).fetchone() or (0, 0, 0)
+            wins, losses = (pair[0], pair[1]) if a == player_id else (pair[1], pair[0])
+            record["versus"] = {"opponent_id": opponent_id, "wins": wins, "losses": losses, "draws": pair[2]}
+        return record
+
+    async def _try_flush(self) -> bool:
+        """flush 并记录失败；连续失败时只有第一次打印完整堆栈"""
+        try:
+            await self.flush()
+        except Exception as e:
+            self._failing += 1
+            if self._failing == 1:
+                logger.exception(f"hequn store failed to write {len(self._pending)} pending ops to {self.path}")
+            else:
+                logger.warning(f"hequn store write failed {self._failing} times in a row, {len(self._pending)} ops pending: {e}")
+            return False
+        if self._failing:
+            logger.info(f"hequn store recovered after {self._failing} failed writes")
+            self._failing = 0
+        return True
+
+    async def leaderboard(self, group_id: int, limit: int = 10) -> List[Dict[str, Any]]:
+        """本群按 Elo 排序的前 limit 名"""
+        await self._try_flush()  # 刚结束的对局也要算进去；写入失败时仍返回已落库的数据
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, self._read_leaderboard, group_id, limit
+        )
+
+    async def player_record(self, group_id: int, player_id: str,
+                            opponent_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """玩家在本群的 Elo、名次与胜负；给出 opponent_id 时附带双方交手记录（versus）。没有对局记录时返回 None"""
+        await self._try_flush()
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, self._read_player, group_id, player_id, opponent_id
+        )
+
+    async def _flush_loop(self):
+        interval = self.flush_interval
+        while True:
+            await asyncio.sleep(interval)
+            # 失败时退避（间隔逐次翻倍，最长 max_retry_interval 秒），成功后恢复正常周期
+            if await self._try_flush():
+                interval = self.flush_interval
+            else:
+                interval = min(interval * 2, self.max_retry_interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)  # 等正在写的一批结束
+            self._task = None
+        await self._try_flush()
+        if self._conn is not None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "pending": len(self._pending),
+            "enqueued": self.enqueued,
+            "avg_enqueue_us": self.enqueue_time / max(1, self.enqueued) * 1e6,
+            "flushes": self.flushes,
+            "avg_flush_ms": self.flush_time / max(1, self.flushes) * 1000,
+            "max_flush_ms": self.max_flush_time * 1000,
+            "failed_flushes": self.failed_flushes,
+            "avg_write_us_per_op": self.flush_time / max(1, self.flushed_ops) * 1e6,
+        }
@@ -0,0 +1,109 @@
+"""
+共享的 HTTP 客户端，供 nutri、huoshaoyun 等需要访问外部接口的插件使用。
+
+整个 bot 只保留一个 aiohttp.ClientSession：连接池 + HTTP keep-alive，
+按主机限制并发连接数，超时可配置。会话在 driver 启动时创建、关闭时释放；
+启动前（或关闭后）被调用时会按需重新创建。
+
+其他插件通过 ``require("http_pool")`` 获取本模块后调用 ``get_session``；
+需要缓存上游响应时用 ``create_cache`` 创建 ``AsyncTTLCache``（TTL + LRU + single-flight，
+可选持久化，持久化的缓存会定期及在关闭时写盘）。
+
+配置项（.env）：
+    HTTP_POOL_LIMIT=100              # 总连接数上限
+    HTTP_POOL_LIMIT_PER_HOST=8       # 每个主机的连接数上限
+    HTTP_POOL_KEEPALIVE=30           # 空闲连接保留秒数
+    HTTP_POOL_TIMEOUT=15             # 单次请求总超时（秒）
+    HTTP_POOL_CONNECT_TIMEOUT=5      # 建立连接超时（秒）
+    HTTP_POOL_CACHE_DIR=...          # 持久化缓存目录，默认为本插件目录下的 cache/
+"""
+import asyncio
+from pathlib import Path
+from typing import Dict, Optional
+
+import aiohttp
+from nonebot import get_driver
+from nonebot.log import logger
+
+from .cache import AsyncTTLCache
+
+plugin_config = get_driver().config
+LIMIT = int(getattr(plugin_config, "http_pool_limit", 100))
+LIMIT_PER_HOST = int(getattr(plugin_config, "http_pool_limit_per_host", 8))
+KEEPALIVE = float(getattr(plugin_config, "http_pool_keepalive", 30))
+TIMEOUT = float(getattr(plugin_config, "http_pool_timeout", 15))
+CONNECT_TIMEOUT = float(getattr(plugin_config, "http_pool_connect_timeout", 5))
+
+CACHE_DIR = Path(getattr(plugin_config, "http_pool_cache_dir", Path(__file__).parent / "cache"))
+CACHE_FLUSH_INTERVAL = 300  # 秒
+
+USER_AGENT = "midnight_radio_plugins (NoneBot)"
+
+_session: Optional[aiohttp.ClientSession] = None
+caches: Dict[str, AsyncTTLCache] = {}
+
+
+def _create_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=LIMIT,
+        limit_per_host=LIMIT_PER_HOST,
+        keepalive_timeout=KEEPALIVE,
+        ttl_dns_cache=300,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=TIMEOUT, connect=CONNECT_TIMEOUT),
+        headers={"User-Agent": USER_AGENT},
+    )
+
+
+def get_session() -> aiohttp.ClientSession:
+    """返回共享会话；请勿在调用方关闭它"""
+    global _session
+    if _session is None or _session.closed:
+        _session = _create_session()
+    return _session
+
+
+def create_cache(name: str, maxsize: int = 256, persist: bool = False) -> AsyncTTLCache:
+    """按名称获取（或创建）响应缓存；persist=True 时持久化到 CACHE_DIR/<name>.json"""
+    if name not in caches:
+        caches[name] = AsyncTTLCache(maxsize, CACHE_DIR / f"{name}.json" if persist else None)
+    return caches[name]
+
+
+async def _flush_caches():
+    for name, cache in caches.items():
+        try:
+            await cache.save()
+        except Exception:
+            logger.exception(f"Failed to persist HTTP cache '{name}'")
+
+
+async def _flush_loop():
+    while True:
+        await asyncio.sleep(CACHE_FLUSH_INTERVAL)
+        await _flush_caches()
+
+
+driver = get_driver()
+_flush_task: Optional[asyncio.Task] = None
+
+
+@driver.on_startup
+async def _open_session():
+    global _flush_task
+    get_session()
+    _flush_task = asyncio.create_task(_flush_loop())
+    logger.info(f"Shared HTTP session ready (limit={LIMIT}, per host={LIMIT_PER_HOST}, timeout={TIMEOUT}s)")
+
+
+@driver.on_shutdown
+async def _close_session():
+    global _session
+    if _flush_task is not None:
+        _flush_task.cancel()
+    await _flush_caches()
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
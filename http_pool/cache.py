@@ -0,0 +1,125 @@
+"""异步 TTL + LRU 响应缓存：同一 key 的并发请求只获取一次上游，可选持久化到 JSON 文件。"""
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Union
+
+Ttl = Union[float, Callable[[Any], float]]
+
+
+class AsyncTTLCache:
+    def __init__(self, maxsize: int = 256, path: Optional[Path] = None):
+        self.maxsize = max(1, maxsize)
+        self.path = path
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (expires_at, value)
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        if path is not None:
+            self._load()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """命中且未过期时返回缓存值（计入命中），否则返回 default（不计入未命中）"""
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        if entry[0] <= time.time():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: float):
+        if ttl <= 0:
+            return
+        self._data[key] = (time.time() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+        self.dirty = True
+
+    def pop(self, key: Hashable):
+        if self._data.pop(key, None) is not None:
+            self.dirty = True
+
+    def expires_at(self, key: Hashable) -> Optional[float]:
+        entry = self._data.get(key)
+        return entry[0] if entry else None
+
+    def record_miss(self, coalesced: bool = False):
+        """记录一次未命中：coalesced=True 表示复用了同一 key 已在途的请求。调用方自己管理在途请求（如流式读取）时使用"""
+        if coalesced:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+
+    async def _fill(self, key: Hashable, fetch: Callable[[], Awaitable[Any]], ttl: Ttl):
+        try:
+            value = await fetch()
+            self.set(key, value, ttl(value) if callable(ttl) else ttl)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    async def get_or_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]], ttl: Ttl) -> Any:
+        """
+        缓存命中直接返回；否则调用 fetch() 获取并按 ttl（秒，或由结果计算秒数的函数）缓存。
+        同一 key 已有请求在途时复用其结果；fetch 抛出的异常会传给所有等待者且不缓存。
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            return value
+        task = self._inflight.get(key)
+        self.record_miss(coalesced=task is not None)
+        if task is None:
+            task = asyncio.ensure_future(self._fill(key, fetch, ttl))
+            self._inflight[key] = task
+        # shield：某个等待者被取消时不影响其他等待者
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_ratio": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
+
+    # ---------- 持久化 ----------
+    def _load(self):
+        try:
+            rows = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for key, expires_at, value in rows:
+            if expires_at > now:
+                self._data[tuple(key) if isinstance(key, list) else key] = (expires_at, value)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def _write(self, rows):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(rows, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(self.path)
+
+    async def save(self):
+        """把未过期的条目写入磁盘（在线程池中执行）"""
+        if self.path is None or not self.dirty:
+            return
+        now = time.time()
+        rows = [[key, expires_at, value] for key, (expires_at, value) in self._data.items() if expires_at > now]
+        self.dirty = False
+        await asyncio.get_running_loop().run_in_executor(None, self._write, rows)
@@ -1,17 +1,215 @@
-import httpx
-from nonebot import on_command
+import asyncio
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict
+
+from nonebot import on_command, require, get_driver
+from nonebot.log import logger
 from nonebot.adapters.onebot.v11 import Bot, Event, Message, MessageSegment
 from nonebot.matcher import Matcher
 from nonebot.params import CommandArg, ArgPlainText
+from nonebot.permission import SUPERUSER
+
+from .image_cache import ImageCache
 
 # 定义命令
 sunset = on_command("火烧云", aliases={"sunset"}, priority=5)
 sunset_map = on_command("火烧云地图", priority=5)
 stop_command = on_command("退出", priority=5)
 help_command = on_command("火烧云帮助", priority=5)
+cache_status = on_command("火烧云缓存", permission=SUPERUSER, priority=5, block=True)
 
 API_URL = "https://sunsetbot.top/"
 
+http_pool = require("http_pool")  # 共享的 keep-alive 连接池
+
+# ---------- 预报缓存 ----------
+# 预报只在固定时次更新（北京时间，上午/中午/傍晚），同一 (城市/地区, 事件) 的结果
+# 缓存到下一次发布（加上发布延迟）为止；查询失败的结果只缓存几分钟。
+plugin_config = get_driver().config
+FORECAST_ISSUE_HOURS = tuple(sorted(
+    int(h) for h in str(getattr(plugin_config, "huoshaoyun_issue_hours", "6,12,18")).split(",")
+))
+PUBLISH_DELAY = timedelta(minutes=20)
+ERROR_TTL = 5 * 60
+MIN_TTL = 60
+CHINA_TZ = timezone(timedelta(hours=8))
+
+forecast_cache = http_pool.create_cache(
+    "sunsetbot",
+    maxsize=int(getattr(plugin_config, "huoshaoyun_cache_size", 512)),
+    persist=bool(getattr(plugin_config, "huoshaoyun_cache_persist", False)),
+)
+
+
+def next_issue_time(now: datetime = None) -> datetime:
+    """下一次预报发布（含发布延迟）的时间"""
+    now = now or datetime.now(CHINA_TZ)
+    for day in (0, 1):
+        base = (now + timedelta(days=day)).replace(minute=0, second=0, microsecond=0)
+        for hour in FORECAST_ISSUE_HOURS:
+            issue = base.replace(hour=hour) + PUBLISH_DELAY
+            if issue > now:
+                return issue
+    return now + timedelta(hours=6)
+
+
+def seconds_until_next_issue() -> float:
+    return max(MIN_TTL, (next_issue_time() - datetime.now(CHINA_TZ)).total_seconds())
+
+
+def forecast_ttl(data: dict) -> float:
+    if data.get("status") != "ok":
+        return ERROR_TTL
+    return seconds_until_next_issue()
+
+
+async def _get_json(url: str) -> dict:
+    async with http_pool.get_session().get(url) as response:
+        return await response.json(content_type=None)
+
+
+async def fetch_city_forecast(city: str, event: str) -> dict:
+    """城市火烧云预报（带缓存，并发的相同查询只请求一次上游）"""
+    query_id = "9218015"
+    api_url = f"{API_URL}?query_id={query_id}&intend=select_city&query_city={city}&event_date=None&event={event}&times=None"
+    return await forecast_cache.get_or_fetch(("city", city, event), lambda: _get_json(api_url), forecast_ttl)
+
+
+async def fetch_region_map(region: str, event: str) -> dict:
+    """地区火烧云地图（带缓存）"""
+    api_url = f"{API_URL}map/?region={region}&event={event}&intend=select_region"
+    return await forecast_cache.get_or_fetch(("map", region, event), lambda: _get_json(api_url), forecast_ttl)
+
+
+# ---------- 图片缓存 ----------
+# 预报图和地图只从上游下载一次，按内容存盘并发送字节，多个群重复查询不再产生上游流量
+IMAGE_CACHE_DIR = Path(getattr(plugin_config, "huoshaoyun_image_cache_dir", Path(__file__).parent / "image_cache"))
+IMAGE_CACHE_MB = float(getattr(plugin_config, "huoshaoyun_image_cache_mb", 200))
+
+image_cache = ImageCache(
+    IMAGE_CACHE_DIR,
+    int(IMAGE_CACHE_MB * 1024 * 1024),
+    http_pool.create_cache("sunsetbot_images", maxsize=1024, persist=True),
+)
+
+
+def city_image_url(data: dict) -> str:
+    return f"https://sunsetbot.top/static{data['img_href'].replace('/image', '/media')}"
+
+
+def map_image_url(data: dict) -> str:
+    return f"https://sunsetbot.top{data['map_img_src']}"
+
+
+async def _download(url: str) -> bytes:
+    async with http_pool.get_session().get(url) as response:
+        response.raise_for_status()
+        return await response.read()
+
+
+async def fetch_image(url: str) -> bytes:
+    return await image_cache.get(url, _download, lambda _: seconds_until_next_issue())
+
+
+async def image_segment(url: str) -> MessageSegment:
+    """优先发送缓存中的图片字节；下载失败时退回由客户端自行拉取 URL"""
+    try:
+        return MessageSegment.image(await fetch_image(url))
+    except Exception as e:
+        logger.warning(f"Image cache miss for {url}: {e!r}")
+        return MessageSegment.image(url)
+
+
+# ---------- 定时预取 ----------
+# 记录各 (城市, 事件) 的查询次数；每次预报发布后按热度预取前 N 个，
+# 傍晚集中查询时直接命中本地缓存。计数每轮减半，冷门城市会逐渐掉出榜单。
+PREFETCH_TOP = int(getattr(plugin_config, "huoshaoyun_prefetch_top", 20))
+PREFETCH_CONCURRENCY = int(getattr(plugin_config, "huoshaoyun_prefetch_concurrency", 4))
+
+query_counts: Counter = Counter()
+prefetched: Dict[tuple, float] = {}  # 本轮由预取写入缓存的 key -> 该条目的过期时间（用来认出是不是同一条目）
+prefetch_stats = {"queries": 0, "prefetch_hits": 0, "rounds": 0, "fetched": 0, "failed": 0, "last_run": None}
+
+
+def record_query(city: str, event: str):
+    """统计一次城市查询，并记录是否由预取的数据直接应答"""
+    key = ("city", city, event)
+    query_counts[(city, event)] += 1
+    prefetch_stats["queries"] += 1
+    expires_at = forecast_cache.expires_at(key)
+    # 只算预取写入、仍未过期的那一条；条目若是用户查询写入或过期后重新获取的，过期时间对不上
+    if expires_at is not None and prefetched.get(key) == expires_at and expires_at > time.time():
+        prefetch_stats["prefetch_hits"] += 1
+
+
+async def prefetch_popular():
+    """预取最常查询的 (城市, 事件)，并发数受 PREFETCH_CONCURRENCY 限制"""
+    targets = [key for key, _ in query_counts.most_common(PREFETCH_TOP)]
+    semaphore = asyncio.Semaphore(max(1, PREFETCH_CONCURRENCY))
+    prefetched.clear()
+    fetched_before = prefetch_stats["fetched"]
+
+    async def fetch_one(city: str, event: str):
+        key = ("city", city, event)
+        async with semaphore:
+            cached = forecast_cache.expires_at(key)
+            written_before = cached is not None and cached > time.time()  # 已有未过期条目：这次只是读缓存
+            try:
+                data = await fetch_city_forecast(city, event)
+            except Exception as e:
+                prefetch_stats["failed"] += 1
+                logger.warning(f"Prefetch of {city}/{event} failed: {e!r}")
+                return
+            if data.get("status") == "ok":
+                if not written_before:
+                    prefetched[key] = forecast_cache.expires_at(key)
+                prefetch_stats["fetched"] += 1
+                try:
+                    await fetch_image(city_image_url(data))
+                except Exception as e:
+                    prefetch_stats["failed"] += 1
+                    logger.warning(f"Prefetch of {city}/{event} image failed: {e!r}")
+
+    await asyncio.gather(*(fetch_one(city, event) for city, event in targets))
+    for key in list(query_counts):
+        query_counts[key] //= 2
+        if not query_counts[key]:
+            del query_counts[key]
+    prefetch_stats["rounds"] += 1
+    prefetch_stats["last_run"] = datetime.now(CHINA_TZ)
+    logger.info(f"Prefetched {prefetch_stats['fetched'] - fetched_before}/{len(targets)} sunset forecasts")
+
+
+async def prefetch_loop():
+    while True:
+        # 缓存恰好在发布时刻（含发布延迟）过期，稍等几秒再取保证拿到新预报
+        wait = (next_issue_time() - datetime.now(CHINA_TZ)).total_seconds() + 5
+        await asyncio.sleep(max(1, wait))
+        try:
+            await prefetch_popular()
+        except Exception:
+            logger.exception("Sunset forecast prefetch failed")
+
+
+driver = get_driver()
+_prefetch_task = None
+
+
+@driver.on_startup
+async def _start_prefetch():
+    global _prefetch_task
+    if PREFETCH_TOP > 0:
+        _prefetch_task = asyncio.create_task(prefetch_loop())
+
+
+@driver.on_shutdown
+async def _stop_prefetch():
+    if _prefetch_task is not None:
+        _prefetch_task.cancel()
+
 # 第一个处理函数：处理命令参数
 @sunset.handle()
 async def handle_first_receive(matcher: Matcher, args: Message = CommandArg()):
@@ -40,16 +238,10 @@ async def handle_location(location: str = ArgPlainText(), event_type: str = ArgP
         await sunset.reject("无效的查询类型，请输入今日日出、今日日落、明日日出或明日日落")
 
     # 调用 API 获取火烧云结果
-    query_city = location
-    query_id = "9218015"
-    api_url = f"{API_URL}?query_id={query_id}&intend=select_city&query_city={query_city}&event_date=None&event={event}&times=None"
-
-    async with httpx.AsyncClient() as client:
-        response = await client.get(api_url)
-        data = response.json()
+    record_query(location, event)
+    data = await fetch_city_forecast(location, event)
 
     if data["status"] == "ok":
-        img_href = data["img_href"]
         img_summary = data["img_summary"]
         tb_aod = data["tb_aod"]
         tb_event_time = data["tb_event_time"]
@@ -68,12 +260,9 @@ async def handle_location(location: str = ArgPlainText(), event_type: str = ArgP
             f"AOD: {tb_aod_clean}"
         )
 
-        # 构造实际图片链接
-        img_url = f"https://sunsetbot.top/static{img_href.replace('/image', '/media')}"
-
-        # 发送图片和消息
+        # 发送图片和消息（图片走本地缓存）
         await sunset.send(MessageSegment.text(message))
-        await sunset.send(MessageSegment.image(img_url))
+        await sunset.send(await image_segment(city_image_url(data)))
     else:
         await sunset.finish("未能获取火烧云信息，请检查地区名称是否正确。")
 
@@ -104,22 +293,14 @@ async def handle_map(region: str = ArgPlainText(), event_type: str = ArgPlainTex
         await sunset_map.reject("无效的查询类型，请输入今日日出、今日日落、明日日出或明日日落")
 
     # 调用 API 获取火烧云地图结果
-    api_url = f"{API_URL}map/?region={region}&event={event}&intend=select_region"
-
-    async with httpx.AsyncClient() as client:
-        response = await client.get(api_url)
-        data = response.json()
+    data = await fetch_region_map(region, event)
 
     if data["status"] == "ok":
         map_des = data["map_des"]
-        map_img_src = data["map_img_src"]
 
-        # 构造实际图片链接
-        img_url = f"https://sunsetbot.top{map_img_src}"
-
-        # 发送图片和消息
+        # 发送图片和消息（图片走本地缓存）
         await sunset_map.send(MessageSegment.text(map_des))
-        await sunset_map.send(MessageSegment.image(img_url))
+        await sunset_map.send(await image_segment(map_image_url(data)))
     else:
         await sunset_map.finish("未能获取火烧云地图信息，请检查地区名称是否正确。")
 
@@ -128,6 +309,24 @@ async def handle_map(region: str = ArgPlainText(), event_type: str = ArgPlainTex
 async def handle_stop():
     await stop_command.finish("操作已停止。")
 
+# 缓存状态（超级用户）
+@cache_status.handle()
+async def handle_cache_status():
+    s = forecast_cache.stats()
+    p = prefetch_stats
+    i = image_cache.stats()
+    ratio = p["prefetch_hits"] / p["queries"] if p["queries"] else 0.0
+    last_run = p["last_run"].strftime("%m-%d %H:%M") if p["last_run"] else "尚未执行"
+    hot = "、".join(f"{city}/{event}({n})" for (city, event), n in query_counts.most_common(5)) or "无"
+    await cache_status.finish(
+        f"缓存: {s['entries']} 条, 命中 {s['hits']}, 合并 {s['coalesced']}, 未命中 {s['misses']}, 命中率 {s['hit_ratio']:.1%}\n"
+        f"预取: {p['rounds']} 轮, 成功 {p['fetched']}, 失败 {p['failed']}, 上次 {last_run}, 下次 {next_issue_time():%m-%d %H:%M}\n"
+        f"城市查询 {p['queries']} 次, 由预取数据应答 {p['prefetch_hits']} 次 ({ratio:.1%})\n"
+        f"图片: {i['files']} 个 {i['total_bytes'] / 1048576:.1f}/{i['max_bytes'] / 1048576:.0f}MB, "
+        f"上游下载 {i['downloads']} 次 {i['downloaded_bytes'] / 1048576:.1f}MB, 淘汰 {i['evicted']} 个\n"
+        f"热门: {hot}"
+    )
+
 # 帮助命令处理函数
 @help_command.handle()
 async def handle_help():
@@ -161,4 +360,4 @@ async def handle_help():
     help_image_url = "https://sunsetbot.top/static/media/static_image/reference_cross_section.jpg"
     
     await help_command.send(MessageSegment.text(help_text))
-    await help_command.send(MessageSegment.image(help_image_url))
\ No newline at end of file
+    await help_command.send(await image_segment(help_image_url))
\ No newline at end of file
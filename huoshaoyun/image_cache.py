@@ -0,0 +1,103 @@
+"""火烧云预报图 / 地图的本地缓存：按内容摘要存盘、按最近使用淘汰，索引随预报发布过期。"""
+import asyncio
+import hashlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+
+class ImageCache:
+    def __init__(self, directory: Path, max_bytes: int, index):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.index = index  # url -> digest（AsyncTTLCache）
+        self._blobs: "OrderedDict[str, int]" = OrderedDict()  # digest -> size，按最近使用排序
+        self.total_bytes = 0
+        self.downloads = 0
+        self.downloaded_bytes = 0
+        self.evicted = 0
+        self._scan()
+
+    def _path(self, digest: str) -> Path:
+        return self.directory / digest[:2] / f"{digest}.img"
+
+    def _scan(self):
+        """启动时登记已有文件，按修改时间确定淘汰顺序"""
+        if not self.directory.exists():
+            return
+        files = sorted(self.directory.glob("*/*.img"), key=lambda p: p.stat().st_mtime)
+        for path in files:
+            size = path.stat().st_size
+            self._blobs[path.stem] = size
+            self.total_bytes += size
+
+    def _read(self, digest: str) -> Optional[bytes]:
+        try:
+            return self._path(digest).read_bytes()
+        except OSError:
+            return None
+
+    def _write(self, digest: str, data: bytes):
+        path = self._path(digest)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(data)
+        tmp.replace(path)
+
+    def _unlink(self, digests: List[str]):
+        for digest in digests:
+            self._path(digest).unlink(missing_ok=True)
+
+    def _evict(self) -> List[str]:
+        """在事件循环里挑出超出上限的最久未用文件并更新记账，返回要删除的摘要"""
+        victims = []
+        while self.total_bytes > self.max_bytes and len(self._blobs) > 1:
+            digest, size = self._blobs.popitem(last=False)
+            self.total_bytes -= size
+            self.evicted += 1
+            victims.append(digest)
+        return victims
+
+    async def _store(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        loop = asyncio.get_running_loop()
+        if digest not in self._blobs:
+            await loop.run_in_executor(None, self._write, digest, data)
+            if digest not in self._blobs:  # 写文件期间可能已有同内容的并发请求登记过
+                self._blobs[digest] = len(data)
+                self.total_bytes += len(data)
+        self._blobs.move_to_end(digest)
+        victims = self._evict()
+        if victims:
+            await loop.run_in_executor(None, self._unlink, victims)
+        return digest
+
+    async def get(self, url: str, download: Callable[[str], Awaitable[bytes]], ttl) -> bytes:
+        """返回 url 对应的图片字节；缓存中没有（或文件已被淘汰）时调用 download(url) 下载一次"""
+        async def fill() -> str:
+            data = await download(url)
+            self.downloads += 1
+            self.downloaded_bytes += len(data)
+            return await self._store(data)
+
+        for _ in range(2):
+            digest = await self.index.get_or_fetch(url, fill, ttl)
+            if digest in self._blobs:
+                self._blobs.move_to_end(digest)
+                data = await asyncio.get_running_loop().run_in_executor(None, self._read, digest)
+                if data is not None:
+                    return data
+                self.total_bytes -= self._blobs.pop(digest, 0)  # 读文件期间可能已被淘汰
+            # 映射还在但文件已被淘汰：丢弃映射后重新下载
+            self.index.pop(url)
+        raise OSError(f"image cache lost {url}")
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "files": len(self._blobs),
+            "total_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "downloads": self.downloads,
+            "downloaded_bytes": self.downloaded_bytes,
+            "evicted": self.evicted,
+        }
@@ -1,84 +1,262 @@
-from nonebot import on_command
-from nonebot.adapters.onebot.v11 import Message
+import asyncio
+import codecs
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from urllib.parse import quote
+
+from nonebot import on_command, require, get_driver
+from nonebot.adapters.onebot.v11 import Event, Message
 from nonebot.params import CommandArg
 from nonebot.exception import FinishedException  # 新增导入
-from bs4 import BeautifulSoup
-import aiohttp
+
+from . import codec
+from .parser import NutrimaticParser
+
+http_pool = require("http_pool")  # 共享的 keep-alive 连接池
 
 nutrimatics = on_command("nutrimatics", aliases={"nutri", "牛吹"}, priority=5)
+nutri_next = on_command("nutri下一页", aliases={"牛吹下一页", "nutrinext"}, priority=5)
 a1z26 = on_command("A1Z26", aliases={"a1z26"}, priority=5)
+rot = on_command("rot", aliases={"ROT", "caesar", "凯撒"}, priority=5)
+atbash_cmd = on_command("atbash", aliases={"Atbash", "埃特巴什"}, priority=5)
+
+CHUNK_SIZE = 8192
+NUTRIMATIC_URL = "https://nutrimatic.org/2024/"
+
+# ---------- 查询缓存 ----------
+# 同一模式的结果是确定的：按规范化后的查询缓存解析结果（LRU + TTL，可持久化），
+# 并发的相同查询只请求一次；错误信息（红字）也缓存一小段时间，避免坏模式反复打到上游。
+plugin_config = get_driver().config
+PAGE_SIZE = int(getattr(plugin_config, "nutri_page_size", 20))
+MAX_RESULTS = int(getattr(plugin_config, "nutri_max_results", 100))  # 每个查询最多保留的结果数
+RESULT_TTL = float(getattr(plugin_config, "nutri_cache_ttl", 24 * 3600))
+ERROR_TTL = float(getattr(plugin_config, "nutri_error_ttl", 300))
+
+query_cache = http_pool.create_cache(
+    "nutrimatic",
+    maxsize=int(getattr(plugin_config, "nutri_cache_size", 1024)),
+    persist=bool(getattr(plugin_config, "nutri_cache_persist", False)),
+)
+
+_WHITESPACE = re.compile(r"\s+")
+# 大写 A/C/V 在 Nutrimatic 中是通配符（任意字母/辅音/元音），其余字母大小写等价
+_FOLD_CASE = str.maketrans({c: c.lower() for c in "BDEFGHIJKLMNOPQRSTUWXYZ"})
+
+
+def normalize_query(query: str) -> str:
+    """合并空白、折叠不影响语义的大小写"""
+    return _WHITESPACE.sub(" ", query).strip().translate(_FOLD_CASE)
+
+
+def result_ttl(outcome: dict) -> float:
+    return ERROR_TTL if outcome["error"] is not None else RESULT_TTL
+
+
+class ResultStream:
+    """
+    单次上游响应的解析进度。后台任务边下载边解析，直到 MAX_RESULTS 条结果、错误信息或页面结束；
+    调用方只需等到自己要的那一页解析出来即可回复，其余部分继续在后台读取。
+    读取完成后整份结果写入 query_cache，后续翻页和相同查询都直接读缓存。
+    """
+
+    def __init__(self, query: str):
+        self.query = query
+        self.parser = NutrimaticParser(MAX_RESULTS)
+        self.complete = False
+        self.exception: Optional[BaseException] = None
+        self._progress = asyncio.Event()
+        self.task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        url = f"{NUTRIMATIC_URL}?q={quote(self.query, safe='')}"
+        parser = self.parser
+        try:
+            async with http_pool.get_session().get(url) as response:
+                decoder = codecs.getincrementaldecoder(response.charset or "utf-8")(errors="replace")
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    parser.feed(decoder.decode(chunk))
+                    self._progress.set()
+                    if parser.done:
+                        break
+                else:
+                    parser.feed(decoder.decode(b"", final=True))
+                    parser.close()
+            results, error = parser.outcome()
+            outcome = {"results": results, "error": error}
+            query_cache.set(self.query, outcome, result_ttl(outcome))
+        except Exception as e:
+            self.exception = e
+        finally:
+            self.complete = True
+            self._progress.set()
+            streams.pop(self.query, None)
+
+    async def wait_for(self, count: int) -> dict:
+        """等到至少 count 条结果（或出错、读取结束），返回当前已解析的内容"""
+        parser = self.parser
+        while len(parser.results) < count and parser.error is None and not self.complete:
+            self._progress.clear()
+            await self._progress.wait()
+        if self.exception is not None and len(parser.results) < count:
+            raise self.exception
+        results, error = parser.outcome()
+        return {"results": results, "error": error, "complete": self.complete}
+
+
+streams: Dict[str, ResultStream] = {}  # 正在读取的查询，相同查询共用一个上游请求
+
+
+async def query_nutrimatic(query: str, count: int = PAGE_SIZE) -> dict:
+    """
+    返回规范化查询的前 count 条（以上）结果：{"results": [...], "error": str | None, "complete": bool}。
+    优先读缓存；否则复用或发起流式请求，拿到 count 条即返回。
+    """
+    query = normalize_query(query)
+    outcome = query_cache.get(query)
+    if outcome is not None:
+        return {**outcome, "complete": True}
+    stream = streams.get(query)
+    query_cache.record_miss(coalesced=stream is not None)
+    if stream is None:
+        stream = streams[query] = ResultStream(query)
+    return await stream.wait_for(count)
+
+
+# ---------- 翻页游标 ----------
+# 群聊按群、私聊按用户记录 (规范化查询, 下一页起始位置)；结果本身在缓存 / 流里，游标只存位置
+CURSOR_TTL = 30 * 60
+MAX_CURSORS = 512
+cursors: "OrderedDict[str, tuple]" = OrderedDict()  # session -> (query, offset, updated_at)
+
+
+def cursor_key(event: Event) -> str:
+    group_id = getattr(event, "group_id", None)
+    return f"group_{group_id}" if group_id else f"user_{event.get_user_id()}"
+
+
+def save_cursor(key: str, query: str, offset: int):
+    cursors[key] = (query, offset, time.time())
+    cursors.move_to_end(key)
+    while len(cursors) > MAX_CURSORS:
+        cursors.popitem(last=False)
+
+
+async def result_page(key: str, query: str, offset: int) -> str:
+    """取 offset 开始的一页结果并推进游标，返回回复文本"""
+    outcome = await query_nutrimatic(query, offset + PAGE_SIZE + 1)
+    if outcome["error"] is not None:
+        cursors.pop(key, None)
+        return f"查询错误：{outcome['error']}"
+    results = outcome["results"]
+    page = results[offset:offset + PAGE_SIZE]
+    if not page:
+        cursors.pop(key, None)
+        return "未找到匹配结果" if offset == 0 else "没有更多结果了"
+
+    end = offset + len(page)
+    title = f"前{PAGE_SIZE}个匹配结果：" if offset == 0 else f"第{offset + 1}-{end}个匹配结果："
+    reply = title + "\n" + "\n".join(f"{i}. {res}" for i, res in enumerate(page, offset + 1))
+    if len(results) > end:
+        save_cursor(key, normalize_query(query), end)
+        reply += "\n发送“nutri下一页”查看更多"
+    else:
+        cursors.pop(key, None)
+    return reply
+
 
 @nutrimatics.handle()
-async def handle_nutrimatics(args: Message = CommandArg()):
+async def handle_nutrimatics(event: Event, args: Message = CommandArg()):
     query = args.extract_plain_text().strip()
     if not query:
         await nutrimatics.finish("请输入要查询的内容～")
         return  # 明确返回避免后续执行
     
-    url = f"https://nutrimatic.org/2024/?q={query}"
-    
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                html = await response.text()
-                
-                soup = BeautifulSoup(html, 'html.parser')
-                
-                # 错误检测
-                if error_tag := soup.find('font', color='red'):
-                    await nutrimatics.finish(f"查询错误：{error_tag.text.strip()}")
-                    return
-                
-                # 结果提取
-                results = [
-                    span.get_text(strip=True)
-                    for span in soup.find_all('span', style=lambda x: 'font-size' in x)
-                ][:20]
-                
-                if not results:
-                    await nutrimatics.finish("未找到匹配结果")
-                    return
-                    
-                reply = "前20个匹配结果：\n" + "\n".join(
-                    f"{i+1}. {res}" for i, res in enumerate(results)
-                )
-                await nutrimatics.finish(reply)
+        reply = await result_page(cursor_key(event), query, 0)
+        await nutrimatics.finish(reply)
 
     except FinishedException:  # 特殊处理完成异常
         raise  # 直接重新抛出
     except Exception as e:  # 其他异常正常处理
         await nutrimatics.finish(f"请求失败：{str(e)}")
 
+@nutri_next.handle()
+async def handle_nutri_next(event: Event):
+    key = cursor_key(event)
+    cursor = cursors.get(key)
+    if cursor is None or time.time() - cursor[2] > CURSOR_TTL:
+        cursors.pop(key, None)
+        await nutri_next.finish("没有可以翻页的查询，请先使用 nutri 查询～")
+        return
+
+    query, offset, _ = cursor
+    try:
+        reply = await result_page(key, query, offset)
+        await nutri_next.finish(reply)
+
+    except FinishedException:
+        raise
+    except Exception as e:
+        await nutri_next.finish(f"请求失败：{str(e)}")
+
 @a1z26.handle()
 async def handle_a1z26(args: Message = CommandArg()):
     input_str = args.extract_plain_text().strip()
     if not input_str:
-        await a1z26.finish("请输入数字序列～")
+        await a1z26.finish("请输入数字序列（解码）或字母（编码）～")
         return
 
-    parts = input_str.split()
-    numbers = []
-    
     try:
-        for part in parts:
-            # 检查是否为纯数字
-            if not part.isdigit():
-                await a1z26.finish(f"错误：'{part}' 不是有效数字")
-                return
-            
-            num = int(part)
-            # 检查数字范围
-            if not (1 <= num <= 26):
-                await a1z26.finish(f"错误：数字 {num} 超出 1-26 范围")
+        # 只有字母和空白时编码，否则按数字序列解码
+        if not any(c.isdigit() for c in input_str) and any(c.isalpha() for c in input_str):
+            result, invalid = codec.a1z26_encode(input_str)
+            if invalid:
+                await a1z26.finish("错误：以下字符无法编码：" + " ".join(f"'{c}'" for c in invalid))
                 return
-            
-            numbers.append(num)
-        
-        # 转换为字母（小写）
-        result = ''.join([chr(96 + num) for num in numbers])
-        await a1z26.finish(f"转换结果：{result}")
+            await a1z26.finish(f"编码结果：{result}")
+            return
+
+        decoded = codec.a1z26_decode(input_str)
+        if decoded.invalid:
+            # 一次列出所有无效片段
+            not_numbers = [t for t in decoded.invalid if not t.isdigit()]
+            out_of_range = [t for t in decoded.invalid if t.isdigit()]
+            errors = []
+            if not_numbers:
+                errors.append("不是有效数字：" + " ".join(f"'{t}'" for t in not_numbers))
+            if out_of_range:
+                errors.append("超出 1-26 范围：" + " ".join(out_of_range))
+            await a1z26.finish("错误：" + "；".join(errors))
+            return
+
+        await a1z26.finish(f"转换结果：{decoded.text}")
 
     except FinishedException:
         raise
     except Exception as e:
-        await a1z26.finish(f"处理异常：{str(e)}")
\ No newline at end of file
+        await a1z26.finish(f"处理异常：{str(e)}")
+
+@rot.handle()
+async def handle_rot(args: Message = CommandArg()):
+    input_str = args.extract_plain_text().strip()
+    if not input_str:
+        await rot.finish("用法：rot [位移] 文本；省略位移时列出全部 25 种结果")
+        return
+
+    shift, _, text = input_str.partition(" ")
+    if shift.lstrip("-").isdigit() and text.strip():
+        await rot.finish(f"ROT{int(shift) % 26}：{codec.caesar(text.strip(), int(shift))}")
+        return
+
+    lines = [f"{n:>2}. {codec.caesar(input_str, n)}" for n in range(1, 26)]
+    await rot.finish("\n".join(lines))
+
+@atbash_cmd.handle()
+async def handle_atbash(args: Message = CommandArg()):
+    input_str = args.extract_plain_text().strip()
+    if not input_str:
+        await atbash_cmd.finish("请输入要转换的文本～")
+        return
+    await atbash_cmd.finish(f"转换结果：{codec.atbash(input_str)}")
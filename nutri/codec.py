@@ -0,0 +1,94 @@
+"""谜题常用的字母编码：A1Z26、凯撒（ROT-N）、埃特巴什（Atbash），均基于预先构建的查找表。"""
+import re
+import string
+from functools import lru_cache
+from typing import List, NamedTuple, Tuple
+
+LOWER = string.ascii_lowercase
+UPPER = string.ascii_uppercase
+
+# 先用一次 translate 统一分隔符：单词分隔 -> "/"，片段分隔 -> 空格，之后只需 str.split
+_NORMALIZE_SEP = str.maketrans({"|": "/", ",": " ", "，": " ", ".": " ", "、": " ", "-": " "})
+
+# "1".."26" 以及补零的 "01".."09" -> 字母
+_DECODE = {str(i): c for i, c in enumerate(LOWER, 1)}
+_DECODE.update({f"{i:02d}": LOWER[i - 1] for i in range(1, 10)})
+
+
+class DecodeResult(NamedTuple):
+    text: str
+    invalid: List[str]  # 按出现顺序列出的无效片段（非数字或超出 1-26）
+
+
+_PAIRS = re.compile(r"\d\d")
+
+
+def _expand(tokens: List[str]) -> List[str]:
+    """把无分隔的补零数字串按两位拆开"""
+    expanded = []
+    for token in tokens:
+        if len(token) > 2 and token.isdigit() and len(token) % 2 == 0:
+            expanded.extend(_PAIRS.findall(token))
+        else:
+            expanded.append(token)
+    return expanded
+
+
+def a1z26_decode(text: str) -> DecodeResult:
+    """数字序列 -> 小写字母；数字用空格、-、逗号、句点分隔或两位一组连写，单词用 / 或 | 分隔，结果单词之间用空格隔开"""
+    words, invalid = [], []
+    lookup = _DECODE.get
+    for word in text.translate(_NORMALIZE_SEP).split("/"):
+        tokens = word.split()
+        if not tokens:
+            continue
+        try:
+            # 常见情况：每个片段都能直接查表
+            words.append("".join(map(_DECODE.__getitem__, tokens)))
+            continue
+        except KeyError:
+            pass
+        tokens = _expand(tokens)
+        letters = list(map(lookup, tokens))
+        if None in letters:
+            invalid.extend(t for t, c in zip(tokens, letters) if c is None)
+        else:
+            words.append("".join(letters))
+    return DecodeResult(" ".join(words), invalid)
+
+
+@lru_cache(maxsize=8)
+def _encode_table(sep: str) -> dict:
+    table = {ord(c): f"{i}{sep}" for i, c in enumerate(LOWER, 1)}
+    table.update({ord(c): f"{i}{sep}" for i, c in enumerate(UPPER, 1)})
+    return table
+
+
+def a1z26_encode(text: str, sep: str = " ", word_sep: str = " / ") -> Tuple[str, List[str]]:
+    """字母 -> 数字；返回 (编码结果, 无法编码的字符)"""
+    letters = set(LOWER + UPPER)
+    invalid = sorted({c for c in text if not c.isspace()} - letters)
+    if invalid:
+        return "", invalid
+    table = _encode_table(sep)
+    size = len(sep)
+    encoded = [word.translate(table)[:-size] if size else word.translate(table) for word in text.split()]
+    return word_sep.join(encoded), []
+
+
+@lru_cache(maxsize=32)
+def _caesar_table(shift: int) -> dict:
+    shift %= 26
+    return str.maketrans(LOWER + UPPER, LOWER[shift:] + LOWER[:shift] + UPPER[shift:] + UPPER[:shift])
+
+
+_ATBASH = str.maketrans(LOWER + UPPER, LOWER[::-1] + UPPER[::-1])
+
+
+def caesar(text: str, shift: int) -> str:
+    """ROT-N：字母循环后移 shift 位，保留大小写，非字母原样保留"""
+    return text.translate(_caesar_table(shift))
+
+
+def atbash(text: str) -> str:
+    return text.translate(_ATBASH)
@@ -0,0 +1,82 @@
+"""Nutrimatic 结果页的流式提取器：分块 feed，拿到足够的结果或错误信息即可停止读取。"""
+from html.parser import HTMLParser
+from typing import Iterable, List, Optional, Tuple
+
+
+class NutrimaticParser(HTMLParser):
+    def __init__(self, limit: int = 20):
+        super().__init__(convert_charrefs=True)
+        self.limit = limit
+        self.results: List[str] = []
+        self.error: Optional[str] = None
+        self._capture: Optional[str] = None  # 正在收集的标签名（span / font）
+        self._depth = 0
+        self._parts: List[str] = []  # 已完成的文本节点
+        self._text: List[str] = []  # 当前文本节点（可能跨多次 feed）
+
+    @property
+    def done(self) -> bool:
+        return self.error is not None or len(self.results) >= self.limit
+
+    def outcome(self) -> Tuple[List[str], Optional[str]]:
+        """与原先一致：页面出现错误信息时只报告错误"""
+        if self.error is not None:
+            return [], self.error
+        return self.results[:self.limit], None
+
+    def _end_text_node(self):
+        if self._text:
+            text = "".join(self._text)
+            self._parts.append(text.strip() if self._capture == "span" else text)
+            self._text = []
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if self._capture:
+            self._end_text_node()
+            if tag == self._capture:
+                self._depth += 1
+            return
+        if tag == "span":
+            style = dict(attrs).get("style") or ""
+            if "font-size" in style:
+                self._capture, self._depth = "span", 1
+        elif tag == "font" and dict(attrs).get("color") == "red":
+            self._capture, self._depth = "font", 1
+
+    def handle_endtag(self, tag):
+        if not self._capture:
+            return
+        self._end_text_node()
+        if tag != self._capture:
+            return
+        self._depth -= 1
+        if self._depth:
+            return
+        if self._capture == "span":
+            self.results.append("".join(self._parts))
+        else:
+            self.error = "".join(self._parts).strip()
+        self._capture = None
+        self._parts = []
+
+    def handle_data(self, data):
+        if self._capture and not self.done:
+            self._text.append(data)
+
+
+def parse_chunks(chunks: Iterable[str], limit: int = 20) -> Tuple[List[str], Optional[str]]:
+    """逐块解析，收集够 limit 条结果或遇到错误即停止；返回 (结果, 错误信息)，有错误时结果为空"""
+    parser = NutrimaticParser(limit)
+    for chunk in chunks:
+        parser.feed(chunk)
+        if parser.done:
+            break
+    else:
+        parser.close()
+    return parser.outcome()
+
+
+def parse_page(html: str, limit: int = 20) -> Tuple[List[str], Optional[str]]:
+    return parse_chunks((html,), limit)
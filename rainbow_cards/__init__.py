@@ -1,24 +1,28 @@
+import asyncio
 import json
-import random
 from pathlib import Path
 # Removed: from typing import Dict, Any, Optional, Tuple
 
-from nonebot import on_command
+from nonebot import on_command, require, get_driver
 from nonebot.log import logger
 from nonebot.matcher import Matcher
 from nonebot.params import CommandArg
+from nonebot.permission import SUPERUSER
 from nonebot.adapters.onebot.v11 import Message, MessageSegment, Bot, Event # Keep necessary imports
 from nonebot.rule import to_me # Import the rule for at_me
 
-# --- Try to import htmlrender ---
+from .deck import CardIndex, NoRepeatDrawer, validate_card_data
+from .render_cache import CardImageCache, cache_key, template_hash
+
+# --- Try to load the shared render pool (built on htmlrender) ---
 try:
-    from nonebot_plugin_htmlrender import html_to_pic
-except ImportError:
+    render_pool = require("render_pool")
+except Exception:
     logger.warning("Dependency 'nonebot-plugin-htmlrender' not found. Image generation will fail.")
     logger.warning("Please install it: pip install nonebot-plugin-htmlrender")
     logger.warning("Or: nb plugin install nonebot-plugin-htmlrender")
     logger.warning("And make sure playwright is installed: playwright install chromium")
-    html_to_pic = None # Set to None if import fails
+    render_pool = None # Set to None if loading fails
 
 # --- Plugin Metadata (Optional) ---
 __plugin_name__ = "彩虹卡 Rainbow Card"
@@ -28,6 +32,8 @@ __plugin_usage__ = """
 命令:
   /彩虹卡        -> 随机抽取一张彩虹卡
   /彩虹卡 [颜色] -> 抽取指定颜色的彩虹卡 (如: /彩虹卡 蓝色)
+  /彩虹卡 [颜色] 不重复 -> 抽完整个卡池之前不会抽到重复的卡
+  /彩虹卡 [颜色] 加权   -> 按卡片权重抽取
 
 可用颜色: 红色, 橙色, 黄色, 绿色, 蓝色, 靛色, 紫色
 
@@ -35,7 +41,8 @@ __plugin_usage__ = """
 """.strip()
 
 # --- Data Loading ---
-card_data = {} # Removed type hint Dict[str, Dict[str, Any]]
+card_index = CardIndex(()) # Immutable color index; (re)loads build a new one and swap this reference
+card_data_mtime = None # mtime_ns of card.json when it was last read
 data_file = Path(__file__).parent / "card.json"
 
 # Color mapping from Chinese to English used in JSON
@@ -51,6 +58,13 @@ COLOR_MAP = { # Removed type hint
 # Reverse map for display purposes if needed, or just use the input color
 COLOR_MAP_REVERSE = {v: k for k, v in COLOR_MAP.items()} # Removed type hint
 
+# Draw mode keywords accepted after the color; the default comes from RAINBOW_CARD_DRAW_MODE
+DRAW_MODES = {
+    "随机": "random",
+    "加权": "weighted",
+    "不重复": "no_repeat",
+}
+
 # Base CSS friendly color values (still useful for text contrast logic)
 HTML_COLORS = { # Removed type hint
     "red": "#E74C3C",
@@ -89,63 +103,44 @@ PATTERN_SIZES = {
 }
 
 
+def _read_card_index():
+    """Reads, validates and indexes card.json. Pure, so it can run in a worker thread."""
+    with open(data_file, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    errors = validate_card_data(data, HTML_COLORS)
+    if errors:
+        more = f" (+{len(errors) - 5} more)" if len(errors) > 5 else ""
+        raise ValueError("invalid card data: " + "; ".join(errors[:5]) + more)
+    return CardIndex.from_json(data, image_key=card_image_key)
+
 def load_card_data():
-    global card_data
+    global card_index, card_data_mtime
     if not data_file.exists():
         logger.error(f"Card data file not found: {data_file}")
-        card_data = {}
+        card_index = CardIndex(())
         return False
     try:
-        with open(data_file, "r", encoding="utf-8") as f:
-            card_data = json.load(f)
-        logger.info(f"Successfully loaded {len(card_data)} cards from {data_file}")
+        card_data_mtime = data_file.stat().st_mtime_ns
+        card_index = _read_card_index()
+        logger.info(f"Successfully loaded {len(card_index)} cards from {data_file}")
         return True
     except json.JSONDecodeError:
         logger.exception(f"Failed to parse JSON from {data_file}")
-        card_data = {}
+        card_index = CardIndex(())
         return False
     except Exception as e:
         logger.exception(f"An unexpected error occurred while loading {data_file}")
-        card_data = {}
+        card_index = CardIndex(())
         return False
 
-# Load data when the plugin loads
-load_card_data()
-
 # --- Command Definition ---
 # Apply the to_me() rule here to ensure commands only trigger when the bot is mentioned
 rainbow_card_matcher = on_command("彩虹卡", aliases={"rainbowcard"}, rule=to_me(), priority=10, block=True)
 
-# --- Helper Functions ---
-async def generate_card_image(card_info): # Removed type hints: card_info: Dict[str, Any], return Optional[bytes]
-    """Generates an image for the given card info using htmlrender with patterns."""
-    if not html_to_pic:
-        logger.error("htmlrender is not available. Cannot generate image.")
-        return None
-
-    color_en = card_info.get("color", "default") # Use 'default' if color missing
-    # Get the base color for text contrast decision
-    base_bg_color = HTML_COLORS.get(color_en, HTML_COLORS["default"])
-    # Get the full background style (color + pattern)
-    background_style = PATTERN_BACKGROUNDS.get(color_en, PATTERN_BACKGROUNDS["default"])
-    # Get background size if needed for the pattern
-    background_size_style = PATTERN_SIZES.get(color_en, "")
-    background_size_css = f"background-size: {background_size_style};" if background_size_style else ""
-
-
-    en_words = card_info.get("en_words", "").strip()
-    ch_words = card_info.get("ch_words", "").strip()
-
-    # Determine text color based on the *base* background color for better contrast
-    text_color = "#FFFFFF" # Default white
-    # Yellow and Orange are light enough to potentially need dark text
-    if color_en in ["yellow", "orange"]:
-         text_color = "#2C3E50" # Dark grey/blue
-
-    # Handle empty English words gracefully
-    en_html = f'<p class="en">{en_words}</p>' if en_words else ''
-
-    html_content = f"""
+# --- Render Template ---
+# The card page is pre-loaded into a shared render pool once; each draw only
+# updates the card's background, text color and words via CARD_UPDATE_JS.
+CARD_TEMPLATE_HTML = """
     <!DOCTYPE html>
     <html lang="en">
     <head>
@@ -153,19 +148,16 @@ async def generate_card_image(card_info): # Removed type hints: card_info: Dict[
         <meta name="viewport" content="width=device-width, initial-scale=1.0">
         <style>
             @import url('https://fonts.googleapis.com/css2?family=Noto+Sans+SC:wght@400;700&family=Roboto:wght@400;700&display=swap');
-            body {{
+            body {
                 margin: 0;
                 font-family: 'Roboto', 'Noto Sans SC', sans-serif;
                 display: flex;
                 justify-content: center;
                 align-items: center;
                 min-height: 250px; /* Ensure body is at least card height */
-            }}
-            .card {{
-                /* --- Use the combined background style --- */
-                background: {background_style};
-                {background_size_css} /* Add size if applicable */
-                color: {text_color};
+            }
+            .card {
+                /* background / background-size / color are set per card by CARD_UPDATE_JS */
                 width: 350px; /* Approx poker card aspect ratio, horizontal */
                 height: 250px;
                 border-radius: 15px;
@@ -179,140 +171,323 @@ async def generate_card_image(card_info): # Removed type hints: card_info: Dict[
                 overflow: hidden; /* Prevent text overflow */
                 box-sizing: border-box; /* Include padding in width/height */
                 position: relative; /* Needed for potential future overlays */
-            }}
+            }
             /* Add a subtle inner shadow for depth */
-            .card::before {{
+            .card::before {
                 content: '';
                 position: absolute;
                 top: 0; left: 0; right: 0; bottom: 0;
                 border-radius: 15px; /* Match parent */
                 box-shadow: inset 0 0 15px rgba(0,0,0,0.15);
                 pointer-events: none; /* Don't interfere with text selection */
-            }}
-            .ch {{
+            }
+            .ch {
                 font-size: 1.2em;
                 font-weight: bold;
                 margin-bottom: 15px; /* Space between CH and EN */
                 /* Add slight text shadow for readability over patterns */
                 text-shadow: 0 1px 2px rgba(0, 0, 0, 0.2);
-            }}
-            .en {{
+            }
+            .en {
                 font-size: 0.9em;
                 font-style: italic;
                 opacity: 0.95; /* Slightly less transparent */
                  /* Add slight text shadow */
                 text-shadow: 0 1px 2px rgba(0, 0, 0, 0.2);
-            }}
-             p {{
+            }
+             p {
                 margin: 5px 0; /* Adjust paragraph spacing */
                 z-index: 1; /* Ensure text is above pseudo-elements */
                 position: relative; /* Needed for z-index */
-            }}
+            }
         </style>
     </head>
     <body>
         <div class="card">
-            <p class="ch">{ch_words}</p>
-            {en_html}
+            <p class="ch"></p>
+            <p class="en"></p>
         </div>
     </body>
     </html>
     """
 
+CARD_UPDATE_JS = """
+(card) => {
+    const el = document.querySelector('.card');
+    el.style.background = card.background;
+    el.style.backgroundSize = card.backgroundSize;
+    el.style.color = card.textColor;
+    document.querySelector('.ch').textContent = card.ch;
+    const en = document.querySelector('.en');
+    en.textContent = card.en;
+    en.style.display = card.en ? '' : 'none'; // Handle empty English words gracefully
+}
+"""
+CARD_VIEWPORT = {"width": 350 + 2, "height": 250 + 2} # Add slight buffer for potential rendering edges
+
+card_page_pool = render_pool.get_pool("rainbow_cards", CARD_TEMPLATE_HTML, CARD_VIEWPORT) if render_pool else None
+
+# --- Render Cache ---
+# Rendered cards are cached by card id + a digest of (template, card render state):
+# an in-memory LRU in front of a PNG directory, so repeated draws never touch the browser.
+# The directory is versioned by template hash; see prerender_deck() for the manifest.
+plugin_config = get_driver().config
+TEMPLATE_HASH = template_hash(CARD_TEMPLATE_HTML, CARD_UPDATE_JS, CARD_VIEWPORT)
+card_image_cache = CardImageCache(
+    Path(getattr(plugin_config, "rainbow_card_cache_dir", Path(__file__).parent / "render_cache")) / f"v{TEMPLATE_HASH}",
+    capacity=int(getattr(plugin_config, "rainbow_card_cache_size", 128)),
+)
+DEFAULT_DRAW_MODE = str(getattr(plugin_config, "rainbow_card_draw_mode", "random"))
+# Seconds between card.json mtime checks for hot reload; 0 disables the watcher
+RELOAD_INTERVAL = float(getattr(plugin_config, "rainbow_card_reload_interval", 5))
+# Render the whole deck in the background at startup (RAINBOW_CARD_PRERENDER=true)
+PRERENDER_ON_STARTUP = str(getattr(plugin_config, "rainbow_card_prerender", False)).lower() in ("1", "true", "yes")
+
+# --- Helper Functions ---
+def card_render_state(card):
+    """Builds the CARD_UPDATE_JS argument (background pattern, text color, words) for a card."""
+    color_en = card.color
+    # Get the full background style (color + pattern)
+    background_style = PATTERN_BACKGROUNDS.get(color_en, PATTERN_BACKGROUNDS["default"])
+    # Get background size if needed for the pattern
+    background_size_style = PATTERN_SIZES.get(color_en, "")
+
+    # Determine text color based on the *base* background color for better contrast
+    text_color = "#FFFFFF" # Default white
+    # Yellow and Orange are light enough to potentially need dark text
+    if color_en in ["yellow", "orange"]:
+         text_color = "#2C3E50" # Dark grey/blue
+
+    return {
+        "background": background_style,
+        "backgroundSize": background_size_style,
+        "textColor": text_color,
+        "ch": card.ch_words,
+        "en": card.en_words,
+    }
+
+async def generate_card_image(card): # Removed type hints: card: Card, return Optional[bytes]
+    """Generates an image for the given card info on a pre-warmed render pool page."""
+    if not card_page_pool:
+        logger.error("htmlrender is not available. Cannot generate image.")
+        return None
+
     try:
-        # Define viewport for specific dimensions matching CSS
-        pic_bytes = await html_to_pic(
-            html=html_content,
-            viewport={"width": 350 + 2, "height": 250 + 2} # Add slight buffer for potential rendering edges
-        )
+        pic_bytes = await card_page_pool.render(CARD_UPDATE_JS, card_render_state(card), type="png", full_page=True)
         return pic_bytes
     except Exception as e:
         logger.exception("Failed to generate card image with htmlrender")
         return None
 
-def get_random_card(color=None): # Removed type hints: color: Optional[str], return Tuple[Optional[str], Optional[Dict[str, Any]]]
-    """Gets a random card, optionally filtered by color."""
-    if not card_data:
-        return None, None
+def card_image_key(card):
+    return card.image_key or cache_key(card.card_id, card_render_state(card), TEMPLATE_HASH)
+
+async def get_card_image(card):
+    """Returns the card image from cache, rendering (and caching) it on a miss."""
+    key = card_image_key(card)
+    pic_bytes = await card_image_cache.get(key)
+    if pic_bytes is None:
+        pic_bytes = await generate_card_image(card)
+        if pic_bytes:
+            await card_image_cache.put(key, pic_bytes)
+    return pic_bytes
 
-    valid_cards = []
+async def prerender_deck():
+    """
+    Renders every card whose cache entry is missing (new/edited card or new template),
+    in parallel over the render pool's bounded set of pages, then writes the manifest
+    of the versioned image directory. Returns (rendered, skipped, failed).
+    """
+    cards = card_index.all
+    if not card_page_pool:
+        return 0, 0, len(cards)
+
+    entries = {card.card_id: card_image_key(card) for card in cards}
+    missing = await card_image_cache.missing(entries.values())
+    todo = [card for card in cards if entries[card.card_id] in missing]
+
+    async def render_one(card):
+        pic_bytes = await generate_card_image(card)
+        if pic_bytes:
+            await card_image_cache.put(entries[card.card_id], pic_bytes)
+        return bool(pic_bytes)
+
+    results = await asyncio.gather(*(render_one(card) for card in todo))
+    rendered = sum(results)
+    failed = len(todo) - rendered
+    pruned = await card_image_cache.write_manifest(TEMPLATE_HASH, entries, prune=not failed)
+    logger.info(
+        f"Rainbow card pre-render: {rendered} rendered, {len(entries) - len(todo)} up to date, "
+        f"{failed} failed, {pruned} stale images removed"
+    )
+    return rendered, len(entries) - len(todo), failed
+
+async def reload_card_data():
+    """
+    Re-reads card.json off the event loop and swaps in the rebuilt index (and its
+    render cache keys) with a single assignment, so in-flight draws keep using the
+    deck they started with. An invalid file is logged and the current deck is kept.
+    """
+    global card_index, card_data_mtime
+    try:
+        mtime = data_file.stat().st_mtime_ns
+    except OSError:
+        logger.error(f"Card data file not found: {data_file}")
+        return False
+    card_data_mtime = mtime # Don't retry the same broken file on every poll
+    try:
+        new_index = await asyncio.get_running_loop().run_in_executor(None, _read_card_index)
+    except Exception as e:
+        logger.error(f"Failed to reload {data_file}, keeping the current deck: {e}")
+        return False
+    card_index = new_index
+    logger.info(f"Reloaded {len(new_index)} cards from {data_file}")
+    if PRERENDER_ON_STARTUP:
+        start_background_task(prerender_deck()) # Only new or edited cards get rendered
+    return True
+
+async def watch_card_data():
+    """Polls card.json's mtime and hot-reloads the deck when it changes."""
+    while True:
+        await asyncio.sleep(RELOAD_INTERVAL)
+        try:
+            mtime = data_file.stat().st_mtime_ns
+        except OSError:
+            continue
+        if mtime != card_data_mtime:
+            await reload_card_data()
+
+no_repeat_drawer = NoRepeatDrawer()
+
+def get_random_card(color=None, mode="random", user_id=None): # Removed type hints: color: Optional[str], return Optional[Card]
+    """
+    Gets a random card, optionally filtered by color (Chinese name).
+    mode: "random" (uniform), "weighted" (by card weight) or "no_repeat" (per user_id).
+    """
+    target_color_en = None
     if color:
         target_color_en = COLOR_MAP.get(color)
         if not target_color_en:
-            return None, None # Invalid color requested
-        for card_id, info in card_data.items():
-            # Use .get with a default to handle cards missing color key
-            if info.get("color", "default") == target_color_en:
-                valid_cards.append((card_id, info))
-    else:
-        valid_cards = list(card_data.items())
+            return None # Invalid color requested
 
-    if not valid_cards:
-        return None, None # No cards found (or no cards for that color)
+    index = card_index # One read of the global, so the whole draw uses the same index
+    if mode == "weighted":
+        return index.draw_weighted(target_color_en)
+    if mode == "no_repeat" and user_id is not None:
+        return no_repeat_drawer.draw(index, user_id, target_color_en)
+    return index.draw(target_color_en)
 
-    selected_id, selected_info = random.choice(valid_cards)
-    return selected_id, selected_info
+# Load data when the plugin loads
+load_card_data()
 
 # --- Command Handler ---
 @rainbow_card_matcher.handle()
 async def handle_rainbow_card(bot: Bot, event: Event, matcher: Matcher, arg: Message = CommandArg()): # Removed Bot, Event, Matcher hints (kept Message for CommandArg)
     # Reload data if it's empty (e.g., failed initial load)
-    if not card_data:
-        if not load_card_data():
+    if not card_index:
+        if not await reload_card_data():
             await matcher.finish("抱歉，彩虹卡数据加载失败，请检查日志或联系管理员。")
             return # Exit if loading fails again
 
-    requested_color = arg.extract_plain_text().strip()
     target_color_ch = None # User's requested color in Chinese
+    draw_mode = DEFAULT_DRAW_MODE
 
-    if requested_color:
-        if requested_color in COLOR_MAP:
-            target_color_ch = requested_color
+    for word in arg.extract_plain_text().split():
+        if word in DRAW_MODES:
+            draw_mode = DRAW_MODES[word]
+        elif word in COLOR_MAP:
+            target_color_ch = word
         else:
-            await matcher.finish(f"抱歉，没有找到名为 '{requested_color}' 的颜色。\n可用颜色：{', '.join(COLOR_MAP.keys())}")
+            await matcher.finish(f"抱歉，没有找到名为 '{word}' 的颜色。\n可用颜色：{', '.join(COLOR_MAP.keys())}")
             return
 
-    card_id, card_info = get_random_card(color=target_color_ch)
+    card = get_random_card(color=target_color_ch, mode=draw_mode, user_id=event.get_user_id())
 
-    if not card_info:
+    if not card:
         if target_color_ch:
             await matcher.finish(f"抱歉，没有找到 {target_color_ch} 的彩虹卡。")
         else:
             await matcher.finish("抱歉，卡池是空的！")
         return
 
-    # Generate the image
-    card_image_bytes = await generate_card_image(card_info)
+    # Generate the image (or reuse the cached one)
+    card_image_bytes = await get_card_image(card)
 
     # Prepare the explanation text
-    explanation = card_info.get("explain", "无解释信息。").strip()
+    explanation = card.explain or "无解释信息。"
     # Clean up double spaces often found in the explanation
     explanation = ' '.join(explanation.split())
 
 
     # Send the result
-    if card_image_bytes and html_to_pic:
+    if card_image_bytes and card_page_pool:
         # Send image and text together
         result_message = MessageSegment.image(card_image_bytes) + f"\n\n{explanation}"
         await matcher.send(result_message)
     else:
         # Fallback to text if image generation failed or htmlrender not available
-        en_words = card_info.get("en_words", "").strip()
-        ch_words = card_info.get("ch_words", "").strip()
-        color_name = COLOR_MAP_REVERSE.get(card_info.get('color', ''), card_info.get('color', '未知颜色'))
+        en_words = card.en_words
+        ch_words = card.ch_words
+        color_name = COLOR_MAP_REVERSE.get(card.color, card.color or '未知颜色')
         fallback_text = f"【{color_name}卡】\n{ch_words}"
         if en_words:
             fallback_text += f"\n\n{en_words}"
         fallback_text += f"\n\n解释：{explanation}"
-        if not html_to_pic:
+        if not card_page_pool:
            fallback_text += "\n\n(提示: 未安装 'nonebot-plugin-htmlrender' 或渲染失败，无法生成图片)"
         else:
            fallback_text += "\n\n(提示: 图片生成失败，请检查后台日志)"
 
         await matcher.send(fallback_text)
 
+prerender_matcher = on_command("彩虹卡预渲染", permission=SUPERUSER, priority=10, block=True)
+
+@prerender_matcher.handle()
+async def handle_prerender():
+    await prerender_matcher.send("开始预渲染彩虹卡……")
+    rendered, skipped, failed = await prerender_deck()
+    await prerender_matcher.finish(f"预渲染完成：新渲染 {rendered} 张，已是最新 {skipped} 张，失败 {failed} 张。")
+
+reload_matcher = on_command("彩虹卡重载", permission=SUPERUSER, priority=10, block=True)
+
+@reload_matcher.handle()
+async def handle_reload():
+    if await reload_card_data():
+        await reload_matcher.finish(f"彩虹卡已重新加载，共 {len(card_index)} 张。")
+    await reload_matcher.finish("重新加载失败，仍在使用当前卡池，请检查日志。")
+
+background_tasks = set() # Strong references, so running tasks aren't garbage-collected
+
+def start_background_task(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+@get_driver().on_startup
+async def _start_background_tasks():
+    if PRERENDER_ON_STARTUP and card_index:
+        start_background_task(prerender_deck())
+    if RELOAD_INTERVAL > 0:
+        start_background_task(watch_card_data())
+
+@get_driver().on_shutdown
+async def _stop_background_tasks():
+    for task in list(background_tasks):
+        task.cancel()
+
+cache_stats_matcher = on_command("彩虹卡缓存", permission=SUPERUSER, priority=10, block=True)
+
+@cache_stats_matcher.handle()
+async def handle_cache_stats():
+    stats = card_image_cache.stats()
+    await cache_stats_matcher.finish(
+        f"彩虹卡图片缓存：内存命中 {stats['memory_hits']}，磁盘命中 {stats['disk_hits']}，"
+        f"未命中 {stats['misses']}，命中率 {stats['hit_ratio']:.1%}，内存中 {stats['memory_entries']} 张"
+    )
+
 # --- Optional: Log successful load ---
-if card_data:
+if card_index:
     logger.info("Rainbow Card plugin loaded successfully with patterns.")
 else:
     logger.warning("Rainbow Card plugin loaded, but data is empty or failed to load.")
\ No newline at end of file
@@ -0,0 +1,135 @@
+"""
+Immutable, color-indexed view of card.json.
+
+``CardIndex`` is built once per load: one tuple of ``Card`` records per color plus
+an all-cards tuple, and cumulative weights for weighted draws. A plain draw is a
+single ``random.choice`` on a prebuilt tuple; nothing is allocated per call.
+
+An index is never mutated after construction, so reloading the deck means
+building a new index (off the event loop) and swapping one reference.
+"""
+import random
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class Card:
+    """One rainbow card; words are stripped once at load time."""
+
+    __slots__ = ("card_id", "color", "en_words", "ch_words", "explain", "weight", "image_key")
+
+    def __init__(self, card_id, color, en_words, ch_words, explain, weight=1.0):
+        self.card_id = card_id
+        self.color = color
+        self.en_words = en_words
+        self.ch_words = ch_words
+        self.explain = explain
+        self.weight = weight
+        self.image_key = None # Render cache key, filled in when the index is built
+
+    @classmethod
+    def from_json(cls, card_id, info):
+        return cls(
+            card_id=card_id,
+            color=info.get("color", "default"), # Use 'default' if color missing
+            en_words=info.get("en_words", "").strip(),
+            ch_words=info.get("ch_words", "").strip(),
+            explain=info.get("explain", "").strip(),
+            weight=float(info.get("weight", 1.0)), # Optional per-card weight for weighted draws
+        )
+
+
+class CardIndex:
+    """All cards plus per-color tuples, with cumulative weights for each tuple."""
+
+    __slots__ = ("all", "by_color", "_cum_weights")
+
+    def __init__(self, cards):
+        self.all: Tuple[Card, ...] = tuple(cards)
+        by_color: Dict[str, List[Card]] = {}
+        for card in self.all:
+            by_color.setdefault(card.color, []).append(card)
+        self.by_color: Dict[str, Tuple[Card, ...]] = {color: tuple(cards) for color, cards in by_color.items()}
+        self._cum_weights = {color: tuple(accumulate(c.weight for c in cards)) for color, cards in self.by_color.items()}
+        self._cum_weights[None] = tuple(accumulate(c.weight for c in self.all))
+
+    @classmethod
+    def from_json(cls, data, image_key: Optional[Callable[[Card], str]] = None):
+        cards = [Card.from_json(card_id, info) for card_id, info in data.items()]
+        if image_key:
+            for card in cards:
+                card.image_key = image_key(card)
+        return cls(cards)
+
+    def __len__(self):
+        return len(self.all)
+
+    def pool(self, color: Optional[str] = None) -> Tuple[Card, ...]:
+        """Cards of one color (English key), or every card when color is None."""
+        if color is None:
+            return self.all
+        return self.by_color.get(color, ())
+
+    def draw(self, color: Optional[str] = None) -> Optional[Card]:
+        cards = self.pool(color)
+        return random.choice(cards) if cards else None
+
+    def draw_weighted(self, color: Optional[str] = None) -> Optional[Card]:
+        cards = self.pool(color)
+        if not cards:
+            return None
+        cum = self._cum_weights[color] if color is not None else self._cum_weights[None]
+        if cum[-1] <= 0:
+            return random.choice(cards)
+        return cards[bisect_right(cum, random.random() * cum[-1])]
+
+
+def validate_card_data(data, known_colors) -> List[str]:
+    """Returns a list of problems with parsed card.json content (empty when valid)."""
+    if not isinstance(data, dict):
+        return ["top level must be an object of card_id -> card"]
+    if not data:
+        return ["deck is empty"]
+    errors = []
+    for card_id, info in data.items():
+        if not isinstance(info, dict):
+            errors.append(f"{card_id}: card must be an object")
+            continue
+        for field in ("ch_words", "en_words", "explain", "color"):
+            if field in info and not isinstance(info[field], str):
+                errors.append(f"{card_id}: '{field}' must be a string")
+        if not str(info.get("ch_words", "")).strip():
+            errors.append(f"{card_id}: missing 'ch_words'")
+        if info.get("color", "default") not in known_colors:
+            errors.append(f"{card_id}: unknown color {info.get('color')!r}")
+        weight = info.get("weight", 1)
+        if not isinstance(weight, (int, float)) or weight < 0:
+            errors.append(f"{card_id}: 'weight' must be a non-negative number")
+    return errors
+
+
+class NoRepeatDrawer:
+    """
+    Per-user shuffled decks: each (user, color) walks a random permutation of the
+    pool and only sees a repeat after every card has been drawn once.
+    Decks are dropped automatically when a new index is loaded.
+    """
+
+    def __init__(self):
+        self._index: Optional[CardIndex] = None
+        self._decks: Dict[Tuple[str, Optional[str]], List[int]] = {}
+
+    def draw(self, index: CardIndex, user_id: str, color: Optional[str] = None) -> Optional[Card]:
+        cards = index.pool(color)
+        if not cards:
+            return None
+        if index is not self._index:
+            self._index = index
+            self._decks.clear()
+        deck = self._decks.get((user_id, color))
+        if not deck:
+            deck = list(range(len(cards)))
+            random.shuffle(deck)
+            self._decks[(user_id, color)] = deck
+        return cards[deck.pop()]
@@ -0,0 +1,135 @@
+"""
+Content-addressed cache for rendered rainbow card images.
+
+Keys are ``<card_id>-<digest>``, where the digest covers the render template
+hash plus the card's render state (background, colors, words), so editing a
+card or the template naturally produces a new key. Images live in an in-memory
+LRU in front of an on-disk PNG store; disk I/O runs in a worker thread.
+
+The on-disk store is versioned: one ``v<template hash>`` directory per template,
+holding the PNGs plus a ``manifest.json`` written by the deck pre-render.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+
+def template_hash(*parts) -> str:
+    """Hash of everything that affects how a card is drawn besides the card itself."""
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(json.dumps(part, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+def cache_key(card_id: str, render_state: dict, template_digest: str) -> str:
+    payload = json.dumps(render_state, sort_keys=True, ensure_ascii=False)
+    digest = hashlib.sha1(f"{template_digest}\0{payload}".encode("utf-8")).hexdigest()[:16]
+    return f"{card_id}-{digest}"
+
+
+class CardImageCache:
+    """In-memory LRU of PNG bytes backed by a directory of ``<key>.png`` files."""
+
+    def __init__(self, directory: Path, capacity: int = 128):
+        self.directory = directory
+        self.capacity = max(1, capacity)
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.png"
+
+    def _remember(self, key: str, data: bytes):
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.capacity:
+            self._memory.popitem(last=False)
+
+    def _read(self, key: str) -> Optional[bytes]:
+        try:
+            return self._path(key).read_bytes()
+        except OSError:
+            return None
+
+    def _write(self, key: str, data: bytes):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = self._path(key).with_suffix(".tmp")
+        tmp.write_bytes(data)
+        tmp.replace(self._path(key))
+
+    async def get(self, key: str) -> Optional[bytes]:
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return data
+        data = await asyncio.get_running_loop().run_in_executor(None, self._read, key)
+        if data is not None:
+            self.disk_hits += 1
+            self._remember(key, data)
+            return data
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, data: bytes):
+        self._remember(key, data)
+        await asyncio.get_running_loop().run_in_executor(None, self._write, key, data)
+
+    def _stored_keys(self) -> set:
+        return {path.stem for path in self.directory.glob("*.png")}
+
+    async def missing(self, keys) -> set:
+        """Keys with no cached image; the directory is listed once, in a worker thread."""
+        keys = {key for key in keys if key not in self._memory}
+        if not keys:
+            return keys
+        stored = await asyncio.get_running_loop().run_in_executor(None, self._stored_keys)
+        return keys - stored
+
+    def _write_manifest(self, manifest: dict):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = self.directory / "manifest.json.tmp"
+        tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+        tmp.replace(self.directory / "manifest.json")
+
+    def _prune(self, keep: set) -> int:
+        removed = 0
+        for path in self.directory.glob("*.png"):
+            if path.stem not in keep:
+                path.unlink(missing_ok=True)
+                removed += 1
+        return removed
+
+    async def write_manifest(self, template_digest: str, entries: Dict[str, str], prune: bool = True) -> int:
+        """
+        Records ``card_id -> key`` for the whole deck in ``manifest.json`` and, if
+        ``prune`` is set, deletes PNGs in this version directory that no card maps to.
+        Returns the number of pruned files.
+        """
+        manifest = {
+            "template_hash": template_digest,
+            "generated_at": int(time.time()),
+            "cards": {card_id: f"{key}.png" for card_id, key in entries.items()},
+        }
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._write_manifest, manifest)
+        if not prune:
+            return 0
+        return await loop.run_in_executor(None, self._prune, set(entries.values()))
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+        }
@@ -0,0 +1,195 @@
+"""
+共享的 Playwright 页面池，供 hequn（htmlrender 回退路径）和 rainbow_cards 使用。
+
+每个池预先打开 N 个固定视口的页面，并提前载入基础 HTML/CSS；渲染时只执行一段脚本
+更新动态 DOM（棋盘格子、卡面文字）再截图，不再为每次渲染新开页面。
+池大小同时也是并发上限，超出的请求排队等待；页面崩溃、被关闭或浏览器断开时
+会在下次取用前丢弃并重建。
+
+其他插件通过 ``require("render_pool")`` 获取本模块后调用 ``get_pool``。
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Set
+
+from nonebot import get_driver, on_command, require
+from nonebot.log import logger
+from nonebot.permission import SUPERUSER
+
+require("nonebot_plugin_htmlrender")
+from nonebot_plugin_htmlrender import get_browser
+
+plugin_config = get_driver().config
+POOL_SIZE = int(getattr(plugin_config, "render_pool_size", 2))
+
+pools: Dict[str, "PagePool"] = {}
+_warm_tasks: Set[asyncio.Task] = set()  # 持有预热任务的引用，避免运行中被回收
+
+
+class PagePool:
+    """固定数量的预热页面；取用时做健康检查，渲染出错的页面直接回收重建"""
+
+    def __init__(self, name: str, base_html: str, viewport: Dict[str, int],
+                 size: int = POOL_SIZE, device_scale_factor: float = 2):
+        self.name = name
+        self.base_html = base_html
+        self.viewport = viewport
+        self.size = max(1, size)
+        self.device_scale_factor = device_scale_factor
+        self._idle: List[Any] = []
+        self._crashed = set()
+        self._semaphore = asyncio.Semaphore(self.size)
+        # 指标
+        self.in_use = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.renders = 0
+        self.failures = 0
+        self.recycled = 0
+        self.wait_time = 0.0
+
+    async def _new_page(self):
+        browser = await get_browser()
+        page = await browser.new_page(viewport=self.viewport, device_scale_factor=self.device_scale_factor)
+        page.on("crash", lambda p: self._crashed.add(id(p)))
+        await page.set_content(self.base_html)
+        return page
+
+    def _healthy(self, page) -> bool:
+        return (
+            id(page) not in self._crashed
+            and not page.is_closed()
+            and page.context.browser is not None
+            and page.context.browser.is_connected()
+        )
+
+    async def _discard(self, page):
+        self._crashed.discard(id(page))
+        self.recycled += 1
+        try:
+            if not page.is_closed():
+                await page.close()
+        except Exception:
+            pass
+
+    async def warm(self):
+        """预先创建满额页面"""
+        while len(self._idle) + self.in_use < self.size:
+            try:
+                self._idle.append(await self._new_page())
+            except Exception:
+                logger.exception(f"Render pool '{self.name}' failed to warm up")
+                return
+
+    @asynccontextmanager
+    async def page(self):
+        """取出一个健康的页面，用完归还；出错的页面会被回收"""
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        start = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.wait_time += time.perf_counter() - start
+        self.in_use += 1
+        page = None
+        try:
+            while self._idle:
+                candidate = self._idle.pop()
+                if self._healthy(candidate):
+                    page = candidate
+                    break
+                await self._discard(candidate)
+            if page is None:
+                page = await self._new_page()
+            try:
+                yield page
+            except Exception:
+                self.failures += 1
+                await self._discard(page)
+                page = None
+                raise
+        finally:
+            if page is not None:
+                if self._healthy(page):
+                    self._idle.append(page)
+                else:
+                    await self._discard(page)
+            self.in_use -= 1
+            self._semaphore.release()
+
+    async def render(self, update_js: str, state: Any, **screenshot_kwargs) -> bytes:
+        """在预热页面上执行 update_js(state) 更新 DOM 后截图"""
+        async with self.page() as page:
+            await page.evaluate(update_js, state)
+            img_bytes = await page.screenshot(**screenshot_kwargs)
+        self.renders += 1
+        return img_bytes
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for page in idle:
+            try:
+                await page.close()
+            except Exception:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "idle": len(self._idle),
+            "in_use": self.in_use,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "renders": self.renders,
+            "failures": self.failures,
+            "recycled": self.recycled,
+            "avg_wait_ms": self.wait_time / max(1, self.renders + self.failures) * 1000,
+        }
+
+
+def get_pool(name: str, base_html: str, viewport: Dict[str, int],
+             size: Optional[int] = None, device_scale_factor: float = 2) -> PagePool:
+    """按名称获取（或创建）共享页面池，启动后会自动预热"""
+    if name not in pools:
+        pools[name] = PagePool(name, base_html, viewport, size or POOL_SIZE, device_scale_factor)
+    return pools[name]
+
+
+driver = get_driver()
+
+
+@driver.on_startup
+async def _warm_pools():
+    for pool in list(pools.values()):
+        task = asyncio.create_task(pool.warm())
+        _warm_tasks.add(task)
+        task.add_done_callback(_warm_tasks.discard)
+
+
+@driver.on_shutdown
+async def _close_pools():
+    for task in list(_warm_tasks):
+        task.cancel()
+    for pool in pools.values():
+        await pool.close()
+
+
+pool_status = on_command("渲染池状态", permission=SUPERUSER, priority=5, block=True)
+
+
+@pool_status.handle()
+async def handle_pool_status():
+    if not pools:
+        await pool_status.finish("当前没有渲染池。")
+    lines = []
+    for name, pool in pools.items():
+        s = pool.stats()
+        lines.append(
+            f"[{name}] 页面 {s['in_use']}/{s['size']} 使用中, 空闲 {s['idle']}, "
+            f"排队 {s['waiting']} (峰值 {s['max_waiting']}), 平均等待 {s['avg_wait_ms']:.1f}ms\n"
+            f"  渲染 {s['renders']} 次, 失败 {s['failures']} 次, 回收页面 {s['recycled']} 个"
+        )
+    await pool_status.finish("\n".join(lines))